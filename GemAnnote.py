@@ -1,11 +1,32 @@
 import os
+import sys
+import types
 import json
+import argparse
+import shutil
+import hashlib
+import uuid
+import sqlite3
 import time
+import random
+import queue
+import atexit
+import logging
+import mimetypes
+import io
+import tarfile
+import contextlib
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import typing_extensions as typing
 from pathlib import Path
 import google.generativeai as genai
+from google.generativeai.client import _ClientManager
 from google.api_core import exceptions
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from datetime import datetime
 import cv2
 import numpy as np
@@ -21,6 +42,27 @@ API_KEYS = [
 
 
 MODEL_NAME = "gemini-3-flash-preview"
+# GeminiKeyClient uses private google-generativeai internals; this is the version they were checked against
+GENAI_TESTED_VERSION = "0.8.6"
+
+# Local caches (frame manifests live next to the frames; everything else goes here)
+CACHE_DIR = Path(os.getenv("GEMANNOTE_CACHE_DIR", ".gemannote_cache"))
+
+# Uploaded videos are kept on Gemini and reused across regenerations and restarts.
+# Gemini expires files after 48h; entries are dropped a safety margin before that.
+REMOTE_FILE_TTL_S = 46 * 60 * 60
+REMOTE_FILE_MAX_ENTRIES = 20
+
+# Uploads are named "<REMOTE_FILE_TAG><file name>" so a sweep can tell this tool's files apart.
+# Deletes run on background GC threads with retries; on startup every key is swept for tagged
+# files that FAILED processing. The `sweep` command also deletes tagged files older than
+# ORPHAN_MIN_AGE_S that no cache entry references (left by crashes or closed tabs); it is not
+# run on startup because other machines' caches may reference files this one doesn't know about.
+REMOTE_FILE_TAG = "gemannote:"
+GC_WORKERS = 4
+GC_MAX_ATTEMPTS = 5
+GC_DRAIN_TIMEOUT_S = 30
+ORPHAN_MIN_AGE_S = 60 * 60
 
 SCAM_CRITERIA_TEXT = """
 1. Commit Crime: Claims to commit a crime (e.g., hacking) for the user.
@@ -33,526 +75,3435 @@ SCAM_CRITERIA_TEXT = """
 8. Generator Scams: Promises free gift cards while using generator tools.
 """
 
+# Per-key quotas for the key pool scheduler (requests and tokens per minute, per API key)
+KEY_RPM = int(os.getenv("GEMINI_KEY_RPM", "10"))
+KEY_TPM = int(os.getenv("GEMINI_KEY_TPM", "250000"))
+# Token estimate charged up front for one generate_content call; corrected from usage_metadata
+REQUEST_TOKEN_ESTIMATE = 20000
+# A key that returns 429 sits out KEY_COOLDOWN_S, doubling per consecutive 429 up to the max
+KEY_COOLDOWN_S = 15
+KEY_COOLDOWN_MAX_S = 300
+# Every generate_content call has a deadline. With hedging on, a call that hasn't answered
+# after the HEDGE_PERCENTILE-th percentile of recent generate times (HEDGE_INITIAL_DELAY_S
+# or half the timeout, until HEDGE_MIN_SAMPLES are in) gets a duplicate, and the first answer wins. Only ~5% of
+# calls are hedged, and only when a key has quota right away.
+GENERATE_TIMEOUT_S = float(os.getenv("GEMANNOTE_GENERATE_TIMEOUT", "120"))
+HEDGE_REQUESTS = os.getenv("GEMANNOTE_HEDGE", "1") != "0"
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY_S = 5.0
+HEDGE_INITIAL_DELAY_S = 30.0
+
+# Accepted annotations are appended to <output>.journal.jsonl and folded into the
+# output JSON by compaction (on Load Data, from the sidebar, or after this many appends)
+JOURNAL_COMPACT_EVERY = 500
+
+# Several annotators can share one output file: a SQLite work queue next to it
+# (<output>.queue.sqlite3) leases each video to one annotator at a time and records completions.
+# A lease not renewed (by the session rerunning) for LEASE_TTL_S goes back to the pool.
+# Lease holders are "<annotator>@<id in CACHE_DIR/HOLDER_ID_NAME>", stable across restarts.
+LEASE_TTL_S = 30 * 60
+HOLDER_ID_NAME = "holder_id"
+DEFAULT_ANNOTATOR = os.getenv("GEMANNOTE_ANNOTATOR") or os.getenv("USERNAME") or os.getenv("USER") or "annotator"
+
+# Background prefetch: upload + generate + extract for the next N videos while annotating
+PREFETCH_AHEAD = 3
+PREFETCH_WORKERS = 2
+
+# Generated reasoning is cached on disk by (input content, prompt, model, generation config);
+# least recently used responses are evicted once the cache grows past this size
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("GEMANNOTE_RESPONSE_CACHE_MB", "64")) * 1024 * 1024
+
+# Stage timings and counters: a per-video JSONL log and a Prometheus textfile export
+# (point GEMANNOTE_METRICS_PROM at node_exporter's textfile directory to scrape it)
+METRICS_LOG_NAME = "metrics.jsonl"
+METRICS_PROM_PATH = os.getenv("GEMANNOTE_METRICS_PROM")
+METRICS_WINDOW = 1000
+
+# === STATUS OUTPUT ===
+
+logger = logging.getLogger("GemAnnote")
+
+class _NullElement:
+    """Stands in for st.progress/st.empty placeholders when there is no page to draw on"""
+    
+    def progress(self, *args, **kwargs):
+        return self
+    
+    def text(self, *args, **kwargs):
+        return self
+    
+    def empty(self):
+        return self
+
+class ConsoleStatus:
+    """
+    Same surface as the st.* status calls used by the pipeline, sent to logging instead.
+    Used from worker threads and the command line, where there is no Streamlit page.
+    """
+    
+    def info(self, message):
+        logger.info(message)
+    
+    def success(self, message):
+        logger.info(message)
+    
+    def warning(self, message):
+        logger.warning(message)
+    
+    def error(self, message):
+        logger.error(message)
+    
+    def spinner(self, text=""):
+        logger.info(text)
+        return contextlib.nullcontext()
+    
+    def progress(self, *args, **kwargs):
+        return _NullElement()
+    
+    def empty(self):
+        return _NullElement()
+
+_console_status = ConsoleStatus()
+
+def status_sink():
+    """st itself inside a Streamlit script run, ConsoleStatus everywhere else (workers, CLI)"""
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        return st
+    return _console_status
+
+# === SHARED RESOURCES ===
+
+# `streamlit run` executes this file again on every rerun, which would rebuild module-level
+# objects (key pool quotas, caches, thread pools, metrics) each time. process_resource keeps
+# one instance per process in a registry stored on a module in sys.modules, which survives
+# reruns. Script runs and worker threads (prefetch, GC, generate pool) without a
+# ScriptRunContext therefore get the same objects.
+_RESOURCE_REGISTRY = "_gemannote_resources"
+
+def _resource_registry():
+    registry = sys.modules.get(_RESOURCE_REGISTRY)
+    if registry is None:
+        registry = types.ModuleType(_RESOURCE_REGISTRY)
+        registry.lock = threading.RLock()
+        registry.resources = {}
+        # setdefault: a concurrent first call keeps whichever registry landed first
+        registry = sys.modules.setdefault(_RESOURCE_REGISTRY, registry)
+    return registry
+
+def clear_process_resources(prefix=""):
+    """
+    Drop the resources whose name starts with prefix (all by default) so the next use rebuilds
+    them, closing each one: close() if it has one, else shutdown(wait=False) (thread pools).
+    Returns the dropped names.
+    """
+    registry = _resource_registry()
+    with registry.lock:
+        names = [name for name in registry.resources if name.startswith(prefix)]
+        dropped = [(name, registry.resources.pop(name)) for name in names]
+    for name, resource in dropped:
+        try:
+            if hasattr(resource, "close"):
+                resource.close()
+            elif hasattr(resource, "shutdown"):
+                resource.shutdown(wait=False)
+        except Exception as e:
+            logger.warning(f"Could not close shared resource {name}: {e}")
+    return names
+
+def process_resource(name, factory):
+    """factory() built once per process and shared by every session and thread; name identifies it"""
+    registry = _resource_registry()
+    with registry.lock:
+        if name not in registry.resources:
+            registry.resources[name] = factory()
+        return registry.resources[name]
+
+# === METRICS ===
+
+class Metrics:
+    """
+    Thread-safe stage timers and event counters.
+    Each stage keeps its last METRICS_WINDOW durations for p50/p95 plus a running count/sum.
+    Inside a video() block, stages and events are also collected for that video and written
+    as one line to the metrics log when the block exits, followed by a Prometheus export.
+    """
+    
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}  # stage -> deque of seconds
+        self._totals = {}  # stage -> [count, sum]
+        self._counters = {}
+        self._current = contextvars.ContextVar("metrics_video", default=None)
+    
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            totals = self._totals.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+        record = self._current.get()
+        if record is not None:
+            record["stages"][stage] = round(record["stages"].get(stage, 0.0) + seconds, 3)
+    
+    def incr(self, event, n=1):
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + n
+        record = self._current.get()
+        if record is not None:
+            record["events"][event] = record["events"].get(event, 0) + n
+    
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+    
+    @contextlib.contextmanager
+    def video(self, video_id, phase):
+        """Attribute stages/events in this block (on this thread) to video_id and log them on exit"""
+        record = {"video_id": video_id, "phase": phase, "stages": {}, "events": {}, "last_key": None}
+        token = self._current.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self._current.reset(token)
+            record["total_s"] = round(time.perf_counter() - start, 3)
+            self._flush(record)
+    
+    def note_key(self, key_index):
+        """Count a key switch when this video's requests move to a different API key"""
+        record = self._current.get()
+        if record is None:
+            return
+        if record["last_key"] is not None and record["last_key"] != key_index:
+            self.incr("key_switches")
+        record["last_key"] = key_index
+    
+    def percentiles(self):
+        """{stage: {"p50", "p95", "count"}} over the recent window"""
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+            totals = {stage: list(values) for stage, values in self._totals.items()}
+        result = {}
+        for stage, values in sorted(samples.items()):
+            p50, p95 = np.percentile(values, [50, 95])
+            result[stage] = {"p50": float(p50), "p95": float(p95), "count": totals[stage][0]}
+        return result
+    
+    def quantile(self, stage, q, min_samples=1):
+        """q-th percentile of the stage's recent durations, or None with fewer than min_samples"""
+        with self._lock:
+            values = list(self._samples.get(stage, ()))
+        if len(values) < min_samples:
+            return None
+        return float(np.percentile(values, q))
+    
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+    
+    def _flush(self, record):
+        line = {
+            "video_id": record["video_id"],
+            "phase": record["phase"],
+            "total_s": record["total_s"],
+            "stages": record["stages"],
+            "events": record["events"],
+            "time": datetime.now().isoformat(timespec="seconds"),
+        }
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            with open(CACHE_DIR / METRICS_LOG_NAME, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(line) + "\n")
+            self.write_prometheus()
+        except OSError as e:
+            logger.warning(f"Could not write metrics: {e}")
+    
+    def write_prometheus(self, path=None):
+        """Write all stages and counters in Prometheus textfile format (temp file + rename)"""
+        path = Path(path or METRICS_PROM_PATH or CACHE_DIR / "gemannote.prom")
+        with self._lock:
+            totals = {stage: list(values) for stage, values in self._totals.items()}
+            counters = dict(self._counters)
+        percentiles = self.percentiles()
+        
+        lines = [
+            "# HELP gemannote_stage_seconds Time spent in each pipeline stage",
+            "# TYPE gemannote_stage_seconds summary",
+        ]
+        for stage, (count, total) in sorted(totals.items()):
+            for quantile, name in (("0.5", "p50"), ("0.95", "p95")):
+                lines.append(f'gemannote_stage_seconds{{stage="{stage}",quantile="{quantile}"}} '
+                             f'{percentiles[stage][name]:.6f}')
+            lines.append(f'gemannote_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'gemannote_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines += [
+            "# HELP gemannote_events_total Retries, rate limits, key switches and cache hits",
+            "# TYPE gemannote_events_total counter",
+        ]
+        for event, count in sorted(counters.items()):
+            lines.append(f'gemannote_events_total{{event="{event}"}} {count}')
+        
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+metrics = process_resource("metrics", Metrics)
+
 # === VIDEO FRAME EXTRACTION FUNCTIONS ===
 
-def extract_frames_1fps(video_path, output_dir, video_id):
+FRAME_SAMPLE_FPS = 1.0
+# Gaps longer than this (in seconds of video time) are skipped with a seek instead of grab()
+SEEK_MIN_GAP_S = 5.0
+DEFAULT_FPS = 30.0
+
+# name: (extension, cv2 imwrite flag, default value, (min, max))
+# For PNG the value is the zlib compression level, for JPEG/WebP it is the quality.
+FRAME_FORMATS = {
+    "PNG": (".png", cv2.IMWRITE_PNG_COMPRESSION, 1, (0, 9)),
+    "JPEG": (".jpg", cv2.IMWRITE_JPEG_QUALITY, 90, (1, 100)),
+    "WebP": (".webp", cv2.IMWRITE_WEBP_QUALITY, 90, (1, 100)),
+}
+DEFAULT_FRAME_FORMAT = "PNG"
+
+def probe_video(cap):
+    """
+    Read fps, frame count and duration from an open capture.
+    Containers often report a bogus CAP_PROP_FRAME_COUNT (0, negative or wildly large),
+    so frame_count and duration are None when they can't be trusted.
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or fps <= 0 or fps > 1000:
+        fps = DEFAULT_FPS
+    
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if frame_count <= 0 or frame_count > fps * 60 * 60 * 24:
+        frame_count = None
+    
+    duration = frame_count / fps if frame_count else None
+    return fps, frame_count, duration
+
+def _sample_grid(interval):
+    next_ts = 0.0
+    while True:
+        yield next_ts
+        next_ts += interval
+
+def iter_sampled_frames(video_path, sample_fps=FRAME_SAMPLE_FPS, progress_callback=None, timestamps=None):
+    """
+    Yield (timestamp_seconds, frame) pairs, one every 1/sample_fps seconds of video time,
+    or one at (the first frame at or after) each of the sorted timestamps if given.
+    Frames in between are only grab()bed, never retrieve()d (no BGR conversion or copy),
+    and gaps longer than SEEK_MIN_GAP_S are skipped with a timestamp seek.
+    Sampling follows real timestamps, so 29.97/23.976 fps sources don't drift.
+    Raises IOError if the video can't be opened.
+    """
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise IOError(f"Failed to open video: {video_path}")
+    
+    try:
+        fps, frame_count, duration = probe_video(cap)
+        if timestamps is None:
+            interval = 1.0 / sample_fps
+            can_seek = interval >= SEEK_MIN_GAP_S
+            targets = _sample_grid(interval)
+        else:
+            can_seek = True
+            targets = iter(timestamps)
+        
+        next_ts = next(targets, None)
+        frame_index = -1
+        last_ts = -1.0
+        
+        while next_ts is not None:
+            if can_seek and frame_index >= 0 and next_ts - last_ts > SEEK_MIN_GAP_S:
+                if cap.set(cv2.CAP_PROP_POS_MSEC, next_ts * 1000.0):
+                    frame_index = int(round(next_ts * fps)) - 1
+                else:
+                    # Backend refused to seek: keep grabbing sequentially
+                    can_seek = False
+            
+            if not cap.grab():
+                break
+            frame_index += 1
+            
+            # Prefer the container timestamp, fall back to index/fps when it is missing or stuck
+            ts = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if ts <= last_ts or (ts <= 0 and frame_index > 0):
+                ts = frame_index / fps
+            
+            if can_seek and ts > next_ts + SEEK_MIN_GAP_S:
+                # Seek overshot (or the timestamps are unreliable): stop seeking from here on
+                can_seek = False
+            last_ts = ts
+            
+            # Keep the first frame at or after the next sampling timestamp
+            if ts + 1e-6 < next_ts:
+                continue
+            
+            ret, frame = cap.retrieve()
+            if not ret:
+                continue
+            
+            yield ts, frame
+            
+            # Advance past ts so a long frame (VFR) never yields twice for one sample slot
+            while next_ts is not None and next_ts <= ts + 1e-6:
+                next_ts = next(targets, None)
+            
+            if progress_callback and duration:
+                progress_callback(min(ts / duration, 1.0))
+    finally:
+        cap.release()
+
+def resolve_frame_quality(image_format, quality=None):
+    """Clamp quality to the format's range, or return its default when None"""
+    _, _, default, (low, high) = FRAME_FORMATS[image_format]
+    return default if quality is None else min(max(int(quality), low), high)
+
+# Near-duplicate dropping: a frame is dropped when its difference hash is within
+# threshold bits (of FRAME_DEDUP_HASH_SIZE**2) of the last kept frame's; 0 disables it
+FRAME_DEDUP_HASH_SIZE = 8
+FRAME_DEDUP_THRESHOLD = 6
+FRAME_DEDUP_BATCH = 32
+
+def dhash_frames(frames, hash_size=FRAME_DEDUP_HASH_SIZE):
+    """Difference hashes of a batch of BGR frames as an (N, hash_size**2) bool array"""
+    small = np.stack([
+        cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (hash_size + 1, hash_size),
+                   interpolation=cv2.INTER_AREA)
+        for frame in frames
+    ]).astype(np.int16)
+    return (small[:, :, 1:] > small[:, :, :-1]).reshape(len(frames), -1)
+
+def dedup_frames(frames_iter, threshold=FRAME_DEDUP_THRESHOLD, batch_size=FRAME_DEDUP_BATCH, stats=None):
+    """
+    Yield the (ts, frame) pairs of frames_iter that differ from the last kept frame by more
+    than threshold dHash bits. Hashes and all pairwise distances are computed per batch;
+    only the keep/drop walk is sequential. stats (a dict) receives sampled/kept counts.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(sampled=0, kept=0)
+    last_hash = None
+    batch = []
+    
+    def flush():
+        nonlocal last_hash
+        hashes = dhash_frames([frame for _, frame in batch])
+        pairwise = np.count_nonzero(hashes[:, None, :] != hashes[None, :, :], axis=2)
+        to_last = np.count_nonzero(hashes != last_hash, axis=1) if last_hash is not None else None
+        kept_i = None
+        for i, item in enumerate(batch):
+            if kept_i is not None:
+                distance = pairwise[kept_i, i]
+            elif to_last is not None:
+                distance = to_last[i]
+            else:
+                distance = threshold + 1  # the first frame is always kept
+            if distance > threshold:
+                kept_i = i
+                stats["kept"] += 1
+                yield item
+        if kept_i is not None:
+            last_hash = hashes[kept_i]
+        stats["sampled"] += len(batch)
+        batch.clear()
+    
+    for item in frames_iter:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+# Frame sampling modes: a fixed FRAME_SAMPLE_FPS grid, or at most a budget of frames
+# spread over the scenes found by a cheap low-res difference pass
+SAMPLING_MODES = {
+    "1fps": "1 FPS",
+    "scenes": "Scene changes",
+}
+DEFAULT_SAMPLING = "1fps"
+SCENE_FRAME_BUDGET = 32
+SCENE_PROBE_FPS = 2.0
+SCENE_THUMB_SIZE = (64, 36)
+# Mean absolute difference (0-1) between consecutive probe thumbnails that counts as a cut
+SCENE_CUT_THRESHOLD = 0.12
+
+def detect_scenes(video_path, probe_fps=SCENE_PROBE_FPS, progress_callback=None):
+    """
+    Probe the video at probe_fps with tiny grayscale thumbnails and return
+    (probe_timestamps, diffs, end_ts): diffs[i] is the mean absolute difference (0-1)
+    between probe i and probe i-1 (diffs[0] is 0), end_ts is where the last probe ends.
+    Raises IOError if the video can't be opened.
+    """
+    probe_ts = []
+    thumbs = []
+    for ts, frame in iter_sampled_frames(video_path, probe_fps, progress_callback):
+        probe_ts.append(ts)
+        thumbs.append(cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), SCENE_THUMB_SIZE,
+                                 interpolation=cv2.INTER_AREA))
+    if not thumbs:
+        return [], np.zeros(0), 0.0
+    
+    thumbs = np.stack(thumbs).astype(np.int16)
+    diffs = np.zeros(len(thumbs))
+    diffs[1:] = np.abs(thumbs[1:] - thumbs[:-1]).mean(axis=(1, 2)) / 255.0
+    return probe_ts, diffs, probe_ts[-1] + 1.0 / probe_fps
+
+def select_scene_timestamps(probe_ts, diffs, end_ts, budget=SCENE_FRAME_BUDGET, threshold=SCENE_CUT_THRESHOLD):
+    """
+    Split the probes into scenes at diffs >= threshold and choose at most budget timestamps.
+    With more scenes than budget, the scenes behind the strongest cuts get one frame each;
+    otherwise every scene gets one and the rest are shared out by scene length.
+    Frames sit evenly inside their scene, away from the cut itself.
+    Returns (sorted timestamps, cut timestamps).
+    """
+    if not probe_ts or budget <= 0:
+        return [], []
+    
+    cut_indices = [i for i in range(1, len(probe_ts)) if diffs[i] >= threshold]
+    starts = [0] + cut_indices
+    scenes = [
+        (probe_ts[start], probe_ts[end] if end < len(probe_ts) else end_ts)
+        for start, end in zip(starts, starts[1:] + [len(probe_ts)])
+    ]
+    cuts = [round(probe_ts[i], 3) for i in cut_indices]
+    
+    if len(scenes) >= budget:
+        # The opening scene has no cut in front of it; always keep it
+        strength = [float("inf")] + [diffs[i] for i in cut_indices]
+        keep = sorted(sorted(range(len(scenes)), key=lambda i: strength[i], reverse=True)[:budget])
+        counts = {i: 1 for i in keep}
+    else:
+        lengths = np.array([end - start for start, end in scenes])
+        extra = (budget - len(scenes)) * lengths / lengths.sum()
+        counts_arr = 1 + np.floor(extra).astype(int)
+        # Largest remainders take the frames lost to rounding
+        for i in np.argsort(-(extra - np.floor(extra)))[:budget - counts_arr.sum()]:
+            counts_arr[i] += 1
+        counts = dict(enumerate(counts_arr.tolist()))
+    
+    timestamps = set()
+    for i, count in counts.items():
+        start, end = scenes[i]
+        for j in range(count):
+            timestamps.add(round(start + (end - start) * (j + 0.5) / count, 3))
+    return sorted(timestamps), cuts
+
+# Resize at extraction: frames are resized on the writer threads before encoding, so the
+# frame cache, uploads and training loaders never handle full-resolution images.
+# The size is (width, height); "none" keeps the native resolution.
+RESIZE_POLICIES = {
+    "none": "Native resolution",
+    "max-side": "Max side (keep aspect)",
+    "letterbox": "Letterbox (pad to size)",
+    "center-crop": "Center crop (fill size)",
+}
+DEFAULT_RESIZE = "none"
+DEFAULT_RESIZE_SIZE = (448, 448)
+LETTERBOX_COLOR = (0, 0, 0)
+
+def parse_frame_size(text):
+    """Parse "448" or "640x360" into a (width, height) tuple"""
+    parts = str(text).lower().replace("×", "x").split("x")
+    if len(parts) == 1:
+        parts = parts * 2
+    width, height = (int(part) for part in parts)
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Invalid frame size: {text}")
+    return width, height
+
+def resize_frame(frame, policy, size):
+    """
+    Resize a BGR frame to size (width, height) under a RESIZE_POLICIES policy:
+    max-side fits it inside size keeping the aspect ratio and never enlarges it,
+    letterbox fits it and pads to exactly size, center-crop fills size and crops the overflow.
+    """
+    if policy == "none":
+        return frame
+    height, width = frame.shape[:2]
+    target_w, target_h = size
+    if policy == "center-crop":
+        scale = max(target_w / width, target_h / height)
+    else:
+        scale = min(target_w / width, target_h / height)
+        if policy == "max-side":
+            scale = min(scale, 1.0)
+    
+    new_w, new_h = max(round(width * scale), 1), max(round(height * scale), 1)
+    if (new_w, new_h) != (width, height):
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=interpolation)
+    
+    if policy == "letterbox":
+        top, left = (target_h - new_h) // 2, (target_w - new_w) // 2
+        frame = cv2.copyMakeBorder(frame, top, target_h - new_h - top, left, target_w - new_w - left,
+                                   cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+    elif policy == "center-crop":
+        top, left = (new_h - target_h) // 2, (new_w - target_w) // 2
+        frame = np.ascontiguousarray(frame[top:top + target_h, left:left + target_w])
+    return frame
+
+# Writer threads per FrameWriter when not given; None means one per CPU.
+# The extract command lowers it in each worker process so processes don't oversubscribe.
+FRAME_WRITER_WORKERS = None
+
+class FrameWriter:
+    """
+    Encode and write frames on a bounded thread pool so decode and encode overlap.
+    cv2.imencode/imwrite release the GIL, so the pool spreads encoding over all cores.
+    submit() blocks once max_pending frames are queued, which caps memory at a few
+    decoded frames no matter how far decode runs ahead.
+    Frames are resized (see resize_frame) on the same threads, just before encoding.
+    """
+    
+    def __init__(self, image_format=DEFAULT_FRAME_FORMAT, quality=None, max_workers=None, max_pending=None,
+                 resize=DEFAULT_RESIZE, resize_size=DEFAULT_RESIZE_SIZE):
+        if image_format not in FRAME_FORMATS:
+            raise ValueError(f"Unknown frame format: {image_format}")
+        if resize not in RESIZE_POLICIES:
+            raise ValueError(f"Unknown resize policy: {resize}")
+        self.resize = resize
+        self.resize_size = tuple(resize_size)
+        self.extension, flag, _, _ = FRAME_FORMATS[image_format]
+        self.params = [flag, resolve_frame_quality(image_format, quality)]
+        
+        self.max_workers = max_workers or FRAME_WRITER_WORKERS or os.cpu_count() or 4
+        self._slots = threading.Semaphore(max_pending or self.max_workers * 2)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="frame-writer")
+        self._futures = []
+    
+    def _write(self, frame, path):
+        try:
+            frame = resize_frame(frame, self.resize, self.resize_size)
+            if not cv2.imwrite(str(path), frame, self.params):
+                raise IOError(f"Failed to write frame: {path}")
+        finally:
+            self._slots.release()
+    
+    def submit(self, frame, path):
+        """Queue a frame for writing; blocks while the pool is saturated"""
+        self._slots.acquire()
+        self._futures.append(self._pool.submit(self._write, frame, path))
+    
+    def close(self):
+        """Wait for all pending writes and re-raise the first failure"""
+        self._pool.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # Drop queued writes (by hand: shutdown(cancel_futures=True) needs Python 3.9)
+            for future in self._futures:
+                future.cancel()
+            self._pool.shutdown(wait=True)
+            return False
+        self.close()
+        return False
+
+def extract_frames_1fps(video_path, output_dir, video_id, image_format=DEFAULT_FRAME_FORMAT, quality=None,
+                        frame_times=None, dedup_threshold=0, dedup_stats=None, timestamps=None,
+                        resize=DEFAULT_RESIZE, resize_size=DEFAULT_RESIZE_SIZE):
     """
     Extract ALL frames at 1 FPS and save with VLM training format: {video_id}_1.png, {video_id}_2.png, etc.
     For example: Video_ID_1_1.png, Video_ID_1_2.png, Video_ID_1_3.png
+    image_format is a FRAME_FORMATS key (the extension follows it); quality is the
+    PNG compression level or JPEG/WebP quality. Encoding runs on a FrameWriter pool.
+    If frame_times is a list, the timestamp of each saved frame is appended to it.
+    A dedup_threshold > 0 drops near-duplicate frames before they are encoded (see
+    dedup_frames); dedup_stats, if given, receives the sampled/kept counts.
+    timestamps (sorted seconds) replaces the 1 FPS grid, as used by extract_frames_scenes.
+    resize/resize_size resize every kept frame before it is encoded (see resize_frame).
     Returns a list of frame file paths.
     """
+    ui = status_sink()
     video_path = Path(video_path)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
     cap = cv2.VideoCapture(str(video_path))
     if not cap.isOpened():
-        st.error(f"Failed to open video: {video_path}")
+        ui.error(f"Failed to open video: {video_path}")
         return []
-    
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = total_frames / fps if fps > 0 else 0
-    
-    # Sample at 1 fps
-    frame_interval = int(fps) if fps > 0 else 30
+    fps, _, duration = probe_video(cap)
+    cap.release()
     
     frame_paths = []
-    frame_count = 0
     frame_number = 1  # Frame number for naming
     
-    st.info(f"📹 Processing video: {video_path.name} (Duration: {duration:.1f}s, FPS: {fps:.1f})")
+    duration_text = f"{duration:.1f}s" if duration else "unknown"
+    ui.info(f"📹 Processing video: {video_path.name} (Duration: {duration_text}, FPS: {fps:.2f})")
     
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    progress_bar = ui.progress(0)
+    status_text = ui.empty()
+    mode_text = "at 1 FPS" if timestamps is None else "at scene changes"
     
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        # Extract one frame per second
-        if frame_count % frame_interval == 0:
-            # VLM training format: {video_id}_{frame_number}.png
-            # Example: Video_ID_1_1.png, Video_ID_1_2.png, etc.
-            frame_filename = f"{video_id}_{frame_number}.png"
-            frame_path = output_dir / frame_filename
-            
-            # Save frame as PNG
-            cv2.imwrite(str(frame_path), frame)
-            frame_paths.append(str(frame_path))
-            
-            frame_number += 1
-            
-            # Update progress
-            progress = min(frame_count / total_frames, 1.0)
-            progress_bar.progress(progress)
-            status_text.text(f"Extracted {len(frame_paths)} frames at 1 FPS ({progress*100:.1f}%)")
-        
-        frame_count += 1
+    def on_progress(progress):
+        progress_bar.progress(progress)
+        status_text.text(f"Extracted {len(frame_paths)} frames {mode_text} ({progress*100:.1f}%)")
     
-    cap.release()
+    if dedup_stats is None:
+        dedup_stats = {}
+    try:
+        with FrameWriter(image_format, quality, resize=resize, resize_size=resize_size) as writer:
+            frames = iter_sampled_frames(video_path, FRAME_SAMPLE_FPS, on_progress, timestamps=timestamps)
+            if dedup_threshold:
+                frames = dedup_frames(frames, dedup_threshold, stats=dedup_stats)
+            for ts, frame in frames:
+                # VLM training format: {video_id}_{frame_number}.png
+                # Example: Video_ID_1_1.png, Video_ID_1_2.png, etc.
+                frame_filename = f"{video_id}_{frame_number}{writer.extension}"
+                frame_path = output_dir / frame_filename
+                
+                # Encode and save on the writer pool while decode continues
+                writer.submit(frame, frame_path)
+                frame_paths.append(str(frame_path))
+                if frame_times is not None:
+                    frame_times.append(round(ts, 3))
+                
+                frame_number += 1
+    except IOError as e:
+        ui.error(str(e))
+        return []
     
     if not frame_paths:
-        st.warning("No frames extracted from video")
+        ui.warning("No frames extracted from video")
         return []
     
-    st.success(f"✅ Extracted {len(frame_paths)} frames at 1 FPS in VLM format")
+    if dedup_threshold:
+        sampled = dedup_stats["sampled"]
+        ui.success(f"✅ Extracted {len(frame_paths)} frames {mode_text} in VLM format "
+                   f"({sampled} sampled, {1 - len(frame_paths) / sampled:.0%} dropped as near-duplicates)")
+    else:
+        ui.success(f"✅ Extracted {len(frame_paths)} frames {mode_text} in VLM format")
     
     progress_bar.empty()
     status_text.empty()
     
     return frame_paths
 
-# === GEMINI FILE API FUNCTIONS ===
+def extract_frames_scenes(video_path, output_dir, video_id, budget=SCENE_FRAME_BUDGET,
+                          image_format=DEFAULT_FRAME_FORMAT, quality=None, frame_times=None,
+                          dedup_threshold=0, dedup_stats=None, scene_cuts=None,
+                          resize=DEFAULT_RESIZE, resize_size=DEFAULT_RESIZE_SIZE):
+    """
+    Extract at most budget frames spread over the video's scenes (see detect_scenes and
+    select_scene_timestamps), named like extract_frames_1fps. If scene_cuts is a list,
+    the detected cut timestamps are appended to it. Returns a list of frame file paths.
+    """
+    ui = status_sink()
+    progress_bar = ui.progress(0)
+    status_text = ui.empty()
+    
+    def on_progress(progress):
+        progress_bar.progress(progress)
+        status_text.text(f"Detecting scene changes ({progress*100:.1f}%)")
+    
+    try:
+        probe_ts, diffs, end_ts = detect_scenes(video_path, progress_callback=on_progress)
+    except IOError as e:
+        ui.error(str(e))
+        return []
+    finally:
+        progress_bar.empty()
+        status_text.empty()
+    
+    timestamps, cuts = select_scene_timestamps(probe_ts, diffs, end_ts, budget)
+    if scene_cuts is not None:
+        scene_cuts.extend(cuts)
+    if not timestamps:
+        ui.warning("No frames extracted from video")
+        return []
+    ui.info(f"🎞️ {len(cuts) + 1} scenes detected, sampling {len(timestamps)} frames")
+    
+    return extract_frames_1fps(
+        video_path, output_dir, video_id, image_format=image_format, quality=quality,
+        frame_times=frame_times, dedup_threshold=dedup_threshold, dedup_stats=dedup_stats,
+        timestamps=timestamps, resize=resize, resize_size=resize_size
+    )
 
-def switch_api_key():
-    """Rotate to the next API key"""
-    current_idx = st.session_state.current_api_index
-    current_idx = (current_idx + 1) % len(API_KEYS)
-    st.session_state.current_api_index = current_idx
-    genai.configure(api_key=API_KEYS[current_idx])
-    st.session_state.model = genai.GenerativeModel(MODEL_NAME)
-    return current_idx + 1
-
-def upload_video_to_gemini(video_path, max_retries=3):
-    """Upload video to Gemini File API and wait for processing"""
-    for attempt in range(max_retries):
+# === FRAME CACHE ===
+
+FRAME_MANIFEST_NAME = "manifest.json"
+FRAME_MANIFEST_VERSION = 1
+# A temp extraction folder untouched for this long is an interrupted run's leftover
+FRAME_TMP_STALE_S = 60 * 60
+
+_content_hash_memo = process_resource("content_hash_memo", dict)
+
+def video_content_hash(video_path, chunk_size=1 << 20):
+    """
+    BLAKE2b hex digest of the file contents.
+    Memoized per process on (path, size, mtime) so repeated calls for the same video are free.
+    """
+    video_path = Path(video_path)
+    stat = video_path.stat()
+    memo_key = (str(video_path.resolve()), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _content_hash_memo:
+        return _content_hash_memo[memo_key]
+    
+    digest = hashlib.blake2b(digest_size=20)
+    with open(video_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    
+    _content_hash_memo[memo_key] = digest.hexdigest()
+    return _content_hash_memo[memo_key]
+
+def frame_cache_params(image_format=DEFAULT_FRAME_FORMAT, quality=None, dedup_threshold=0,
+                       sampling=DEFAULT_SAMPLING, frame_budget=SCENE_FRAME_BUDGET,
+                       resize=DEFAULT_RESIZE, resize_size=DEFAULT_RESIZE_SIZE):
+    """Everything besides the video content that changes the extracted frames"""
+    params = {
+        "sample_fps": FRAME_SAMPLE_FPS,
+        "image_format": image_format,
+        "quality": resolve_frame_quality(image_format, quality),
+    }
+    # Only recorded when enabled, so frames extracted before these options existed stay valid
+    if dedup_threshold:
+        params["dedup"] = {"hash_size": FRAME_DEDUP_HASH_SIZE, "threshold": dedup_threshold}
+    if sampling == "scenes":
+        del params["sample_fps"]
+        params["scenes"] = {
+            "budget": frame_budget,
+            "probe_fps": SCENE_PROBE_FPS,
+            "thumb_size": list(SCENE_THUMB_SIZE),
+            "cut_threshold": SCENE_CUT_THRESHOLD,
+        }
+    if resize != "none":
+        params["resize"] = {"policy": resize, "size": list(resize_size)}
+    return params
+
+def read_frame_manifest(video_frames_dir):
+    """Return the manifest dict for a frames folder, or None if missing/unreadable"""
+    try:
+        with open(Path(video_frames_dir) / FRAME_MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def write_frame_manifest(video_frames_dir, manifest):
+    """Write manifest.json via a temp file + rename so it is never seen half-written"""
+    manifest_path = Path(video_frames_dir) / FRAME_MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def cached_frame_paths(video_path, video_frames_dir, params):
+    """
+    Return the frame list from video_frames_dir if its manifest matches the video and
+    params and every frame is on disk, else None.
+    The video is only hashed when its size/mtime differ from what the manifest recorded.
+    """
+    manifest = read_frame_manifest(video_frames_dir)
+    if not manifest or manifest.get("version") != FRAME_MANIFEST_VERSION:
+        return None
+    if manifest.get("params") != params:
+        return None
+    
+    stat = Path(video_path).stat()
+    source = manifest.get("source", {})
+    if (source.get("size"), source.get("mtime_ns")) != (stat.st_size, stat.st_mtime_ns):
+        if source.get("content_hash") != video_content_hash(video_path):
+            return None
+    
+    frame_paths = [str(Path(video_frames_dir) / name) for name in manifest.get("frames", [])]
+    if not frame_paths or not all(os.path.exists(p) for p in frame_paths):
+        return None
+    return frame_paths
+
+def _swap_in_dir(tmp_dir, final_dir):
+    """Replace final_dir with tmp_dir using renames; the old folder is removed afterwards"""
+    old_dir = None
+    if final_dir.exists():
+        old_dir = final_dir.with_name(f".{final_dir.name}.old-{uuid.uuid4().hex[:8]}")
+        os.replace(final_dir, old_dir)
+    os.replace(tmp_dir, final_dir)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+def extract_frames_cached(video_path, frames_base_dir, video_id, image_format=DEFAULT_FRAME_FORMAT, quality=None,
+                          dedup_threshold=0, sampling=DEFAULT_SAMPLING, frame_budget=SCENE_FRAME_BUDGET,
+                          resize=DEFAULT_RESIZE, resize_size=DEFAULT_RESIZE_SIZE):
+    """
+    Return frames for video_id from frames_base_dir/<video_id>, extracting only on a cache miss.
+    The cache is keyed by the video's content hash plus frame_cache_params and recorded in
+    manifest.json next to the frames. Misses extract into a temp folder that is renamed into
+    place only after all frames and the manifest are written, so an interrupted extraction
+    never leaves a folder that looks valid.
+    """
+    ui = status_sink()
+    frames_base_dir = Path(frames_base_dir)
+    video_frames_dir = frames_base_dir / video_id
+    params = frame_cache_params(image_format, quality, dedup_threshold, sampling, frame_budget,
+                                resize, resize_size)
+    
+    frame_paths = cached_frame_paths(video_path, video_frames_dir, params)
+    if frame_paths:
+        metrics.incr("frame_cache_hit")
+        ui.info(f"♻️ Reusing {len(frame_paths)} cached frames for {video_id}")
+        return frame_paths
+    
+    # Leftovers from an interrupted extraction of this video are never valid. A temp folder
+    # that was written to recently may belong to a live extraction (prefetch, the extract
+    # command) of the same video, so only idle ones are removed.
+    cutoff = time.time() - FRAME_TMP_STALE_S
+    for stale in frames_base_dir.glob(f".{video_id}.tmp-*"):
         try:
-            st.info(f"📤 Uploading video to Gemini... (Attempt {attempt + 1}/{max_retries})")
-            
-            # Upload the file
-            video_file = genai.upload_file(path=str(video_path))
-            st.success(f"✅ Upload initiated: {video_file.name}")
-            
-            # Poll until the file is processed (state = ACTIVE)
-            with st.spinner("⏳ Waiting for Gemini to process video..."):
-                while video_file.state.name == "PROCESSING":
-                    time.sleep(2)
-                    video_file = genai.get_file(video_file.name)
+            if stale.stat().st_mtime < cutoff:
+                shutil.rmtree(stale, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+    
+    tmp_dir = frames_base_dir / f".{video_id}.tmp-{uuid.uuid4().hex[:8]}"
+    frame_times = []
+    dedup_stats = {}
+    scene_cuts = []
+    try:
+        with metrics.timer("frame_extract"):
+            if sampling == "scenes":
+                tmp_paths = extract_frames_scenes(
+                    video_path, tmp_dir, video_id, budget=frame_budget,
+                    image_format=image_format, quality=quality, frame_times=frame_times,
+                    dedup_threshold=dedup_threshold, dedup_stats=dedup_stats, scene_cuts=scene_cuts,
+                    resize=resize, resize_size=resize_size
+                )
+            else:
+                tmp_paths = extract_frames_1fps(
+                    video_path, tmp_dir, video_id,
+                    image_format=image_format, quality=quality, frame_times=frame_times,
+                    dedup_threshold=dedup_threshold, dedup_stats=dedup_stats,
+                    resize=resize, resize_size=resize_size
+                )
+        if not tmp_paths:
+            return []
+        
+        stat = Path(video_path).stat()
+        write_frame_manifest(tmp_dir, {
+            "version": FRAME_MANIFEST_VERSION,
+            "video_id": video_id,
+            "source": {
+                "path": str(video_path),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "content_hash": video_content_hash(video_path),
+            },
+            "params": params,
+            "frames": [Path(p).name for p in tmp_paths],
+            "timestamps": frame_times,
+            "sampled_frames": dedup_stats.get("sampled", len(tmp_paths)),
+            "sampling": sampling,
+            "scene_cuts": scene_cuts if sampling == "scenes" else None,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        })
+        _swap_in_dir(tmp_dir, video_frames_dir)
+    finally:
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    return [str(video_frames_dir / Path(p).name) for p in tmp_paths]
+
+# === FRAME THUMBNAILS ===
+
+# The frames grid shows small JPEG thumbnails, one page at a time; full-size frames are only
+# sent to the browser when one is opened. Thumbnails live in <video frames dir>/.thumbs, so
+# re-extracting the video (which swaps the whole folder) drops them with the old frames.
+THUMB_DIR_NAME = ".thumbs"
+THUMB_MAX_SIDE = 320
+THUMB_JPEG_QUALITY = 70
+THUMBS_PER_PAGE = 12
+
+def frame_thumbnail(frame_path, max_side=THUMB_MAX_SIDE):
+    """Path of frame_path's JPEG thumbnail, created on first use and whenever the frame is newer"""
+    frame_path = Path(frame_path)
+    thumb_path = frame_path.parent / THUMB_DIR_NAME / f"{frame_path.stem}.jpg"
+    try:
+        if thumb_path.stat().st_mtime_ns >= frame_path.stat().st_mtime_ns:
+            return thumb_path
+    except FileNotFoundError:
+        pass
+    
+    image = cv2.imread(str(frame_path))
+    if image is None:
+        raise IOError(f"Failed to read frame: {frame_path}")
+    scale = max_side / max(image.shape[:2])
+    if scale < 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, THUMB_JPEG_QUALITY])
+    if not ok:
+        raise IOError(f"Failed to encode thumbnail: {frame_path}")
+    
+    thumb_path.parent.mkdir(exist_ok=True)
+    tmp_path = thumb_path.with_name(f".{thumb_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    tmp_path.write_bytes(buffer.tobytes())
+    os.replace(tmp_path, thumb_path)
+    return thumb_path
+
+def frame_thumbnails(frame_paths):
+    """Thumbnails for frame_paths (in order, made on a thread pool); a frame that can't be read maps to itself"""
+    def thumbnail(frame_path):
+        try:
+            return str(frame_thumbnail(frame_path))
+        except (IOError, OSError) as e:
+            logger.warning(f"Thumbnail failed for {frame_path}: {e}")
+            return frame_path
+    
+    with metrics.timer("thumbnails"), \
+            ThreadPoolExecutor(max_workers=min(len(frame_paths), os.cpu_count() or 4) or 1,
+                               thread_name_prefix="thumbs") as pool:
+        return list(pool.map(thumbnail, frame_paths))
+
+# === PROXY TRANSCODING ===
+
+# Optional low-res copy uploaded instead of the original. Gemini samples video at about
+# 1 FPS and low resolution, so a small proxy uploads and processes much faster.
+# cv2.VideoWriter writes video only: the proxy has no audio track.
+PROXY_MAX_HEIGHT = 360
+PROXY_FPS = 2.0
+PROXY_MAX_BYTES = 20 * 1024 * 1024
+PROXY_FOURCC = "mp4v"
+
+def proxy_params():
+    return {"max_height": PROXY_MAX_HEIGHT, "fps": PROXY_FPS, "max_bytes": PROXY_MAX_BYTES, "fourcc": PROXY_FOURCC}
+
+def video_input_hash(video_path, proxy=False):
+    """Identity of what gets uploaded for video_path: its content hash, tagged with the proxy settings if used"""
+    content_hash = video_content_hash(video_path)
+    if not proxy:
+        return content_hash
+    tag = hashlib.sha1(json.dumps(proxy_params(), sort_keys=True).encode('utf-8')).hexdigest()[:8]
+    return f"{content_hash}-proxy-{tag}"
+
+def _write_proxy(video_path, proxy_path, max_height, fps):
+    writer = None
+    try:
+        for _, frame in iter_sampled_frames(video_path, fps):
+            if writer is None:
+                height, width = frame.shape[:2]
+                scale = min(1.0, max_height / height)
+                # Even dimensions keep the encoder happy
+                size = (max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2))
+                writer = cv2.VideoWriter(str(proxy_path), cv2.VideoWriter_fourcc(*PROXY_FOURCC), fps, size)
+                if not writer.isOpened():
+                    raise IOError(f"Could not open VideoWriter for {proxy_path}")
+            if frame.shape[1::-1] != size:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            writer.write(frame)
+    finally:
+        if writer is not None:
+            writer.release()
+    if writer is None:
+        raise IOError(f"No frames decoded from {video_path}")
+
+def make_proxy_video(video_path, proxy_dir=None):
+    """
+    Return a downscaled, low-fps copy of video_path from the proxy cache, transcoding it on a miss.
+    Proxies over PROXY_MAX_BYTES are re-encoded at half the height (then half the fps) a few times.
+    Returns None (after reporting) if transcoding fails.
+    """
+    ui = status_sink()
+    proxy_dir = Path(proxy_dir) if proxy_dir else CACHE_DIR / "proxies"
+    proxy_path = proxy_dir / f"{video_input_hash(video_path, proxy=True)}.mp4"
+    if proxy_path.exists():
+        return proxy_path
+    
+    proxy_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = proxy_dir / f".{proxy_path.stem}.tmp-{uuid.uuid4().hex[:8]}.mp4"
+    max_height, fps = PROXY_MAX_HEIGHT, PROXY_FPS
+    start = time.perf_counter()
+    try:
+        for _ in range(4):
+            with metrics.timer("proxy_transcode"):
+                _write_proxy(video_path, tmp_path, max_height, fps)
+            if tmp_path.stat().st_size <= PROXY_MAX_BYTES:
+                break
+            if max_height > 144:
+                max_height //= 2
+            else:
+                fps /= 2
+        os.replace(tmp_path, proxy_path)
+    except Exception as e:
+        ui.warning(f"⚠️ Proxy transcode failed, uploading the original: {e}")
+        return None
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    
+    original = Path(video_path).stat().st_size
+    proxy = proxy_path.stat().st_size
+    ui.info(f"🗜️ Proxy {original / 1e6:.1f} MB → {proxy / 1e6:.1f} MB "
+            f"({1 - proxy / original:.0%} smaller, {time.perf_counter() - start:.1f}s)")
+    return proxy_path
+
+# === API KEY POOL ===
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Exponential backoff with full jitter: uniform(0, min(cap, base * 2**attempt))"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class GeminiKeyClient:
+    """
+    File and model calls bound to one API key.
+    genai.configure() swaps one global client, which breaks as soon as a background
+    worker polls a file on one key while the UI switches to another; each key gets
+    its own clients instead.
+    
+    The SDK has no public per-key client, so this relies on two private details of
+    google-generativeai 0.8.x (GENAI_TESTED_VERSION, pinned in the README): the
+    _ClientManager class and GenerativeModel._client. Both are checked here so an SDK
+    upgrade that changes them fails loudly instead of silently using the global client.
+    """
+    
+    def __init__(self, index, api_key):
+        self.index = index
+        self._clients = _ClientManager()
+        self._clients.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(MODEL_NAME)
+        if not hasattr(self.model, "_client") or not hasattr(self._clients, "get_default_client"):
+            raise RuntimeError(
+                f"google-generativeai {genai.__version__} changed the private client API that per-key "
+                f"clients rely on; install google-generativeai=={GENAI_TESTED_VERSION}"
+            )
+        self.model._client = self._clients.get_default_client("generative")
+    
+    def upload_file(self, path, mime_type=None, display_name=None):
+        path = Path(path)
+        mime_type = mime_type or mimetypes.guess_type(str(path))[0]
+        proto = self._clients.get_default_client("file").create_file(
+            path=str(path), mime_type=mime_type, display_name=display_name or f"{REMOTE_FILE_TAG}{path.name}"[:512]
+        )
+        return genai.types.File(proto)
+    
+    def list_files(self, page_size=100):
+        """All files on this key, fetched page_size at a time"""
+        pages = self._clients.get_default_client("file").list_files(genai.protos.ListFilesRequest(page_size=page_size))
+        for proto in pages:
+            yield genai.types.File(proto)
+    
+    def get_file(self, name):
+        if "/" not in name:
+            name = f"files/{name}"
+        return genai.types.File(self._clients.get_default_client("file").get_file(name=name))
+    
+    def delete_file(self, name):
+        if "/" not in name:
+            name = f"files/{name}"
+        self._clients.get_default_client("file").delete_file(name=name)
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to a burst of `per_minute`"""
+    
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (requests larger than the burst wait for a full bucket)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+    
+    def consume(self, amount, now):
+        """Take `amount` units; negative amounts refund, the level may go below zero"""
+        self._refill(now)
+        self.level = min(self.capacity, self.level - amount)
+
+class KeyState:
+    """Scheduler bookkeeping for one API key"""
+    
+    def __init__(self, index, api_key, rpm, tpm):
+        self.index = index
+        self.api_key = api_key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.cooldown_until = 0.0
+        self.strikes = 0  # consecutive 429s
+        self.in_flight = 0
+        self.completed = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self._client = None
+    
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = GeminiKeyClient(self.index, self.api_key)
+        return self._client
+
+class KeyLease:
+    """A granted slot on one key; set tokens_used from the response to correct the TPM estimate"""
+    
+    def __init__(self, key, tokens_charged):
+        self.key = key
+        self.index = key.index
+        self.client = key.client
+        self.tokens_charged = tokens_charged
+        self.tokens_used = None
+
+class KeyPool:
+    """
+    Schedules Gemini calls across all API_KEYS at once instead of rotating after a 429.
+    Each key has RPM/TPM token buckets, a cooldown that grows with consecutive 429s and
+    an in-flight count. lease() hands out the key that can serve soonest (least busy on
+    ties), blocking until one can, so concurrent workers spread over every key.
+    Process-wide so Streamlit sessions and background workers share the quotas.
+    """
+    
+    def __init__(self, keys, rpm=KEY_RPM, tpm=KEY_TPM):
+        self.keys = [KeyState(i, key, rpm, tpm) for i, key in enumerate(keys)]
+        self._file_keys = {}
+        self._cond = threading.Condition()
+    
+    def client(self, key_index=None):
+        """GeminiKeyClient for key_index (default: the least busy key), without taking a slot"""
+        with self._cond:
+            if key_index is None:
+                now = time.monotonic()
+                key_index = min(self.keys, key=lambda k: (max(k.cooldown_until - now, 0.0), k.in_flight)).index
+            return self.keys[key_index].client
+    
+    def remember_file(self, remote_file, key_index):
+        with self._cond:
+            self._file_keys[remote_file.name] = key_index
+    
+    def key_of(self, remote_file):
+        """Index of the key that uploaded remote_file (files are only visible to their own key)"""
+        with self._cond:
+            return self._file_keys.get(remote_file.name)
+    
+    def _wait_time(self, key, requests, tokens, now):
+        return max(
+            key.cooldown_until - now,
+            key.requests.wait_time(requests, now) if requests else 0.0,
+            key.tokens.wait_time(tokens, now) if tokens else 0.0,
+        )
+    
+    def acquire(self, requests=1, tokens=0, key_index=None, timeout=None, exclude=None):
+        """
+        Block until a key (or key_index specifically) has quota and return a KeyLease.
+        exclude skips one key when there is another to use.
+        Raises TimeoutError if none frees up within timeout seconds.
+        """
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                candidates = self.keys if key_index is None else [self.keys[key_index]]
+                if exclude is not None and len(candidates) > 1:
+                    candidates = [k for k in candidates if k.index != exclude]
+                key = min(candidates, key=lambda k: (self._wait_time(k, requests, tokens, now), k.in_flight))
+                wait = self._wait_time(key, requests, tokens, now)
+                if wait <= 0:
+                    key.requests.consume(requests, now)
+                    key.tokens.consume(tokens, now)
+                    key.in_flight += 1
+                    # Time spent waiting for quota is what sizing the key pool is about
+                    metrics.observe("key_wait", now - started)
+                    metrics.note_key(key.index)
+                    return KeyLease(key, tokens)
                 
-                if video_file.state.name == "ACTIVE":
-                    st.success("✅ Video processed and ready!")
-                    return video_file
-                else:
-                    st.error(f"❌ File processing failed with state: {video_file.state.name}")
-                    return None
-                    
-        except exceptions.ResourceExhausted:
-            st.warning(f"⚠️ Rate limit hit on API key #{st.session_state.current_api_index + 1}")
-            key_num = switch_api_key()
-            st.info(f"🔄 Switched to API key #{key_num}")
-            time.sleep(2)
+                if deadline is not None:
+                    if now >= deadline:
+                        raise TimeoutError("No API key available before the deadline")
+                    wait = min(wait, deadline - now)
+                self._cond.wait(wait)
+    
+    def release(self, lease, outcome="ok"):
+        """Return a lease; outcome is 'ok', 'rate_limited' or 'error'"""
+        with self._cond:
+            key = lease.key
+            now = time.monotonic()
+            key.in_flight -= 1
+            if lease.tokens_used is not None:
+                key.tokens.consume(lease.tokens_used - lease.tokens_charged, now)
             
-        except Exception as e:
-            st.error(f"❌ Upload error: {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(3)
+            if outcome == "rate_limited":
+                metrics.incr("rate_limited")
+                key.rate_limited += 1
+                cooldown = min(KEY_COOLDOWN_MAX_S, KEY_COOLDOWN_S * (2 ** key.strikes))
+                key.cooldown_until = now + cooldown * random.uniform(0.8, 1.2)
+                key.strikes += 1
+            elif outcome == "error":
+                metrics.incr("api_errors")
+                key.errors += 1
             else:
+                key.completed += 1
+                key.strikes = 0
+            self._cond.notify_all()
+    
+    @contextlib.contextmanager
+    def lease(self, requests=1, tokens=0, key_index=None, timeout=None):
+        """acquire()/release() around a block; a ResourceExhausted inside puts the key in cooldown"""
+        with self.holding(self.acquire(requests, tokens, key_index, timeout)) as lease:
+            yield lease
+    
+    @contextlib.contextmanager
+    def holding(self, lease):
+        """Release an already acquired lease when the block exits, with the block's outcome"""
+        outcome = "ok"
+        try:
+            yield lease
+        except exceptions.ResourceExhausted:
+            outcome = "rate_limited"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self.release(lease, outcome)
+    
+    def snapshot(self):
+        """Per-key status for display"""
+        with self._cond:
+            now = time.monotonic()
+            return [{
+                "key": key.index + 1,
+                "in_flight": key.in_flight,
+                "completed": key.completed,
+                "rate_limited": key.rate_limited,
+                "errors": key.errors,
+                "cooldown_s": max(0.0, key.cooldown_until - now),
+            } for key in self.keys]
+
+key_pool = process_resource("key_pool", lambda: KeyPool(API_KEYS))
+
+def response_token_count(response):
+    """total_token_count from a generate_content response, or None if it isn't reported"""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or None
+
+# generate_content calls run here so the caller can stop waiting at the deadline or when a
+# hedge answers first; an abandoned call finishes (bounded by its own timeout) and is discarded
+_generate_pool = process_resource(
+    "generate_pool", lambda: ThreadPoolExecutor(max_workers=16, thread_name_prefix="generate")
+)
+
+def _generate_on(lease, content, deadline):
+    """One generate_content call on an acquired lease, which is released when it returns"""
+    with key_pool.holding(lease):
+        start = time.perf_counter()
+        response = lease.client.model.generate_content(
+            content,
+            generation_config=genai.GenerationConfig(**REASONING_GENERATION_CONFIG),
+            request_options={"timeout": max(deadline - time.monotonic(), 1.0)}
+        )
+        lease.tokens_used = response_token_count(response)
+        metrics.observe("generate", time.perf_counter() - start)
+        return response
+
+def hedge_delay():
+    """How long the first request gets before a hedge is sent: recent p95 of generate times"""
+    delay = metrics.quantile("generate", HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES)
+    if delay is None:
+        return min(HEDGE_INITIAL_DELAY_S, GENERATE_TIMEOUT_S / 2)
+    return max(delay, HEDGE_MIN_DELAY_S)
+
+def generate_with_deadline(content, key_index=None, timeout=None, hedge=None):
+    """
+    generate_content(content) on key_index (default: any key), giving up after timeout seconds
+    (raises exceptions.DeadlineExceeded). With hedge, a duplicate is sent once the first request
+    has run longer than hedge_delay(): on another key, or on key_index itself when the content
+    references uploaded files (those are only visible to their own key). The first response
+    wins and the other request is abandoned. Errors from one request are only raised once
+    the other has failed too.
+    """
+    timeout = GENERATE_TIMEOUT_S if timeout is None else timeout
+    hedge = HEDGE_REQUESTS if hedge is None else hedge
+    deadline = time.monotonic() + timeout
+    
+    # Waiting for quota counts against the deadline
+    try:
+        lease = key_pool.acquire(tokens=REQUEST_TOKEN_ESTIMATE, key_index=key_index, timeout=timeout)
+    except TimeoutError:
+        metrics.incr("deadline_exceeded")
+        raise exceptions.DeadlineExceeded(f"No API key had quota within {timeout:.0f}s")
+    # Worker threads get a copy of this context so their timings are attributed to this video
+    primary = _generate_pool.submit(contextvars.copy_context().run, _generate_on, lease, content, deadline)
+    primary_key = lease.index
+    pending = {primary}
+    hedged = None
+    errors = []
+    
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        hedge_due = hedge and hedged is None
+        done, _ = wait(pending, timeout=min(remaining, hedge_delay()) if hedge_due else remaining,
+                       return_when=FIRST_COMPLETED)
+        
+        if not done:
+            if not hedge_due:
+                continue
+            # Only hedge on a key that can take the request right now
+            try:
+                hedge_lease = key_pool.acquire(tokens=REQUEST_TOKEN_ESTIMATE, key_index=key_index, timeout=0,
+                                               exclude=None if key_index is not None else primary_key)
+            except TimeoutError:
+                metrics.incr("hedges_skipped")
+                hedge = False
+                continue
+            metrics.incr("hedges")
+            hedged = _generate_pool.submit(contextvars.copy_context().run, _generate_on, hedge_lease, content,
+                                           deadline)
+            pending.add(hedged)
+            continue
+        
+        for future in done:
+            pending.discard(future)
+            try:
+                response = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            if future is hedged:
+                metrics.incr("hedge_wins")
+            return response
+    
+    if errors and not pending:
+        if isinstance(errors[0], exceptions.DeadlineExceeded):
+            metrics.incr("deadline_exceeded")
+        raise errors[0]
+    metrics.incr("deadline_exceeded")
+    raise exceptions.DeadlineExceeded(f"generate_content did not answer within {timeout:.0f}s")
+
+# === RESPONSE CACHE ===
+
+class ReasoningResponse(typing.TypedDict):
+    reasoning: str
+
+REASONING_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": ReasoningResponse,
+}
+
+def reasoning_cache_key(content_hash, prompt):
+    """Cache key for one generate_content call: input content, rendered prompt, model and generation config"""
+    config = dict(REASONING_GENERATION_CONFIG)
+    config["response_schema"] = {name: t.__name__ for name, t in ReasoningResponse.__annotations__.items()}
+    key_parts = [
+        content_hash,
+        hashlib.sha256(prompt.encode('utf-8')).hexdigest(),
+        MODEL_NAME,
+        config,
+    ]
+    return hashlib.sha256(json.dumps(key_parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+def frames_content_hash(frame_paths):
+    """Combined hash of a list of frame files, in order"""
+    digest = hashlib.blake2b(digest_size=20)
+    for frame_path in frame_paths:
+        digest.update(video_content_hash(frame_path).encode('ascii'))
+    return digest.hexdigest()
+
+class ResponseCache:
+    """
+    SQLite cache of generated reasoning keyed by reasoning_cache_key.
+    Reads refresh last_used; writes evict least recently used responses past max_bytes.
+    hits/misses count lookups in this process.
+    """
+    
+    def __init__(self, db_path, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Prefetch and batch workers share one connection; the lock serializes access
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_used);
+        """)
+    
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                metrics.incr("response_cache_miss")
                 return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+            metrics.incr("response_cache_hit")
+            return row[0]
     
-    return None
+    def put(self, key, response):
+        size = len(response.encode('utf-8'))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time())
+            )
+            self._evict()
+            self._db.commit()
+    
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        oldest = self._db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        for key, size in oldest:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+    
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
 
-def upload_image_to_gemini(image_path, max_retries=3):
-    """Upload image to Gemini File API and wait for processing"""
+def get_response_cache():
+    """Process-wide ResponseCache stored under CACHE_DIR"""
+    path = CACHE_DIR / "responses.sqlite3"
+    return process_resource(f"response_cache:{path.resolve()}", lambda: ResponseCache(path))
+
+def cached_reasoning(entry, content_hash, override_label=None, media="video"):
+    """Look up a cached response before uploading anything; None on a miss"""
+    prompt = build_reasoning_prompt(entry, override_label, media=media)
+    return get_response_cache().get(reasoning_cache_key(content_hash, prompt))
+
+# === GEMINI FILE API FUNCTIONS ===
+
+class RemoteFileCache:
+    """
+    Persistent SQLite index of videos already uploaded to Gemini:
+    content hash -> {name, api_key_index, expires_at, last_used}.
+    Entries expire by TTL (never past Gemini's own expiration) and the least recently
+    used ones beyond max_entries are evicted; evicted entries are returned so the
+    caller can delete the remote files. Every call reads and writes the database, so
+    several processes (the UI, batch, other annotators' apps) share one consistent index.
+    """
+    
+    def __init__(self, db_path, ttl_s=REMOTE_FILE_TTL_S, max_entries=REMOTE_FILE_MAX_ENTRIES):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = Path(db_path)
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        # Autocommit mode: _write() issues BEGIN IMMEDIATE itself
+        self._db = sqlite3.connect(str(db_path), timeout=60, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._write() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS remote_files (
+                content_hash TEXT PRIMARY KEY, name TEXT NOT NULL, api_key_index INTEGER NOT NULL,
+                expires_at REAL NOT NULL, last_used REAL NOT NULL)""")
+            self._import_json(db, self.db_path.with_suffix(".json"))
+    
+    @staticmethod
+    def _import_json(db, json_path):
+        """Carry over the remote_files.json index written by earlier versions, once"""
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        db.executemany(
+            "INSERT OR IGNORE INTO remote_files VALUES (?, ?, ?, ?, ?)",
+            ((h, e["name"], e["api_key_index"], e["expires_at"], e["last_used"]) for h, e in entries.items())
+        )
+        json_path.unlink(missing_ok=True)
+    
+    @contextlib.contextmanager
+    def _write(self):
+        """One write transaction, holding the database lock across processes"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+    
+    def lookup(self, content_hash):
+        """Return the unexpired entry for content_hash and mark it used, or None"""
+        now = time.time()
+        with self._write() as db:
+            row = db.execute("SELECT name, api_key_index, expires_at FROM remote_files "
+                             "WHERE content_hash = ? AND expires_at > ?", (content_hash, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE remote_files SET last_used = ? WHERE content_hash = ?", (now, content_hash))
+        return {"name": row[0], "api_key_index": row[1], "expires_at": row[2], "last_used": now}
+    
+    def put(self, content_hash, remote_file, api_key_index):
+        expires_at = time.time() + self.ttl_s
+        expiration = getattr(remote_file, "expiration_time", None)
+        if expiration:
+            # Leave an hour of headroom before Gemini deletes it on its own
+            expires_at = min(expires_at, expiration.timestamp() - 3600)
+        with self._write() as db:
+            db.execute("INSERT OR REPLACE INTO remote_files VALUES (?, ?, ?, ?, ?)",
+                       (content_hash, remote_file.name, api_key_index, expires_at, time.time()))
+    
+    def drop(self, content_hash):
+        with self._write() as db:
+            db.execute("DELETE FROM remote_files WHERE content_hash = ?", (content_hash,))
+    
+    def names(self):
+        """Remote names of every entry (files the cache still means to reuse), across all processes"""
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT name FROM remote_files")}
+    
+    def evict(self, keep=()):
+        """Remove expired and least recently used entries (except hashes in keep) and return them"""
+        now = time.time()
+        with self._write() as db:
+            rows = db.execute("SELECT content_hash, name, api_key_index, expires_at, last_used "
+                              "FROM remote_files ORDER BY last_used DESC").fetchall()
+            live = [row for row in rows if row[3] > now]
+            evicted = [row for row in rows if row[3] <= now] + live[self.max_entries:]
+            evicted = [row for row in evicted if row[0] not in keep]
+            db.executemany("DELETE FROM remote_files WHERE content_hash = ?", ((row[0],) for row in evicted))
+        return [{"name": name, "api_key_index": key_index, "expires_at": expires_at, "last_used": last_used}
+                for _, name, key_index, expires_at, last_used in evicted]
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def get_remote_file_cache():
+    """Process-wide RemoteFileCache stored under CACHE_DIR"""
+    path = CACHE_DIR / "remote_files.sqlite3"
+    return process_resource(f"remote_file_cache:{path.resolve()}", lambda: RemoteFileCache(path))
+
+def reuse_remote_video(content_hash):
+    """Return the cached remote file for content_hash if it is still ACTIVE on Gemini, else None"""
+    cache = get_remote_file_cache()
+    entry = cache.lookup(content_hash)
+    if entry is None or entry["api_key_index"] >= len(API_KEYS):
+        return None
+    
+    try:
+        remote_file = key_pool.client(entry["api_key_index"]).get_file(entry["name"])
+    except Exception:
+        cache.drop(content_hash)
+        return None
+    
+    if remote_file.state.name != "ACTIVE":
+        cache.drop(content_hash)
+        return None
+    key_pool.remember_file(remote_file, entry["api_key_index"])
+    return remote_file
+
+def upload_video_to_gemini(video_path, max_retries=3, proxy=False):
+    """
+    Upload video to Gemini File API and wait for processing, reusing a previous upload of the same content.
+    With proxy, a low-res copy from make_proxy_video is uploaded instead (the original if transcoding fails).
+    """
+    ui = status_sink()
+    content_hash = video_input_hash(video_path, proxy)
+    video_file = reuse_remote_video(content_hash)
+    if video_file:
+        metrics.incr("remote_file_reused")
+        ui.success(f"♻️ Reusing uploaded video: {video_file.name}")
+        return video_file
+    
+    if proxy:
+        proxy_path = make_proxy_video(video_path)
+        if proxy_path is None:
+            content_hash = video_input_hash(video_path)
+        else:
+            video_path = proxy_path
+    
     for attempt in range(max_retries):
         try:
-            st.info(f"📤 Uploading image to Gemini... (Attempt {attempt + 1}/{max_retries})")
+            ui.info(f"📤 Uploading video to Gemini... (Attempt {attempt + 1}/{max_retries})")
+            if attempt:
+                metrics.incr("retries")
             
-            # Upload the file
-            image_file = genai.upload_file(path=str(image_path))
-            st.success(f"✅ Upload initiated: {image_file.name}")
+            # Upload on the least busy key; the file stays bound to that key
+            with key_pool.lease(requests=0) as lease, metrics.timer("upload"):
+                video_file = lease.client.upload_file(video_path)
+            ui.success(f"✅ Upload initiated: {video_file.name} (API key #{lease.index + 1})")
             
             # Poll until the file is processed (state = ACTIVE)
-            with st.spinner("⏳ Waiting for Gemini to process image..."):
-                while image_file.state.name == "PROCESSING":
-                    time.sleep(1)
-                    image_file = genai.get_file(image_file.name)
+            with ui.spinner("⏳ Waiting for Gemini to process video..."), metrics.timer("processing_wait"):
+                while video_file.state.name == "PROCESSING":
+                    time.sleep(2)
+                    video_file = lease.client.get_file(video_file.name)
                 
-                if image_file.state.name == "ACTIVE":
-                    st.success("✅ Image processed and ready!")
-                    return image_file
+                if video_file.state.name == "ACTIVE":
+                    ui.success("✅ Video processed and ready!")
+                    key_pool.remember_file(video_file, lease.index)
+                    get_remote_file_cache().put(content_hash, video_file, lease.index)
+                    return video_file
                 else:
-                    st.error(f"❌ File processing failed with state: {image_file.state.name}")
+                    ui.error(f"❌ File processing failed with state: {video_file.state.name}")
                     return None
                     
         except exceptions.ResourceExhausted:
-            st.warning(f"⚠️ Rate limit hit on API key #{st.session_state.current_api_index + 1}")
-            key_num = switch_api_key()
-            st.info(f"🔄 Switched to API key #{key_num}")
-            time.sleep(2)
+            # The pool has put that key in cooldown; the next attempt picks another one
+            ui.warning(f"⚠️ Rate limit hit on API key #{lease.index + 1} (attempt {attempt + 1})")
+            time.sleep(backoff_delay(attempt))
             
         except Exception as e:
-            st.error(f"❌ Upload error: {str(e)}")
+            ui.error(f"❌ Upload error: {str(e)}")
             if attempt < max_retries - 1:
-                time.sleep(3)
+                time.sleep(backoff_delay(attempt))
             else:
                 return None
     
     return None
 
-def cleanup_gemini_file(file_name):
-    """Delete file from Gemini cloud storage"""
-    try:
-        genai.delete_file(file_name)
-        return True
-    except Exception as e:
-        st.warning(f"⚠️ Could not delete file {file_name}: {e}")
-        return False
-
-def generate_reasoning_with_video(entry, video_file, model, override_label=None):
-    """Generate AI reasoning using uploaded video file"""
+class RemoteFileGC:
+    """
+    Background deleter for remote files. delete() only queues the name; worker threads
+    delete it on its key, retrying with backoff, so Accept/Skip never wait on a delete.
+    A file Gemini no longer has counts as deleted. Queued deletes get GC_DRAIN_TIMEOUT_S
+    to finish when the process exits; whatever is left is caught by the next sweep.
+    """
     
-    # Logic: If user selected a button, use that. Otherwise, check metadata loosely.
-    if override_label:
-        is_scam = (override_label == "Scam")
-    else:
-        raw_label = str(entry.get("label", "")).strip().lower()
-        is_scam = "scam" in raw_label
+    def __init__(self, workers=GC_WORKERS, max_attempts=GC_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self.workers = workers
+        self._queue = queue.Queue()
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"remote-gc-{i}", daemon=True).start()
+        atexit.register(self.drain, GC_DRAIN_TIMEOUT_S)
+    
+    def delete(self, file_name, api_key_index=None):
+        self._queue.put((file_name, api_key_index))
+    
+    def pending(self):
+        return self._queue.unfinished_tasks
+    
+    def drain(self, timeout=None):
+        """Wait until every queued delete is done (or timeout); True if none is left"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.1)
+        return not self._queue.unfinished_tasks
+    
+    def close(self):
+        """Give queued deletes GC_DRAIN_TIMEOUT_S to finish, then stop the worker threads"""
+        self.drain(GC_DRAIN_TIMEOUT_S)
+        for _ in range(self.workers):
+            self._queue.put(None)
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            file_name, api_key_index = item
+            try:
+                self._delete(file_name, api_key_index)
+            finally:
+                self._queue.task_done()
+    
+    def _delete(self, file_name, api_key_index):
+        for attempt in range(self.max_attempts):
+            try:
+                with metrics.timer("cleanup"):
+                    key_pool.client(api_key_index).delete_file(file_name)
+                metrics.incr("gc_deleted")
+                return
+            except exceptions.NotFound:
+                metrics.incr("gc_deleted")
+                return
+            except Exception as e:
+                if attempt == self.max_attempts - 1:
+                    logger.warning(f"Could not delete remote file {file_name}: {e}")
+                    metrics.incr("gc_failed")
+                    return
+                time.sleep(backoff_delay(attempt))
 
-    title = entry.get("title", "No Title")
-    desc = entry.get("description", "No Description")
+def get_remote_gc():
+    return process_resource("remote_gc", RemoteFileGC)
 
-    if is_scam:
-        # Aggressive PROSECUTOR prompt
-        prompt = f"""Task: Analyze this video, Title, and Description.
-        
-Metadata Title: "{title}"
-Metadata Description: "{desc}"
+def cleanup_gemini_file(file_name, api_key_index=None):
+    """Queue a file for deletion from Gemini cloud storage (under api_key_index if it was uploaded with another key)"""
+    get_remote_gc().delete(file_name, api_key_index)
 
-This content is a SCAM. 
-Explain WHY the video, Title, and Description are deceptive based on these criteria:
-{SCAM_CRITERIA_TEXT}
+def evict_remote_files(keep=()):
+    """Delete remote files whose cache entries expired or fell out of the LRU window"""
+    for entry in get_remote_file_cache().evict(keep=keep):
+        cleanup_gemini_file(entry["name"], entry["api_key_index"])
 
-Your Output:
-Provide a clear, detailed explanation of the deception found in the visual content and metadata. Be direct.(3-4 Sentences)"""
-    else:
-        # DEFENDER prompt
-        prompt = f"""Task: Analyze this video, Title, and Description.
+def sweep_remote_files(min_age_s=ORPHAN_MIN_AGE_S, page_size=100, dry_run=False, orphans=True):
+    """
+    Queue deletion of this tool's leftovers on every key, a listing page at a time: tagged
+    files that FAILED, plus (with orphans) tagged files that no remote-file cache entry references
+    and that are older than min_age_s (younger ones may still be in use by a running upload).
+    Expired cache entries are evicted first. Returns {key index: files queued (or found, with dry_run)}.
+    """
+    evict_remote_files()
+    referenced = get_remote_file_cache().names()
+    now = time.time()
+    swept = {}
+    for key_index in range(len(API_KEYS)):
+        swept[key_index] = 0
+        batch = []
+        try:
+            for remote_file in key_pool.client(key_index).list_files(page_size):
+                if not (remote_file.display_name or "").startswith(REMOTE_FILE_TAG):
+                    continue
+                created = getattr(remote_file, "create_time", None)
+                failed = remote_file.state.name == "FAILED"
+                orphaned = (orphans and remote_file.name not in referenced and created is not None
+                            and now - created.timestamp() >= min_age_s)
+                if failed or orphaned:
+                    batch.append(remote_file.name)
+                if len(batch) >= page_size:
+                    swept[key_index] += len(batch)
+                    if not dry_run:
+                        for name in batch:
+                            cleanup_gemini_file(name, key_index)
+                    batch = []
+        except Exception as e:
+            logger.warning(f"Could not list remote files on API key #{key_index + 1}: {e}")
+        swept[key_index] += len(batch)
+        if not dry_run:
+            for name in batch:
+                cleanup_gemini_file(name, key_index)
+    return swept
 
-Metadata Title: "{title}"
-Metadata Description: "{desc}"
+def start_failed_sweep():
+    """
+    Delete this tool's FAILED remote files on a background thread (once per process, from the UI).
+    Unreferenced files are left alone: they may belong to another machine's app or batch.
+    """
+    def sweep():
+        swept = sweep_remote_files(orphans=False)
+        if any(swept.values()):
+            logger.info(f"Startup sweep queued {sum(swept.values())} failed remote files for deletion")
+    
+    thread = threading.Thread(target=sweep, name="failed-sweep", daemon=True)
+    thread.start()
+    return thread
 
-This content has been identified as NON-SCAM (Legitimate).
-Explain WHY the video, Title, and Description appear safe and legitimate.
+# Reasoning input: the uploaded video, or the extracted frames sent inline or as uploaded files
+REASONING_INPUTS = {
+    "video": "Video",
+    "frames-inline": "Frames (inline)",
+    "frames-upload": "Frames (uploaded)",
+}
+DEFAULT_REASONING_INPUT = "video"
+# Inline frames are downscaled JPEGs; Gemini caps a request at 20 MB, so stay under that
+INLINE_FRAME_MAX_SIDE = 512
+INLINE_FRAME_JPEG_QUALITY = 80
+INLINE_REQUEST_BYTES = 16 * 1024 * 1024
+FRAME_UPLOAD_WORKERS = 8
+INPUT_TIMINGS_NAME = "input_timings.jsonl"
 
-Your Output:
-Provide a brief summary emphasizing the legitimate nature of the content.(3-4 Sentences)"""
+def _encode_inline_frame(frame_path, max_side):
+    image = cv2.imread(str(frame_path))
+    if image is None:
+        raise IOError(f"Failed to read frame: {frame_path}")
+    scale = max_side / max(image.shape[:2])
+    if scale < 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, INLINE_FRAME_JPEG_QUALITY])
+    if not ok:
+        raise IOError(f"Failed to encode frame: {frame_path}")
+    return buffer.tobytes()
 
-    class ReasoningResponse(typing.TypedDict):
-        reasoning: str
+def inline_frame_parts(frame_paths, max_side=INLINE_FRAME_MAX_SIDE, budget_bytes=INLINE_REQUEST_BYTES):
+    """
+    Downscaled JPEG image parts for frame_paths, encoded on a thread pool. If they don't
+    all fit in budget_bytes, an evenly spaced subset that does is kept (in order).
+    """
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="inline-frames") as pool:
+        encoded = list(pool.map(lambda p: _encode_inline_frame(p, max_side), frame_paths))
+    
+    keep = list(range(len(encoded)))
+    total = sum(len(data) for data in encoded)
+    count = len(encoded)
+    while total > budget_bytes and count > 1:
+        count = max(1, min(count - 1, int(count * budget_bytes / total)))
+        keep = sorted(set(np.linspace(0, len(encoded) - 1, count).round().astype(int).tolist()))
+        total = sum(len(encoded[i]) for i in keep)
+    return [{"mime_type": "image/jpeg", "data": encoded[i]} for i in keep]
 
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content(
-                [prompt, video_file],
-                generation_config=genai.GenerationConfig(
-                    response_mime_type="application/json",
-                    response_schema=ReasoningResponse
-                )
-            )
-            return json.loads(response.text)["reasoning"]
-            
-        except exceptions.ResourceExhausted:
-            st.warning(f"⚠️ Rate limit hit (attempt {attempt + 1})")
-            key_num = switch_api_key()
-            st.info(f"🔄 Switched to API key #{key_num}")
-            model = st.session_state.model
-            time.sleep(2)
-            
-        except exceptions.InternalServerError:
-            st.warning(f"⚠️ Server error. Retrying in 5s... (attempt {attempt + 1})")
-            time.sleep(5)
+def upload_frames_to_gemini(frame_paths, max_workers=FRAME_UPLOAD_WORKERS, max_retries=3):
+    """
+    Upload frames concurrently on one key (a bounded pool) and wait for all of them with a
+    single poller, instead of one blocking upload + poll loop per frame.
+    Returns the ACTIVE files in frame order, or None if any frame failed.
+    """
+    ui = status_sink()
+    
+    def upload(client, frame_path):
+        for attempt in range(max_retries):
+            try:
+                return client.upload_file(frame_path)
+            except exceptions.ResourceExhausted:
+                raise
+            except Exception:
+                if attempt == max_retries - 1:
+                    raise
+                time.sleep(backoff_delay(attempt))
+    
+    files = []
+    try:
+        # Every frame must live on the key that will run generate_content
+        with key_pool.lease(requests=0) as lease:
+            ui.info(f"📤 Uploading {len(frame_paths)} frames to Gemini "
+                    f"(API key #{lease.index + 1}, {max_workers} at a time)...")
+            # The timer encloses the pool so it covers its shutdown wait for every upload
+            with metrics.timer("frames_upload"), \
+                    ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="frame-upload") as pool:
+                futures = [pool.submit(upload, lease.client, frame_path) for frame_path in frame_paths]
+            error = None
+            for future in futures:
+                try:
+                    files.append(future.result())
+                except Exception as e:
+                    error = error or e
+            for f in files:
+                key_pool.remember_file(f, lease.index)
+            if error is not None:
+                raise error
             
-        except Exception as e:
-            st.error(f"❌ Error generating reasoning: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(3)
-            else:
-                return None
+            pending = {i for i, f in enumerate(files) if f.state.name == "PROCESSING"}
+            with ui.spinner(f"⏳ Waiting for Gemini to process {len(pending)} frames..."), \
+                    metrics.timer("processing_wait"):
+                while pending:
+                    time.sleep(1)
+                    for i in list(pending):
+                        files[i] = lease.client.get_file(files[i].name)
+                        if files[i].state.name != "PROCESSING":
+                            pending.discard(i)
+    except exceptions.ResourceExhausted:
+        # The lease has put the key in cooldown
+        ui.warning(f"⚠️ Rate limit hit on API key #{lease.index + 1} while uploading frames")
+        delete_remote_files(files)
+        return None
+    except Exception as e:
+        ui.error(f"❌ Frame upload error: {e}")
+        delete_remote_files(files)
+        return None
     
-    return None
+    failed = [f for f in files if f.state.name != "ACTIVE"]
+    if failed:
+        ui.error(f"❌ {len(failed)} frames failed processing (e.g. state {failed[0].state.name})")
+        delete_remote_files(files)
+        return None
+    return files
+
+def delete_remote_files(remote_files):
+    """Queue temporary remote files (e.g. uploaded frames) for deletion on their keys"""
+    for remote_file in remote_files:
+        cleanup_gemini_file(remote_file.name, key_pool.key_of(remote_file))
+
+def frames_input_hash(frame_paths, input_mode):
+    """Identity of the frames input: their content plus how they are sent"""
+    tag = input_mode
+    if input_mode == "frames-inline":
+        tag += f"-{INLINE_FRAME_MAX_SIDE}-{INLINE_FRAME_JPEG_QUALITY}-{INLINE_REQUEST_BYTES}"
+    return f"{frames_content_hash(frame_paths)}-{tag}"
+
+def record_input_timing(video_id, timings):
+    """Log how long an input mode took and append it to the timings file, for comparing modes per video"""
+    logger.info(f"⏱️ {video_id} via {timings['input']}: prepare {timings['prepare_s']:.1f}s + "
+                f"generate {timings['generate_s']:.1f}s")
+    append_jsonl(CACHE_DIR / INPUT_TIMINGS_NAME, {
+        "video_id": video_id,
+        **{k: round(v, 3) if isinstance(v, float) else v for k, v in timings.items()},
+        "time": datetime.now().isoformat(timespec="seconds"),
+    })
+
+def generate_reasoning_from_frames(entry, frame_paths, override_label=None, input_mode="frames-inline",
+                                   use_cache=True):
+    """
+    Frames-mode reasoning over already extracted frame_paths, sent inline or as concurrent uploads.
+    Returns (reasoning or None, timings) where timings splits prepare (encode/upload) and generate time.
+    """
+    ui = status_sink()
+    timings = {"input": input_mode, "prepare_s": 0.0, "generate_s": 0.0, "frames": len(frame_paths)}
+    content_hash = frames_input_hash(frame_paths, input_mode)
+    if use_cache:
+        reasoning = cached_reasoning(entry, content_hash, override_label, media="frames")
+        if reasoning is not None:
+            ui.success("♻️ Using cached response")
+            return reasoning, timings
+    
+    start = time.perf_counter()
+    if input_mode == "frames-inline":
+        with metrics.timer("frames_encode"):
+            parts = inline_frame_parts(frame_paths)
+        timings["bytes"] = sum(len(part["data"]) for part in parts)
+        if len(parts) < len(frame_paths):
+            ui.info(f"🖼️ Sending {len(parts)} of {len(frame_paths)} frames to stay within the request size limit")
+    else:
+        parts = upload_frames_to_gemini(frame_paths)
+        if not parts:
+            return None, timings
+    timings["prepare_s"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    try:
+        reasoning = generate_reasoning_with_frames(entry, parts, override_label=override_label,
+                                                   content_hash=content_hash, use_cache=False)
+    finally:
+        if input_mode == "frames-upload":
+            delete_remote_files(parts)
+    timings["generate_s"] = time.perf_counter() - start
+    return reasoning, timings
+
+REASONING_MEDIA = {
+    "video": ("this video", "video"),
+    "frames": ("these video frames", "frames"),
+}
 
-def generate_reasoning_with_frames(entry, frame_files, model, override_label=None):
-    """Generate AI reasoning using uploaded frame files"""
+def build_reasoning_prompt(entry, override_label=None, media="video"):
+    """Render the prosecutor (Scam) or defender (Legit) prompt for a video or its frames"""
+    subject, noun = REASONING_MEDIA[media]
     
     # Logic: If user selected a button, use that. Otherwise, check metadata loosely.
-    if override_label:
-        is_scam = (override_label == "Scam")
-    else:
-        raw_label = str(entry.get("label", "")).strip().lower()
-        is_scam = "scam" in raw_label
+    is_scam = resolve_label(entry, override_label) == "Scam"
 
     title = entry.get("title", "No Title")
     desc = entry.get("description", "No Description")
 
     if is_scam:
         # Aggressive PROSECUTOR prompt
-        prompt = f"""Task: Analyze these video frames, Title, and Description.
+        prompt = f"""Task: Analyze {subject}, Title, and Description.
         
 Metadata Title: "{title}"
 Metadata Description: "{desc}"
 
 This content is a SCAM. 
-Explain WHY the frames, Title, and Description are deceptive based on these criteria:
+Explain WHY the {noun}, Title, and Description are deceptive based on these criteria:
 {SCAM_CRITERIA_TEXT}
 
 Your Output:
 Provide a clear, detailed explanation of the deception found in the visual content and metadata. Be direct.(3-4 Sentences)"""
     else:
         # DEFENDER prompt
-        prompt = f"""Task: Analyze these video frames, Title, and Description.
+        prompt = f"""Task: Analyze {subject}, Title, and Description.
 
 Metadata Title: "{title}"
 Metadata Description: "{desc}"
 
 This content has been identified as NON-SCAM (Legitimate).
-Explain WHY the frames, Title, and Description appear safe and legitimate.
+Explain WHY the {noun}, Title, and Description appear safe and legitimate.
 
 Your Output:
 Provide a brief summary emphasizing the legitimate nature of the content.(3-4 Sentences)"""
 
-    class ReasoningResponse(typing.TypedDict):
-        reasoning: str
+    return prompt
+
+def _generate_reasoning(content, key_index=None, cache_key=None, use_cache=True):
+    """
+    The generate loop shared by the video and frames inputs: the cached response for cache_key
+    (unless use_cache is False), else generate_with_deadline(content) on key_index with retries
+    and backoff, caching the answer under cache_key. Returns the reasoning, or None.
+    """
+    ui = status_sink()
+    if cache_key and use_cache:
+        cached = get_response_cache().get(cache_key)
+        if cached is not None:
+            ui.success("♻️ Using cached response")
+            return cached
 
     max_retries = 3
     for attempt in range(max_retries):
+        if attempt:
+            metrics.incr("retries")
         try:
-            # Build content list with prompt and all frame files
-            content = [prompt] + frame_files
-            
-            response = model.generate_content(
-                content,
-                generation_config=genai.GenerationConfig(
-                    response_mime_type="application/json",
-                    response_schema=ReasoningResponse
-                )
-            )
-            return json.loads(response.text)["reasoning"]
+            response = generate_with_deadline(content, key_index=key_index)
+            reasoning = json.loads(response.text)["reasoning"]
+            if cache_key:
+                get_response_cache().put(cache_key, reasoning)
+            return reasoning
             
         except exceptions.ResourceExhausted:
-            st.warning(f"⚠️ Rate limit hit (attempt {attempt + 1})")
-            key_num = switch_api_key()
-            st.info(f"🔄 Switched to API key #{key_num}")
-            model = st.session_state.model
-            time.sleep(2)
+            # The key is now cooling down; the next lease waits for it to recover
+            ui.warning(f"⚠️ Rate limit hit (attempt {attempt + 1})")
+            time.sleep(backoff_delay(attempt))
+            
+        except exceptions.DeadlineExceeded:
+            ui.warning(f"⏱️ No response within {GENERATE_TIMEOUT_S:.0f}s. Retrying... (attempt {attempt + 1})")
             
         except exceptions.InternalServerError:
-            st.warning(f"⚠️ Server error. Retrying in 5s... (attempt {attempt + 1})")
-            time.sleep(5)
+            delay = backoff_delay(attempt, base=2.0)
+            ui.warning(f"⚠️ Server error. Retrying in {delay:.1f}s... (attempt {attempt + 1})")
+            time.sleep(delay)
             
         except Exception as e:
-            st.error(f"❌ Error generating reasoning: {e}")
+            ui.error(f"❌ Error generating reasoning: {e}")
             if attempt < max_retries - 1:
-                time.sleep(3)
+                time.sleep(backoff_delay(attempt))
             else:
                 return None
     
     return None
 
+def generate_reasoning_with_video(entry, video_file, override_label=None, content_hash=None, use_cache=True):
+    """
+    Generate AI reasoning using uploaded video file (on the key that uploaded it).
+    With content_hash (of the local video) the response is cached; use_cache=False skips the lookup.
+    """
+    prompt = build_reasoning_prompt(entry, override_label, media="video")
+    cache_key = reasoning_cache_key(content_hash, prompt) if content_hash else None
+    # Uploaded files are only visible to their own key, so wait for that key's quota
+    return _generate_reasoning([prompt, video_file], key_pool.key_of(video_file), cache_key, use_cache)
+
+def generate_reasoning_with_frames(entry, frame_files, override_label=None, content_hash=None, use_cache=True):
+    """
+    Generate AI reasoning using uploaded frame files (on the key that uploaded them) or inline image parts.
+    With content_hash (of the local frames) the response is cached; use_cache=False skips the lookup.
+    """
+    prompt = build_reasoning_prompt(entry, override_label, media="frames")
+    cache_key = reasoning_cache_key(content_hash, prompt) if content_hash else None
+    # Uploaded frames must run on their key; inline parts (dicts) can run on any
+    key_index = None
+    if frame_files and not isinstance(frame_files[0], dict):
+        key_index = key_pool.key_of(frame_files[0])
+    return _generate_reasoning([prompt] + frame_files, key_index, cache_key, use_cache)
+
 # === DATA LOADING FUNCTIONS ===
 
+def metadata_sources(path_str):
+    """Metadata files to read: the file itself, or the *.json/*.jsonl files in a folder (sorted)"""
+    path = Path(path_str)
+    if path.is_file():
+        return [path]
+    if path.is_dir():
+        return sorted(list(path.glob("*.json")) + list(path.glob("*.jsonl")))
+    return []
+
+def scan_metadata_file(json_file):
+    """
+    Yield (record, byte_offset, byte_length) for every metadata record in a file: a single
+    object, a list of objects, or JSON Lines. Offsets let a record be re-read on its own later.
+    """
+    raw = Path(json_file).read_bytes()
+    text = raw.decode('utf-8')
+    stripped = text.lstrip()
+    decoder = json.JSONDecoder()
+    
+    if stripped.startswith("["):
+        # Walk the array with raw_decode, converting character positions to byte offsets
+        # incrementally (UTF-8 titles make them differ)
+        pos = len(text) - len(stripped) + 1
+        byte_pos = len(text[:pos].encode('utf-8'))
+        while True:
+            skip = pos
+            while skip < len(text) and text[skip] in " \t\r\n,":
+                skip += 1
+            byte_pos += len(text[pos:skip].encode('utf-8'))
+            pos = skip
+            if pos >= len(text) or text[pos] == "]":
+                return
+            record, end = decoder.raw_decode(text, pos)
+            length = len(text[pos:end].encode('utf-8'))
+            if isinstance(record, dict):
+                yield record, byte_pos, length
+            byte_pos += length
+            pos = end
+    
+    try:
+        record = json.loads(text)
+        if isinstance(record, dict):
+            yield record, 0, len(raw)
+        return
+    except json.JSONDecodeError:
+        pass
+    
+    # JSON Lines
+    offset = 0
+    for line in raw.splitlines(keepends=True):
+        if line.strip():
+            yield json.loads(line), offset, len(line)
+        offset += len(line)
+
 def load_metadata(path_str):
     """Load metadata from JSON files"""
-    path = Path(path_str)
     all_data = []
     
-    files_to_process = []
-    if path.is_file():
-        files_to_process.append(path)
-    elif path.is_dir():
-        files_to_process.extend(path.glob("*.json"))
-    
-    for json_file in files_to_process:
+    for json_file in metadata_sources(path_str):
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                    if isinstance(data, dict):
-                        all_data.append(data)
-                    elif isinstance(data, list):
-                        all_data.extend(data)
-                except json.JSONDecodeError:
-                    f.seek(0)
-                    for line in f:
-                        if line.strip():
-                            all_data.append(json.loads(line))
+            all_data.extend(record for record, _, _ in scan_metadata_file(json_file))
         except Exception as e:
-            st.error(f"Error reading {json_file}: {e}")
+            status_sink().error(f"Error reading {json_file}: {e}")
 
     return all_data
 
-def get_video_files(video_dir):
-    """Get all video files from directory"""
-    video_dir = Path(video_dir)
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+# Directories modified this recently may still change within the same mtime tick; don't trust them next time
+DIR_MTIME_SETTLE_NS = 2 * 10**9
+
+def video_index_path(video_dir):
+    digest = hashlib.sha1(str(Path(video_dir).resolve()).encode('utf-8')).hexdigest()[:12]
+    return CACHE_DIR / f"videos-{digest}.json"
+
+def scan_video_tree(video_dir, index_path=None):
+    """
+    Walk video_dir once with os.scandir and return ({stem: Path}, {stem: [duplicate Paths]}).
+    Each directory's listing is persisted with its mtime; directories whose mtime is unchanged
+    since the last scan are not re-listed (a file added/removed/renamed bumps its parent's mtime).
+    Files are visited in sorted path order and the first path for a stem wins.
+    """
+    root = str(Path(video_dir).resolve())
+    index_path = Path(index_path) if index_path else video_index_path(root)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get("root") != root:
+            cached = {}
+    except (OSError, json.JSONDecodeError):
+        cached = {}
+    cached_dirs = cached.get("dirs", {})
+    
+    dirs = {}
+    changed = False
+    now_ns = time.time_ns()
+    stack = [root]
+    while stack:
+        dir_path = stack.pop()
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            changed = True
+            continue
+        listing = cached_dirs.get(dir_path)
+        if listing is None or listing["mtime_ns"] != mtime_ns:
+            videos, subdirs = [], []
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.name)
+                            elif entry.name.lower().endswith(VIDEO_EXTENSIONS) and entry.is_file():
+                                videos.append(entry.name)
+                        except OSError:
+                            continue
+            except OSError:
+                changed = True
+                continue
+            settled = now_ns - mtime_ns > DIR_MTIME_SETTLE_NS
+            listing = {"mtime_ns": mtime_ns if settled else None,
+                       "videos": sorted(videos), "subdirs": sorted(subdirs)}
+            changed = True
+        dirs[dir_path] = listing
+        # Reversed so the stack pops subdirectories in sorted order
+        stack.extend(os.path.join(dir_path, name) for name in reversed(listing["subdirs"]))
+    changed = changed or dirs.keys() != cached_dirs.keys()
+    
+    if changed:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = index_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"root": root, "dirs": dirs}, f)
+        os.replace(tmp_path, index_path)
+    
     video_files = {}
-    for ext in ['*.mp4', '*.avi', '*.mov', '*.mkv']:
-        for f in video_dir.rglob(ext):
-            video_files[f.stem] = f
+    duplicates = {}
+    for dir_path in sorted(dirs):
+        for name in dirs[dir_path]["videos"]:
+            path = Path(dir_path) / name
+            if path.stem in video_files:
+                duplicates.setdefault(path.stem, [video_files[path.stem]]).append(path)
+            else:
+                video_files[path.stem] = path
+    return video_files, duplicates
+
+def get_video_files(video_dir):
+    """Get all video files from directory (stem -> Path), reporting duplicate stems"""
+    ui = status_sink()
+    video_files, duplicates = scan_video_tree(video_dir)
+    if duplicates:
+        examples = "; ".join(
+            f"{stem}: " + ", ".join(str(p) for p in paths)
+            for stem, paths in list(duplicates.items())[:5]
+        )
+        ui.warning(f"⚠️ {len(duplicates)} video IDs match more than one file; using the first of each ({examples})")
     return video_files
 
+def append_jsonl(path, record):
+    """Append one JSON line and fsync it, so an acknowledged record survives a crash"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def iter_jsonl(path):
+    """Stream records from a JSONL file, skipping blank lines and a torn last line"""
+    if not path or not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def iter_json_array(path, chunk_size=1 << 16):
+    """Stream the elements of a top-level JSON array file without loading the whole list"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} is not a JSON array")
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+
+def journal_path_for(output_path):
+    """Journal of accepted annotations for an output file: out.json -> out.journal.jsonl"""
+    return Path(output_path).with_suffix(".journal.jsonl")
+
 def load_existing_data(output_path):
-    """Load existing annotated data"""
+    """
+    Stream the output JSON and its journal and return the set of annotated ids.
+    Records are never held in memory together.
+    """
+    processed_ids = set()
     if os.path.exists(output_path):
         try:
-            with open(output_path, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
-                processed_ids = {x['id'] for x in existing_data}
-                return existing_data, processed_ids
-        except:
-            return [], set()
-    return [], set()
-
-def save_training_data(output_path, data):
-    """Save training data to JSON file"""
+            processed_ids.update(x['id'] for x in iter_json_array(output_path))
+        except Exception as e:
+            status_sink().error(f"Error reading {output_path}: {e}")
+    processed_ids.update(x['id'] for x in iter_jsonl(journal_path_for(output_path)))
+    return processed_ids
+
+def save_training_data(output_path, sft_entry):
+    """Append one SFT entry to the output's journal (O(1), fsync'd); compaction writes the JSON"""
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        with metrics.timer("save"):
+            append_jsonl(journal_path_for(output_path), sft_entry)
         return True
     except Exception as e:
-        st.error(f"Error saving data: {e}")
+        status_sink().error(f"Error saving data: {e}")
         return False
 
+def compact_training_data(output_path):
+    """
+    Fold the journal into the output JSON (same list-of-entries format as before, indent=2)
+    and empty the journal. A journal entry replaces an existing entry with the same id.
+    The new JSON is written to a temp file, fsync'd and renamed over the old one, and the
+    journal is only truncated afterwards, so a crash at any point loses nothing; replaying
+    a journal that was already folded in is harmless. Returns the number of entries
+    written, or 0 when the journal is empty and the output is left untouched.
+    """
+    output_path = Path(output_path)
+    journal_path = journal_path_for(output_path)
+    journal = {x['id']: x for x in iter_jsonl(journal_path)}
+    if not journal:
+        return 0
+    start = time.perf_counter()
+    
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        def write_entry(entry):
+            nonlocal count
+            text = json.dumps(entry, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+            out.write(("[\n  " if count == 0 else ",\n  ") + text)
+            count += 1
+        
+        if output_path.exists():
+            for entry in iter_json_array(output_path):
+                if entry['id'] not in journal:
+                    write_entry(entry)
+        for entry in journal.values():
+            write_entry(entry)
+        out.write("\n]" if count else "[]")
+        out.flush()
+        os.fsync(out.fileno())
+    
+    os.replace(tmp_path, output_path)
+    with open(journal_path, 'w', encoding='utf-8') as f:
+        f.flush()
+        os.fsync(f.fileno())
+    metrics.observe("compact", time.perf_counter() - start)
+    return count
+
+# === METADATA INDEX ===
+
+class MetadataIndex:
+    """
+    On-disk SQLite index over the metadata files, keyed by video_id.
+    Each record keeps its label and its byte range in the source file; titles/descriptions
+    are only read (load_entry) for the record being shown. Sources are re-scanned only when
+    their size/mtime change. Records are ordered by (source path, position in file); that pair is the cursor.
+    The index file is shared by every process using the metadata path, but which videos are on
+    disk and which are annotated depend on the caller's folders: those flags live in TEMP tables
+    of this instance's own connection, so open one instance per caller.
+    """
+    
+    def __init__(self, metadata_path, db_path=None):
+        self.metadata_path = str(Path(metadata_path).resolve())
+        if db_path is None:
+            digest = hashlib.sha1(self.metadata_path.encode('utf-8')).hexdigest()[:12]
+            db_path = CACHE_DIR / f"metadata-{digest}.sqlite3"
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = Path(db_path)
+        # Streamlit reruns can land on different threads; the lock serializes access
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);
+            CREATE TABLE IF NOT EXISTS entries (
+                source TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                video_id TEXT,
+                label TEXT,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (source, position)
+            );
+            CREATE INDEX IF NOT EXISTS entries_video_id ON entries(video_id);
+            CREATE TEMP TABLE has_video (video_id TEXT PRIMARY KEY);
+            CREATE TEMP TABLE annotated (video_id TEXT PRIMARY KEY);
+        """)
+    
+    def refresh(self):
+        """Re-scan new or changed metadata files and drop vanished ones; returns how many were scanned"""
+        ui = status_sink()
+        sources = {str(p.resolve()): p for p in metadata_sources(self.metadata_path)}
+        scanned = 0
+        with self._lock, self._db:
+            known = {row[0]: (row[1], row[2]) for row in self._db.execute("SELECT path, size, mtime_ns FROM sources")}
+            for path in set(known) - set(sources):
+                self._db.execute("DELETE FROM entries WHERE source = ?", (path,))
+                self._db.execute("DELETE FROM sources WHERE path = ?", (path,))
+            
+            for path, source in sources.items():
+                stat = source.stat()
+                if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                self._db.execute("DELETE FROM entries WHERE source = ?", (path,))
+                try:
+                    # Records without a video_id can't be matched to a video; skip them as load_metadata did
+                    rows = [
+                        (path, position, record["video_id"], str(record.get("label", "")), offset, length)
+                        for position, (record, offset, length) in enumerate(scan_metadata_file(source))
+                        if record.get("video_id") is not None
+                    ]
+                except Exception as e:
+                    ui.error(f"Error reading {source}: {e}")
+                    continue
+                self._db.executemany(
+                    "INSERT INTO entries (source, position, video_id, label, offset, length) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                                 (path, stat.st_size, stat.st_mtime_ns))
+                scanned += 1
+        return scanned
+    
+    def _set_flag(self, table, video_ids):
+        with self._lock, self._db:
+            self._db.execute(f"DELETE FROM temp.{table}")
+            self._db.executemany(f"INSERT OR IGNORE INTO temp.{table} VALUES (?)", ((v,) for v in video_ids))
+    
+    def set_available_videos(self, video_ids):
+        """Flag exactly the records whose video_id is in video_ids as having a video on disk"""
+        self._set_flag("has_video", video_ids)
+    
+    def set_annotated(self, video_ids):
+        """Flag exactly the records whose video_id is in video_ids as annotated"""
+        self._set_flag("annotated", video_ids)
+    
+    def mark_annotated(self, video_id):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO temp.annotated VALUES (?)", (video_id,))
+    
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    
+    def pending(self, cursor=None, limit=1, inclusive=True):
+        """
+        Unannotated records with a video on disk, in order, starting at cursor (or after it
+        if not inclusive). Returns (source, position, video_id, label, offset, length) rows.
+        """
+        # A NULL video_id (indexes built before such records were skipped) is never IN has_video
+        query = ("SELECT source, position, video_id, label, offset, length FROM entries "
+                 "WHERE video_id IN (SELECT video_id FROM temp.has_video) "
+                 "AND video_id NOT IN (SELECT video_id FROM temp.annotated)")
+        params = []
+        if cursor is not None:
+            query += f" AND (source, position) {'>=' if inclusive else '>'} (?, ?)"
+            params.extend(cursor)
+        query += " ORDER BY source, position"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self._db.execute(query, params).fetchall()
+    
+    def next_pending(self, cursor=None, inclusive=True):
+        rows = self.pending(cursor, 1, inclusive)
+        return rows[0] if rows else None
+    
+    @staticmethod
+    def load_entry(row):
+        """Read one record's full metadata from its source file"""
+        source, _, _, _, offset, length = row
+        with open(source, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+    
+    @staticmethod
+    def cursor_of(row):
+        return (row[0], row[1])
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def open_metadata_index(metadata_path, video_files, processed_ids):
+    """
+    Open (and incrementally refresh) the index for metadata_path and set this caller's flags.
+    Each call returns its own instance: the records are shared on disk, the flags are not.
+    """
+    index = MetadataIndex(metadata_path)
+    index.refresh()
+    index.set_available_videos(video_id for video_id, path in video_files.items())
+    index.set_annotated(processed_ids)
+    return index
+
+# === WORK QUEUE ===
+
+def queue_path_for(output_path):
+    """Work queue shared by everyone writing an output file: out.json -> out.queue.sqlite3"""
+    return Path(output_path).with_suffix(".queue.sqlite3")
+
+def local_holder_id():
+    """Random id for this machine's cache folder, created on first use and kept across restarts"""
+    id_path = CACHE_DIR / HOLDER_ID_NAME
+    try:
+        return id_path.read_text(encoding='utf-8').strip()
+    except FileNotFoundError:
+        pass
+    id_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = id_path.with_name(f".{HOLDER_ID_NAME}.{uuid.uuid4().hex[:8]}.tmp")
+    tmp_path.write_text(uuid.uuid4().hex, encoding='utf-8')
+    try:
+        # link() fails if another process created the id first; everyone then reads the winner's
+        os.link(tmp_path, id_path)
+    except FileExistsError:
+        pass
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return id_path.read_text(encoding='utf-8').strip()
+
+def lease_holder_for(annotator):
+    """
+    Lease holder for an annotator on this machine. Sessions of the same annotator share it,
+    so a browser reload or app restart reclaims their leases instead of waiting out LEASE_TTL_S.
+    """
+    return f"{annotator}@{local_holder_id()}"
+
+def shared_work_queue(output_path):
+    """The process-wide WorkQueue for output_path (sessions tell their leases apart by holder)"""
+    return shared_work_queue_at(queue_path_for(output_path))
+
+def shared_work_queue_at(path):
+    """The process-wide WorkQueue stored at path"""
+    return process_resource(f"work_queue:{Path(path).resolve()}", lambda: WorkQueue(path))
+
+class WorkQueue:
+    """
+    Shared SQLite work queue for several annotators (sessions or processes) on one output.
+    claim() hands a video_id to one holder (a session) until its lease expires; complete()
+    appends the SFT entry to the output journal and records the completion in one write
+    transaction, so two annotators can never both save the same video. exclusive() is the
+    cross-process write lock; compaction runs under it so no append is lost mid-fold.
+    """
+    
+    def __init__(self, path, ttl_s=LEASE_TTL_S):
+        self.path = Path(path)
+        self.ttl_s = ttl_s
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode: exclusive() issues BEGIN IMMEDIATE itself; waits up to 2 min for the lock
+        self._db = sqlite3.connect(str(self.path), timeout=120, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self.exclusive() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS leases (
+                video_id TEXT PRIMARY KEY, holder TEXT NOT NULL, annotator TEXT, expires_at REAL NOT NULL)""")
+            db.execute("""CREATE TABLE IF NOT EXISTS completions (
+                video_id TEXT PRIMARY KEY, holder TEXT, annotator TEXT, completed_at REAL NOT NULL)""")
+    
+    @contextlib.contextmanager
+    def exclusive(self):
+        """Hold the queue's write lock (across processes) for a block; commits on exit, rolls back on error"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+    
+    def claim(self, video_id, holder, annotator=None):
+        """
+        Lease video_id to holder (or extend holder's lease). False if it is completed or
+        another holder's lease on it is still live.
+        """
+        now = time.time()
+        with self.exclusive() as db:
+            done = db.execute("SELECT holder FROM completions WHERE video_id = ?", (video_id,)).fetchone()
+            if done is not None:
+                return False
+            lease = db.execute("SELECT holder, expires_at FROM leases WHERE video_id = ?", (video_id,)).fetchone()
+            if lease is not None and lease[0] != holder and lease[1] > now:
+                return False
+            db.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?)",
+                       (video_id, holder, annotator, now + self.ttl_s))
+            return True
+    
+    def release(self, video_id, holder):
+        with self.exclusive() as db:
+            db.execute("DELETE FROM leases WHERE video_id = ? AND holder = ?", (video_id, holder))
+    
+    def complete(self, video_id, holder, annotator, output_path, sft_entry):
+        """
+        Save sft_entry and mark video_id done, atomically. Returns 'saved', 'duplicate'
+        (another holder completed it first; nothing is written) or 'failed'.
+        Re-saving a video this holder already completed replaces the entry on compaction.
+        """
+        with self.exclusive() as db:
+            done = db.execute("SELECT holder FROM completions WHERE video_id = ?", (video_id,)).fetchone()
+            if done is not None and done[0] != holder:
+                return "duplicate"
+            if not save_training_data(output_path, sft_entry):
+                return "failed"
+            db.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                       (video_id, holder, annotator, time.time()))
+            db.execute("DELETE FROM leases WHERE video_id = ?", (video_id,))
+            return "saved"
+    
+    def completed_by(self, video_id):
+        with self._lock:
+            row = self._db.execute("SELECT annotator FROM completions WHERE video_id = ?", (video_id,)).fetchone()
+        return row[0] if row else None
+    
+    def sync_completed(self, video_ids):
+        """Record ids already in the output (saved before the queue existed, or by the batch tooling) as done"""
+        with self.exclusive() as db:
+            db.executemany("INSERT OR IGNORE INTO completions (video_id, completed_at) VALUES (?, ?)",
+                           ((video_id, time.time()) for video_id in video_ids))
+    
+    def completed_ids(self):
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT video_id FROM completions")}
+    
+    def unavailable_ids(self, holder):
+        """Videos other holders have completed or hold a live lease on (prefetch skips these)"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT video_id FROM completions WHERE holder IS NULL OR holder != ? "
+                "UNION SELECT video_id FROM leases WHERE holder != ? AND expires_at > ?",
+                (holder, holder, time.time())
+            ).fetchall()
+        return {row[0] for row in rows}
+    
+    def stats(self):
+        with self._lock:
+            completed = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            leased, annotators = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT annotator) FROM leases WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+        return {"completed": completed, "leased": leased, "annotators": annotators}
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+# === DRAFT PIPELINE ===
+
+def resolve_label(entry, override=None):
+    """The forced perspective if one was selected, otherwise the metadata label read loosely"""
+    if override:
+        return override
+    raw_label = str(entry.get("label", "")).strip().lower()
+    return "Scam" if "scam" in raw_label else "Legit"
+
+def format_response(reasoning, final_label):
+    """Prefix the reasoning with the answer, e.g. 'Yes. [Reasoning]' or 'No. [Reasoning]'"""
+    prefix = "Yes" if final_label == "Scam" else "No"
+    return f"{prefix}. {reasoning}"
+
+class DraftCancelled(Exception):
+    """Raised between pipeline stages once a draft's cancel event is set"""
+
+def build_draft(entry, video_path, frames_dir, override=None, image_format=DEFAULT_FRAME_FORMAT,
+                quality=None, cancelled=None, use_cache=True, dedup_threshold=0,
+                sampling=DEFAULT_SAMPLING, frame_budget=SCENE_FRAME_BUDGET, proxy=False,
+                input_mode=DEFAULT_REASONING_INPUT, resize=DEFAULT_RESIZE, resize_size=DEFAULT_RESIZE_SIZE):
+    """
+    Upload → wait for ACTIVE → generate reasoning → extract frames for one metadata entry,
+    without touching session state. cancelled is an optional threading.Event checked
+    between stages. A cached response skips the upload (use_cache=False always generates).
+    In the frames input modes, frames are extracted first and sent instead of the video.
+    Returns a draft dict (error is None on success).
+    """
+    video_id = entry.get("video_id")
+    with metrics.video(video_id, "draft"):
+        draft = {
+            "video_id": video_id,
+            "override": override,
+            "label": resolve_label(entry, override),
+            "response": None,
+            "frame_files": [],
+            "gemini_file": None,
+            "error": None,
+        }
+        
+        def check_cancelled():
+            if cancelled is not None and cancelled.is_set():
+                raise DraftCancelled(video_id)
+        
+        if input_mode != "video":
+            check_cancelled()
+            draft["frame_files"] = extract_frames_cached(video_path, frames_dir, video_id, image_format, quality,
+                                                         dedup_threshold, sampling, frame_budget,
+                                                         resize, resize_size)
+            if not draft["frame_files"]:
+                draft["error"] = "frame extraction failed"
+                return draft
+            
+            check_cancelled()
+            reasoning, timings = generate_reasoning_from_frames(entry, draft["frame_files"], override,
+                                                                input_mode, use_cache)
+            if timings["generate_s"]:
+                record_input_timing(video_id, timings)
+            if not reasoning:
+                draft["error"] = "generation failed"
+                return draft
+            draft["response"] = format_response(reasoning, draft["label"])
+            return draft
+        
+        check_cancelled()
+        content_hash = video_input_hash(video_path, proxy)
+        reasoning = cached_reasoning(entry, content_hash, override) if use_cache else None
+        if reasoning is None:
+            start = time.perf_counter()
+            gemini_file = upload_video_to_gemini(video_path, proxy=proxy)
+            if not gemini_file:
+                draft["error"] = "upload failed"
+                return draft
+            draft["gemini_file"] = gemini_file
+            prepare_s = time.perf_counter() - start
+            
+            check_cancelled()
+            start = time.perf_counter()
+            reasoning = generate_reasoning_with_video(entry, gemini_file, override_label=override,
+                                                      content_hash=content_hash, use_cache=False)
+            record_input_timing(video_id, {"input": "video", "prepare_s": prepare_s,
+                                           "generate_s": time.perf_counter() - start})
+            if not reasoning:
+                draft["error"] = "generation failed"
+                return draft
+        draft["response"] = format_response(reasoning, draft["label"])
+        
+        check_cancelled()
+        draft["frame_files"] = extract_frames_cached(video_path, frames_dir, video_id, image_format, quality,
+                                                     dedup_threshold, sampling, frame_budget,
+                                                     resize, resize_size)
+        return draft
+
+class PrefetchPipeline:
+    """
+    Background workers that build drafts for the next videos while the annotator
+    works on the current one, so load_next_video usually finds a draft ready.
+    """
+    
+    def __init__(self, frames_dir, image_format=DEFAULT_FRAME_FORMAT, quality=None,
+                 ahead=PREFETCH_AHEAD, workers=PREFETCH_WORKERS, dedup_threshold=0,
+                 sampling=DEFAULT_SAMPLING, frame_budget=SCENE_FRAME_BUDGET, proxy=False,
+                 input_mode=DEFAULT_REASONING_INPUT, resize=DEFAULT_RESIZE, resize_size=DEFAULT_RESIZE_SIZE):
+        self.frames_dir = frames_dir
+        self.image_format = image_format
+        self.quality = quality
+        self.dedup_threshold = dedup_threshold
+        self.sampling = sampling
+        self.frame_budget = frame_budget
+        self.resize = resize
+        self.resize_size = resize_size
+        self.proxy = proxy
+        self.input_mode = input_mode
+        self.ahead = ahead
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="prefetch")
+        self._jobs = {}  # video_id -> (future, cancel event)
+        self._lock = threading.Lock()
+    
+    def _run(self, entry, video_path, override, cancelled):
+        try:
+            return build_draft(entry, video_path, self.frames_dir, override,
+                               self.image_format, self.quality, cancelled,
+                               dedup_threshold=self.dedup_threshold, sampling=self.sampling,
+                               frame_budget=self.frame_budget, proxy=self.proxy,
+                               input_mode=self.input_mode, resize=self.resize,
+                               resize_size=self.resize_size)
+        except DraftCancelled:
+            logger.info(f"Prefetch cancelled: {entry.get('video_id')}")
+            return None
+    
+    def schedule(self, upcoming, override=None):
+        """
+        Queue drafts for the first `ahead` (entry, video_path) pairs in upcoming that aren't
+        queued yet. Finished drafts that fell out of the window are dropped.
+        """
+        window = upcoming[:self.ahead]
+        window_ids = {entry.get("video_id") for entry, _ in window}
+        with self._lock:
+            for video_id in list(self._jobs):
+                future, _ = self._jobs[video_id]
+                if future.done() and video_id not in window_ids:
+                    del self._jobs[video_id]
+            
+            for entry, video_path in window:
+                video_id = entry.get("video_id")
+                if video_id in self._jobs:
+                    continue
+                cancelled = threading.Event()
+                future = self._pool.submit(self._run, entry, video_path, override, cancelled)
+                self._jobs[video_id] = (future, cancelled)
+    
+    def is_pending(self, video_id):
+        with self._lock:
+            job = self._jobs.get(video_id)
+        return job is not None and not job[0].done()
+    
+    def take(self, video_id, override=None):
+        """Pop the finished, successful draft for video_id generated with `override`, else None"""
+        with self._lock:
+            job = self._jobs.get(video_id)
+            if job is None or not job[0].done():
+                return None
+            del self._jobs[video_id]
+        
+        try:
+            draft = job[0].result()
+        except Exception as e:
+            logger.error(f"Prefetch failed for {video_id}: {e}")
+            return None
+        if draft is None or draft["error"] or draft["override"] != override:
+            return None
+        return draft
+    
+    def cancel(self, video_id):
+        """Cancel a queued draft, or stop a running one at its next stage boundary"""
+        with self._lock:
+            job = self._jobs.pop(video_id, None)
+        if job is not None:
+            job[1].set()
+            job[0].cancel()
+    
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for future, cancelled in jobs:
+            cancelled.set()
+            future.cancel()
+        self._pool.shutdown(wait=False)
+
+# === DRAFT STORE ===
+
+def draft_record(draft, video_path):
+    """JSON-serializable form of a build_draft result for the drafts file"""
+    return {
+        "video_id": draft["video_id"],
+        "video": Path(video_path).name,
+        "label": draft["label"],
+        "override": draft["override"],
+        "response": draft["response"],
+        "frames": draft["frame_files"],
+        "status": "failed" if draft["error"] else "ok",
+        "error": draft["error"],
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+
+def load_drafts(drafts_path):
+    """
+    Read a drafts JSONL file into {video_id: latest record}.
+    Lines are streamed, later records for a video replace earlier ones, and a torn
+    last line from an interrupted run is ignored.
+    """
+    return {record["video_id"]: record for record in iter_jsonl(drafts_path)}
+
+def append_draft(drafts_path, record):
+    """Append one draft record and flush it to disk"""
+    append_jsonl(drafts_path, record)
+
+# === DATASET EXPORT ===
+
+EXPORT_SHARD_BYTES = 256 * 1024 * 1024
+EXPORT_INDEX_NAME = "index.json"
+EXPORT_INDEX_VERSION = 1
+TAR_MEMBER_OVERHEAD = 1024  # tar header plus padding, for shard size estimates
+
+def iter_training_records(output_path):
+    """Stream the final SFT records: the output JSON plus its journal (a journal entry replaces the same id)"""
+    journal = {x['id']: x for x in iter_jsonl(journal_path_for(output_path))}
+    if os.path.exists(output_path):
+        for entry in iter_json_array(output_path):
+            if entry['id'] not in journal:
+                yield entry
+    yield from journal.values()
+
+def sample_key(video_id):
+    """WebDataset sample key for an id; loaders split key and extension at the first dot"""
+    return str(video_id).replace(".", "_")
+
+def new_export_index():
+    """Empty shard index"""
+    return {"version": EXPORT_INDEX_VERSION, "next_shard": 0, "shards": [], "samples": {}, "stale": {}}
+
+def load_export_index(dest_dir):
+    """Read a shard folder's index, or an empty one for a new export"""
+    try:
+        with open(Path(dest_dir) / EXPORT_INDEX_NAME, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") == EXPORT_INDEX_VERSION:
+            return index
+    except (OSError, json.JSONDecodeError):
+        pass
+    return new_export_index()
+
+def save_export_index(dest_dir, index):
+    """Write the shard index atomically; it is the export's resume checkpoint"""
+    index_path = Path(dest_dir) / EXPORT_INDEX_NAME
+    tmp_path = index_path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_path)
+
+def _write_shard(shard_path, samples):
+    """
+    Write one WebDataset-style tar shard. Each sample is <key>.json (the SFT record) followed by
+    its frames as <key>.0001.png, <key>.0002.png, ... in the record's "images" order.
+    Frame files are copied as-is, without decoding. Returns the shard size in bytes.
+    """
+    shard_path = Path(shard_path)
+    tmp_path = shard_path.with_name(shard_path.name + ".tmp")
+    with tarfile.open(tmp_path, "w", format=tarfile.PAX_FORMAT) as tar:
+        for record, frame_paths in samples:
+            key = sample_key(record["id"])
+            data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+            info = tarfile.TarInfo(f"{key}.json")
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+            for i, frame_path in enumerate(frame_paths, 1):
+                info = tar.gettarinfo(frame_path, arcname=f"{key}.{i:04d}{Path(frame_path).suffix.lower()}")
+                info.uid = info.gid = 0
+                info.uname = info.gname = ""
+                with open(frame_path, 'rb') as f:
+                    tar.addfile(info, f)
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, shard_path)
+    return shard_path.stat().st_size
+
+def export_dataset(output_path, frames_dir, dest_dir, shard_bytes=EXPORT_SHARD_BYTES, workers=None,
+                   rebuild=False):
+    """
+    Export saved annotations to size-bounded tar shards in dest_dir, written in parallel.
+    Incremental: index.json records which shard holds each id and a signature of the record
+    and its frames, so a rerun only writes new or changed samples into new shards. A changed
+    sample's old copy is listed under "stale" in the index for loaders to skip.
+    Records with missing frames are skipped (and retried on the next run).
+    Returns a summary dict.
+    """
+    frames_dir, dest_dir = Path(frames_dir), Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    index = load_export_index(dest_dir)
+    if rebuild:
+        for shard in index["shards"]:
+            (dest_dir / shard["name"]).unlink(missing_ok=True)
+        index = new_export_index()
+    
+    pending, missing, unchanged = [], [], 0
+    for record in iter_training_records(output_path):
+        frame_paths = [frames_dir / record["id"] / name for name in record.get("images", [])]
+        try:
+            stats = [p.stat() for p in frame_paths]
+        except OSError:
+            missing.append(record["id"])
+            continue
+        digest = hashlib.sha1(json.dumps(record, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        for p, s in zip(frame_paths, stats):
+            digest.update(f"{p.name}:{s.st_size}:{s.st_mtime_ns}".encode())
+        signature = digest.hexdigest()
+        known = index["samples"].get(record["id"])
+        if known and known["signature"] == signature:
+            unchanged += 1
+            continue
+        size = TAR_MEMBER_OVERHEAD * (len(stats) + 1) + sum(s.st_size for s in stats) + len(json.dumps(record))
+        pending.append((record, [str(p) for p in frame_paths], signature, size))
+    
+    # Pack samples into shards in output order, closing a shard before it passes shard_bytes
+    groups, current, current_size = [], [], 0
+    for item in pending:
+        if current and current_size + item[3] > shard_bytes:
+            groups.append(current)
+            current, current_size = [], 0
+        current.append(item)
+        current_size += item[3]
+    if current:
+        groups.append(current)
+    
+    first = index["next_shard"]
+    index["next_shard"] = first + len(groups)
+    save_export_index(dest_dir, index)
+    
+    written = total_bytes = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_write_shard, dest_dir / f"shard-{first + i:06d}.tar",
+                        [(record, paths) for record, paths, _, _ in group]): (f"shard-{first + i:06d}.tar", group)
+            for i, group in enumerate(groups)
+        }
+        for future in as_completed(futures):
+            name, group = futures[future]
+            size = future.result()
+            # Checkpoint each finished shard, so an interrupted export resumes with the rest
+            for record, _, signature, _ in group:
+                previous = index["samples"].get(record["id"])
+                if previous:
+                    index["stale"].setdefault(previous["shard"], []).append(record["id"])
+                index["samples"][record["id"]] = {"shard": name, "signature": signature}
+            index["shards"].append({"name": name, "samples": len(group), "bytes": size})
+            save_export_index(dest_dir, index)
+            written += len(group)
+            total_bytes += size
+            logger.info(f"{name}: {len(group)} samples, {size / 1e6:.1f} MB")
+    metrics.observe("export", time.perf_counter() - start)
+    
+    return {"shards": len(groups), "samples": written, "bytes": total_bytes,
+            "unchanged": unchanged, "missing": missing, "total_shards": len(index["shards"])}
+
 # === SESSION STATE ===
 
 def initialize_session_state():
     """Initialize all session state variables"""
-    if 'current_api_index' not in st.session_state:
-        st.session_state.current_api_index = 0
-        genai.configure(api_key=API_KEYS[0])
-        st.session_state.model = genai.GenerativeModel(MODEL_NAME)
+    if 'metadata_index' not in st.session_state:
+        st.session_state.metadata_index = None
     
-    if 'raw_data' not in st.session_state:
-        st.session_state.raw_data = []
+    if 'total_entries' not in st.session_state:
+        st.session_state.total_entries = 0
     
     if 'video_files' not in st.session_state:
         st.session_state.video_files = {}
     
-    if 'training_data' not in st.session_state:
-        st.session_state.training_data = []
+    if 'journal_appends' not in st.session_state:
+        st.session_state.journal_appends = 0
     
     if 'processed_ids' not in st.session_state:
         st.session_state.processed_ids = set()
     
-    if 'current_index' not in st.session_state:
-        st.session_state.current_index = 0
+    if 'cursor' not in st.session_state:
+        st.session_state.cursor = None  # (source, position) of the current metadata record
     
     if 'current_entry' not in st.session_state:
         st.session_state.current_entry = None
     
-    if 'current_video_file' not in st.session_state:
-        st.session_state.current_video_file = None
+    if 'current_video_file' not in st.session_state:
+        st.session_state.current_video_file = None
+    
+    if 'current_frame_files' not in st.session_state:
+        st.session_state.current_frame_files = []
+    
+    if 'ai_reasoning' not in st.session_state:
+        st.session_state.ai_reasoning = ""
+    
+    if 'skipped_count' not in st.session_state:
+        st.session_state.skipped_count = 0
+    
+    if 'output_path' not in st.session_state:
+        st.session_state.output_path = ""
+    
+    if 'frames_dir' not in st.session_state:
+        st.session_state.frames_dir = ""
+    
+    if 'frame_format' not in st.session_state:
+        st.session_state.frame_format = DEFAULT_FRAME_FORMAT
+    
+    if 'frame_quality' not in st.session_state:
+        st.session_state.frame_quality = None
+    
+    if 'frame_dedup_threshold' not in st.session_state:
+        st.session_state.frame_dedup_threshold = 0
+    
+    if 'frame_sampling' not in st.session_state:
+        st.session_state.frame_sampling = DEFAULT_SAMPLING
+    
+    if 'frame_budget' not in st.session_state:
+        st.session_state.frame_budget = SCENE_FRAME_BUDGET
+    
+    if 'frame_resize' not in st.session_state:
+        st.session_state.frame_resize = DEFAULT_RESIZE
+    
+    if 'frame_resize_size' not in st.session_state:
+        st.session_state.frame_resize_size = DEFAULT_RESIZE_SIZE
+    
+    if 'upload_proxy' not in st.session_state:
+        st.session_state.upload_proxy = False
+    
+    if 'reasoning_input' not in st.session_state:
+        st.session_state.reasoning_input = DEFAULT_REASONING_INPUT
+    
+    if 'pending_editor_text' not in st.session_state:
+        st.session_state.pending_editor_text = None
+    
+    if 'prefetcher' not in st.session_state:
+        st.session_state.prefetcher = None
+    
+    if 'drafts' not in st.session_state:
+        st.session_state.drafts = {}
+    
+    if 'cancel_prefetch_on_skip' not in st.session_state:
+        st.session_state.cancel_prefetch_on_skip = True
     
-    if 'current_frame_files' not in st.session_state:
-        st.session_state.current_frame_files = []
+    if 'work_queue' not in st.session_state:
+        st.session_state.work_queue = None
     
-    if 'gemini_files' not in st.session_state:
-        st.session_state.gemini_files = []
+    if 'frame_page' not in st.session_state:
+        st.session_state.frame_page = 0
     
-    if 'ai_reasoning' not in st.session_state:
-        st.session_state.ai_reasoning = ""
+    if 'zoom_frame' not in st.session_state:
+        st.session_state.zoom_frame = None  # frame shown at full resolution
     
-    if 'skipped_count' not in st.session_state:
-        st.session_state.skipped_count = 0
+    if 'annotator' not in st.session_state:
+        st.session_state.annotator = DEFAULT_ANNOTATOR
     
-    if 'output_path' not in st.session_state:
-        st.session_state.output_path = ""
+    if 'lease_holder' not in st.session_state:
+        # Stable per annotator and machine, so a reload or restart gets its own leases back
+        st.session_state.lease_holder = lease_holder_for(st.session_state.annotator)
     
-    if 'frames_dir' not in st.session_state:
-        st.session_state.frames_dir = ""
+    # Looked up again on every run, so a reset of the shared resources reaches every session
+    if st.session_state.work_queue is not None:
+        st.session_state.work_queue = shared_work_queue_at(st.session_state.work_queue.path)
 
-def load_next_video():
-    """Load next unprocessed video"""
-    while st.session_state.current_index < len(st.session_state.raw_data):
-        entry = st.session_state.raw_data[st.session_state.current_index]
-        video_id = entry.get("video_id")
-        
-        if video_id not in st.session_state.processed_ids:
+def selected_override():
+    """The "Force AI Perspective" choice, or None for Auto"""
+    choice = st.session_state.get('label_selector', "Auto")
+    return None if choice == "Auto" else choice
+
+def set_reasoning_text(text):
+    """
+    Set the response text. The editor widget can't be written once it has been drawn in
+    this run, so its new value is applied at the top of the next run.
+    """
+    st.session_state.ai_reasoning = text
+    st.session_state.pending_editor_text = text
+
+def output_lock():
+    """The work queue's write lock for compacting the output (a no-op before data is loaded)"""
+    queue = st.session_state.work_queue
+    return queue.exclusive() if queue is not None else contextlib.nullcontext()
+
+def claim_video(video_id):
+    """Lease video_id to this session; True if no other annotator has it (always True without a queue)"""
+    queue = st.session_state.work_queue
+    if queue is None:
+        return True
+    return queue.claim(video_id, st.session_state.lease_holder, st.session_state.annotator)
+
+def release_current_video():
+    """Give the current video's lease back, e.g. on Skip"""
+    queue = st.session_state.work_queue
+    entry = st.session_state.current_entry
+    if queue is not None and entry is not None:
+        queue.release(entry.get("video_id"), st.session_state.lease_holder)
+
+def upcoming_videos(cursor, limit):
+    """
+    Up to `limit` (entry, video_path) pairs from cursor on that are unprocessed, on disk,
+    not already drafted by a batch run and not leased or completed by another annotator
+    """
+    index = st.session_state.metadata_index
+    queue = st.session_state.work_queue
+    taken = queue.unavailable_ids(st.session_state.lease_holder) if queue is not None else set()
+    upcoming = []
+    inclusive = True
+    while index is not None and len(upcoming) < limit:
+        rows = index.pending(cursor, limit, inclusive)
+        if not rows:
+            break
+        for row in rows:
+            video_id = row[2]
+            if st.session_state.drafts.get(video_id, {}).get("status") == "ok" or video_id in taken:
+                continue
             video_file = st.session_state.video_files.get(video_id)
-            
             if video_file and video_file.exists():
-                st.session_state.current_entry = entry
-                st.session_state.current_video_file = video_file
-                st.session_state.current_frame_files = []
-                st.session_state.gemini_files = []
-                st.session_state.ai_reasoning = ""
-                return
+                upcoming.append((index.load_entry(row), video_file))
+                if len(upcoming) >= limit:
+                    break
+        cursor, inclusive = index.cursor_of(rows[-1]), False
+    return upcoming
+
+def schedule_prefetch():
+    """Top up the background prefetch window starting at the current video"""
+    prefetcher = st.session_state.prefetcher
+    if prefetcher is None or prefetcher.ahead <= 0:
+        return
+    upcoming = upcoming_videos(st.session_state.cursor, prefetcher.ahead)
+    prefetcher.schedule(upcoming, override=selected_override())
+
+def apply_batch_draft():
+    """Load the batch (drafts file) draft for the current video into the editor if there is one"""
+    entry = st.session_state.current_entry
+    record = st.session_state.drafts.get(entry.get("video_id")) if entry else None
+    if not record or record["status"] != "ok" or record["override"] != selected_override():
+        return False
+    if not record["frames"] or not all(os.path.exists(p) for p in record["frames"]):
+        return False
+    
+    st.session_state.current_frame_files = record["frames"]
+    set_reasoning_text(record["response"])
+    return True
+
+def apply_prefetched_draft():
+    """Load the background draft for the current video into the editor if it is ready"""
+    prefetcher = st.session_state.prefetcher
+    entry = st.session_state.current_entry
+    if prefetcher is None or entry is None:
+        return False
+    
+    draft = prefetcher.take(entry.get("video_id"), override=selected_override())
+    if draft is None:
+        return False
+    
+    st.session_state.current_frame_files = draft["frame_files"]
+    set_reasoning_text(draft["response"])
+    return True
+
+def session_frame_settings():
+    """The sidebar's frame extraction settings as extract_frames_cached keyword arguments"""
+    return {
+        "image_format": st.session_state.frame_format,
+        "quality": st.session_state.frame_quality,
+        "dedup_threshold": st.session_state.frame_dedup_threshold,
+        "sampling": st.session_state.frame_sampling,
+        "frame_budget": st.session_state.frame_budget,
+        "resize": st.session_state.frame_resize,
+        "resize_size": st.session_state.frame_resize_size,
+    }
+
+def apply_preextracted_frames():
+    """Show frames already extracted for the current video (e.g. by the extract command) with the current settings"""
+    entry = st.session_state.current_entry
+    if entry is None or not st.session_state.frames_dir:
+        return False
+    
+    params = frame_cache_params(**session_frame_settings())
+    video_frames_dir = Path(st.session_state.frames_dir) / entry.get("video_id")
+    frame_paths = cached_frame_paths(st.session_state.current_video_file, video_frames_dir, params)
+    if not frame_paths:
+        return False
+    st.session_state.current_frame_files = frame_paths
+    return True
+
+def load_next_video(advance=False):
+    """
+    Load the next unprocessed video at the cursor (or after it, when advance is set),
+    passing over videos another annotator has leased or completed
+    """
+    index = st.session_state.metadata_index
+    cursor = st.session_state.cursor
+    inclusive = not advance
+    release_current_video()
+    
+    while index is not None:
+        row = index.next_pending(cursor, inclusive)
+        if row is None:
+            break
+        cursor, inclusive = index.cursor_of(row), False
         
-        st.session_state.current_index += 1
+        video_file = st.session_state.video_files.get(row[2])
+        if video_file and video_file.exists() and claim_video(row[2]):
+            st.session_state.cursor = cursor
+            st.session_state.current_entry = index.load_entry(row)
+            st.session_state.current_video_file = video_file
+            st.session_state.current_frame_files = []
+            st.session_state.frame_page = 0
+            st.session_state.zoom_frame = None
+            set_reasoning_text("")
+            if not apply_batch_draft() and not apply_prefetched_draft():
+                apply_preextracted_frames()
+            schedule_prefetch()
+            return
     
+    st.session_state.cursor = cursor
     st.session_state.current_entry = None
     st.session_state.current_video_file = None
 
 # === ANNOTATION FUNCTIONS ===
 
-def generate_ai_reasoning():
-    """Upload video to Gemini for reasoning, then extract frames locally for VLM dataset"""
+def generate_ai_reasoning(fresh=False):
+    """
+    Upload video to Gemini for reasoning, then extract frames locally for VLM dataset.
+    A cached response for the same video/prompt skips the upload unless fresh is set.
+    """
     entry = st.session_state.current_entry
     video_file = st.session_state.current_video_file
     
     # Get override choice
-    override = None
-    if st.session_state.get('label_selector') != "Auto":
-        override = st.session_state.label_selector
-    
-    # Step 1: Upload VIDEO to Gemini and generate reasoning
-    st.info("Step 1: Uploading video to Gemini for reasoning...")
-    gemini_video_file = upload_video_to_gemini(video_file)
-    
-    if gemini_video_file:
-        st.session_state.gemini_files = [gemini_video_file]
-        
-        # Generate reasoning from the video
-        reasoning = generate_reasoning_with_video(
-            entry,
-            gemini_video_file,
-            st.session_state.model,
-            override_label=override
-        )
+    override = selected_override()
+    
+    with metrics.video(entry.get("video_id"), "generate"):
+        # An explicit Generate supersedes any background draft for this video
+        if st.session_state.prefetcher is not None:
+            st.session_state.prefetcher.cancel(entry.get("video_id"))
         
-        if reasoning:
-            # Calculate the final label for the output text
-            if override:
-                final_label = override
-            else:
-                raw_label = str(st.session_state.current_entry.get("label", "")).strip().lower()
-                final_label = "Scam" if "scam" in raw_label else "Legit"
-            
-            # Format: "Yes. [Reasoning]" or "No. [Reasoning]"
-            prefix = "Yes" if final_label == "Scam" else "No"
-            full_response = f"{prefix}. {reasoning}"
-            
-            # Update State and Widget
-            st.session_state.ai_reasoning = full_response
-            st.session_state['reasoning_editor'] = full_response
-            
-            st.success(f"✅ Reasoning Generated ({final_label})")
-            
-            # Step 2: Extract frames locally at 1 FPS for VLM training dataset
-            st.info("Step 2: Extracting frames at 1 FPS for VLM training dataset...")
-            
-            # Use the ACTUAL video_id from metadata (e.g., "youtube__fBs4O6qzVE")
-            video_id = entry.get("video_id")
-            
-            # Create a separate folder for this video's frames
-            frames_base_dir = Path(st.session_state.frames_dir)
-            video_frames_dir = frames_base_dir / video_id
-            
-            frame_paths = extract_frames_1fps(video_file, video_frames_dir, video_id)
+        if st.session_state.reasoning_input != "video":
+            generate_ai_reasoning_from_frames(entry, video_file, override, fresh)
+            return
+        
+        proxy = st.session_state.upload_proxy
+        content_hash = video_input_hash(video_file, proxy)
+        reasoning = None if fresh else cached_reasoning(entry, content_hash, override)
+        if reasoning is not None:
+            st.success("♻️ Using cached response")
+            gemini_video_file = None
+        else:
+            # Step 1: Upload VIDEO to Gemini and generate reasoning
+            st.info("Step 1: Uploading video to Gemini for reasoning...")
+            start = time.perf_counter()
+            gemini_video_file = upload_video_to_gemini(video_file, proxy=proxy)
+            upload_s = time.perf_counter() - start
+        
+        if reasoning is not None or gemini_video_file:
+            if gemini_video_file:
+                # Generate reasoning from the video
+                start = time.perf_counter()
+                reasoning = generate_reasoning_with_video(
+                    entry,
+                    gemini_video_file,
+                    override_label=override,
+                    content_hash=content_hash,
+                    use_cache=False
+                )
+                record_input_timing(entry.get("video_id"), {
+                    "input": "video", "prepare_s": upload_s, "generate_s": time.perf_counter() - start
+                })
             
-            if frame_paths:
-                st.session_state.current_frame_files = frame_paths
-                st.success(f"✅ Extracted {len(frame_paths)} frames for VLM dataset in folder: {video_id}")
+            if reasoning:
+                # Calculate the final label for the output text
+                final_label = resolve_label(entry, override)
+                full_response = format_response(reasoning, final_label)
+                
+                # Update State and Widget
+                set_reasoning_text(full_response)
+                
+                st.success(f"✅ Reasoning Generated ({final_label})")
+                
+                # Step 2: Extract frames locally (1 FPS or per scene) for VLM training dataset
+                st.info(f"Step 2: Extracting frames ({SAMPLING_MODES[st.session_state.frame_sampling]}) "
+                        f"for VLM training dataset...")
+                
+                # Use the ACTUAL video_id from metadata (e.g., "youtube__fBs4O6qzVE")
+                video_id = entry.get("video_id")
+                
+                # Frames live in a separate folder per video; a matching manifest there skips extraction
+                frame_paths = extract_frames_cached(
+                    video_file,
+                    st.session_state.frames_dir,
+                    video_id,
+                    **session_frame_settings()
+                )
+                
+                if frame_paths:
+                    st.session_state.current_frame_files = frame_paths
+                    st.success(f"✅ Extracted {len(frame_paths)} frames for VLM dataset in folder: {video_id}")
+                else:
+                    st.warning("⚠️ Failed to extract frames, but reasoning was generated")
+                
+                time.sleep(0.5)
+                st.rerun()
             else:
-                st.warning("⚠️ Failed to extract frames, but reasoning was generated")
-            
-            time.sleep(0.5)
-            st.rerun()
+                st.error("❌ Failed to generate reasoning")
         else:
-            st.error("❌ Failed to generate reasoning")
+            st.error("❌ Failed to upload video")
+
+def generate_ai_reasoning_from_frames(entry, video_file, override, fresh=False):
+    """Frames input: extract frames first, then send them (inline or uploaded) for reasoning"""
+    input_mode = st.session_state.reasoning_input
+    video_id = entry.get("video_id")
+    
+    st.info(f"Step 1: Extracting frames ({SAMPLING_MODES[st.session_state.frame_sampling]})...")
+    frame_paths = extract_frames_cached(video_file, st.session_state.frames_dir, video_id,
+                                        **session_frame_settings())
+    if not frame_paths:
+        st.error("❌ Failed to extract frames")
+        return
+    st.session_state.current_frame_files = frame_paths
+    
+    st.info(f"Step 2: Generating reasoning from {len(frame_paths)} frames ({REASONING_INPUTS[input_mode]})...")
+    reasoning, timings = generate_reasoning_from_frames(entry, frame_paths, override, input_mode,
+                                                        use_cache=not fresh)
+    if not reasoning:
+        st.error("❌ Failed to generate reasoning")
+        return
+    
+    final_label = resolve_label(entry, override)
+    set_reasoning_text(format_response(reasoning, final_label))
+    if timings["generate_s"]:
+        record_input_timing(video_id, timings)
+        st.success(f"✅ Reasoning Generated ({final_label}) in "
+                   f"{timings['prepare_s'] + timings['generate_s']:.1f}s")
     else:
-        st.error("❌ Failed to upload video")
+        st.success(f"✅ Reasoning Generated ({final_label})")
+    
+    time.sleep(0.5)
+    st.rerun()
 
 def accept_and_save():
     """Accept the current reasoning and save to training data"""
@@ -583,47 +3534,247 @@ def accept_and_save():
         ]
     }
     
-    st.session_state.training_data.append(sft_entry)
-    st.session_state.processed_ids.add(video_id)
-    
-    # Save to file
+    # Save to file (appended to the journal; the JSON is rewritten only on compaction).
+    # The queue records the completion in the same transaction, so a video is saved once
+    # even when another annotator's lease on it expired and both accept it.
     output_path = st.session_state.output_path
-    if save_training_data(output_path, st.session_state.training_data):
-        st.success(f"✅ Saved as {video_id}! Total annotated: {len(st.session_state.training_data)}")
-    
-    # Cleanup Gemini files
-    for gemini_file in st.session_state.gemini_files:
-        cleanup_gemini_file(gemini_file.name)
-    
-    # Move to next video
-    st.session_state.current_index += 1
-    load_next_video()
-    st.rerun()
-    for gemini_file in st.session_state.gemini_files:
-        cleanup_gemini_file(gemini_file.name)
+    queue = st.session_state.work_queue
+    with metrics.video(video_id, "accept"):
+        outcome = queue.complete(video_id, st.session_state.lease_holder, st.session_state.annotator,
+                                 output_path, sft_entry)
+        if outcome == "failed":
+            return
+        st.session_state.processed_ids.add(video_id)
+        st.session_state.metadata_index.mark_annotated(video_id)
+        if outcome == "duplicate":
+            st.warning(f"⚠️ {video_id} was already saved by {queue.completed_by(video_id) or 'another annotator'}; "
+                       f"your annotation was not written")
+        else:
+            st.success(f"✅ Saved as {video_id}! Total annotated: {len(st.session_state.processed_ids)}")
+            st.session_state.journal_appends += 1
+        
+        if st.session_state.journal_appends >= JOURNAL_COMPACT_EVERY:
+            with output_lock():
+                compact_training_data(output_path)
+            st.session_state.journal_appends = 0
+        
+        # Uploaded files stay cached for reuse; only expired/LRU-overflow ones are deleted
+        evict_remote_files()
     
     # Move to next video
-    st.session_state.current_index += 1
-    load_next_video()
+    load_next_video(advance=True)
     st.rerun()
 
 def skip_video():
-    """Skip the current video"""
+    """Skip the current video (its lease is released, so another annotator can take it)"""
     st.session_state.skipped_count += 1
     
-    # Cleanup Gemini files
-    for gemini_file in st.session_state.gemini_files:
-        cleanup_gemini_file(gemini_file.name)
+    if st.session_state.prefetcher is not None and st.session_state.cancel_prefetch_on_skip:
+        st.session_state.prefetcher.cancel(st.session_state.current_entry.get("video_id"))
+    
+    # Uploaded files stay cached for reuse; only expired/LRU-overflow ones are deleted
+    evict_remote_files()
     
     # Move to next video
-    st.session_state.current_index += 1
-    load_next_video()
+    load_next_video(advance=True)
     st.rerun()
 
+def set_zoom_frame(frame_path):
+    """Button callback: runs before the viewer redraws, so the zoomed frame shows right away"""
+    st.session_state.zoom_frame = frame_path
+
+@st.fragment
+def frames_viewer():
+    """
+    The current video's frames, one page of thumbnails (3 columns) at a time, with page buttons.
+    🔍 under a thumbnail shows that frame at full resolution above the grid until closed.
+    A fragment: paging and zooming rerun only the viewer.
+    """
+    frame_files = st.session_state.current_frame_files
+    if not frame_files:
+        return
+    st.subheader(f"🖼️ Extracted Frames ({len(frame_files)} frames, "
+                 f"{SAMPLING_MODES[st.session_state.frame_sampling]})")
+    
+    pages = (len(frame_files) + THUMBS_PER_PAGE - 1) // THUMBS_PER_PAGE
+    page = min(st.session_state.frame_page, pages - 1)
+    
+    if pages > 1:
+        nav_prev, nav_label, nav_next = st.columns([1, 2, 1])
+        if nav_prev.button("◀ Prev", use_container_width=True, disabled=page == 0):
+            page -= 1
+        if nav_next.button("Next ▶", use_container_width=True, disabled=page == pages - 1):
+            page += 1
+        st.session_state.frame_page = page
+        start = page * THUMBS_PER_PAGE
+        nav_label.caption(f"Page {page + 1}/{pages} · frames {start + 1}–"
+                          f"{min(start + THUMBS_PER_PAGE, len(frame_files))}")
+    
+    zoom_frame = st.session_state.zoom_frame
+    if zoom_frame in frame_files:
+        st.image(zoom_frame, caption=f"{Path(zoom_frame).name} (full resolution)", use_container_width=True)
+        st.button("✖ Close full resolution", use_container_width=True, on_click=set_zoom_frame, args=(None,))
+    
+    page_files = frame_files[page * THUMBS_PER_PAGE:(page + 1) * THUMBS_PER_PAGE]
+    cols_per_row = 3
+    for i, (frame_path, thumb_path) in enumerate(zip(page_files, frame_thumbnails(page_files))):
+        if i % cols_per_row == 0:
+            cols = st.columns(cols_per_row)
+        col = cols[i % cols_per_row]
+        col.image(thumb_path, caption=Path(frame_path).name, use_container_width=True)
+        col.button("🔍", key=f"zoom_{Path(frame_path).name}", help="Show this frame at full resolution",
+                   on_click=set_zoom_frame, args=(frame_path,))
+
+@st.fragment
+def reasoning_panel(entry):
+    """
+    Perspective selector, Generate button and the response editor. A fragment, so typing in
+    the editor reruns only this panel, not the video player or the frames.
+    """
+    # Every rerun of the panel renews this session's lease on the video
+    if not claim_video(entry.get("video_id")):
+        st.warning("⚠️ Your lease on this video expired and another annotator has it now; "
+                   "Skip to avoid duplicate work")
+    
+    # AI Reasoning section
+    st.subheader("🤖 AI Reasoning (Yes/No included)")
+
+    # Manual Override Button
+    current_meta_label = entry.get('label', 'Unknown')
+    st.caption(f"Metadata thinks this is: {current_meta_label}")
+    
+    label_choice = st.radio(
+        "Force AI Perspective:",
+        ["Auto", "Scam", "Legit"],
+        horizontal=True,
+        key="label_selector",
+        help="Select 'Scam' to force the AI to write a critique, or 'Legit' to write a defense."
+    )
+    
+    # Pick up a background draft that finished since the last run; its frames need a full rerun
+    prefetcher = st.session_state.prefetcher
+    if not st.session_state.ai_reasoning and prefetcher is not None:
+        if apply_prefetched_draft():
+            st.rerun()
+        if prefetcher.is_pending(entry.get("video_id")):
+            st.info("⏳ A draft for this video is being prepared in the background")
+            st.button("🔃 Check for draft", use_container_width=True)
+    
+    # Generate button
+    if st.button("🔮 Generate AI Reasoning", type="primary", use_container_width=True):
+        generate_ai_reasoning()
+    
+    if st.session_state.pending_editor_text is not None:
+        st.session_state['reasoning_editor'] = st.session_state.pending_editor_text
+        st.session_state.pending_editor_text = None
+    
+    # Editable reasoning text area
+    reasoning_text = st.text_area(
+        "Response (Edit if needed)",
+        value=st.session_state.ai_reasoning,
+        height=200,
+        key="reasoning_editor",
+        help="This is exactly what will be saved to the JSON"
+    )
+    
+    # Update session state with edited text
+    st.session_state.ai_reasoning = reasoning_text
+
+@st.fragment
+def action_bar():
+    """Accept / Skip / Regenerate. Each ends in a full rerun onto the next (or regenerated) video"""
+    # The editor lives in another fragment; take its latest text unless a new text is pending
+    if st.session_state.pending_editor_text is None and "reasoning_editor" in st.session_state:
+        st.session_state.ai_reasoning = st.session_state.reasoning_editor
+    
+    # Action buttons
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        if st.button("✅ Accept & Save", type="primary", use_container_width=True):
+            accept_and_save()
+    
+    with col2:
+        if st.button("⏭️ Skip", use_container_width=True):
+            skip_video()
+    
+    with col3:
+        if st.button("🔄 Regenerate", use_container_width=True,
+                     help="Always asks Gemini again, bypassing the response cache"):
+            generate_ai_reasoning(fresh=True)
+
+@st.fragment
+def stats_panel(output_path):
+    """
+    Sidebar progress, queue, key and timing stats. A fragment: the compact button reruns
+    only this panel, and editing elsewhere doesn't redraw it.
+    """
+    st.subheader("📊 Progress")
+    total = st.session_state.total_entries
+    processed = len(st.session_state.processed_ids)
+    remaining = total - processed - st.session_state.skipped_count
+    
+    st.metric("Total Videos", total)
+    st.metric("Annotated", processed)
+    st.metric("Skipped", st.session_state.skipped_count)
+    st.metric("Remaining", remaining)
+    
+    if total > 0:
+        progress = processed / total
+        st.progress(progress)
+        st.write(f"{progress*100:.1f}% Complete")
+    
+    queue = st.session_state.work_queue
+    if queue is not None:
+        queue_stats = queue.stats()
+        st.caption(f"👥 Shared queue: {queue_stats['completed']} completed · "
+                   f"{queue_stats['leased']} in progress · {queue_stats['annotators']} annotators active")
+    
+    if st.button("🗜️ Compact Output JSON", use_container_width=True,
+                 help="Fold the append-only journal of accepted annotations into the output JSON"):
+        with output_lock():
+            count = compact_training_data(output_path)
+        if count == 0:
+            st.info("Output JSON is already up to date")
+        else:
+            st.session_state.journal_appends = 0
+            st.success(f"✅ Wrote {count} entries to {output_path}")
+    
+    st.divider()
+    st.caption(f"API Keys: {len(API_KEYS)} (≤{KEY_RPM} RPM / {KEY_TPM:,} TPM each)")
+    for key in key_pool.snapshot():
+        state = f"cooling down {key['cooldown_s']:.0f}s" if key['cooldown_s'] > 0 else "ready"
+        st.caption(
+            f"Key #{key['key']}: {state} · {key['in_flight']} in flight · "
+            f"{key['completed']} ok · {key['rate_limited']} × 429 · {key['errors']} errors"
+        )
+    gc_events = metrics.counters()
+    st.caption(f"🧹 Remote cleanup: {get_remote_gc().pending()} queued · {gc_events.get('gc_deleted', 0)} deleted · "
+               f"{gc_events.get('gc_failed', 0)} failed")
+    cache_stats = get_response_cache().stats()
+    st.caption(
+        f"Response cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+        f"{cache_stats['entries']} cached ({cache_stats['bytes'] / 1024:.0f} KiB)"
+    )
+    
+    with st.expander("⏱️ Stage Timings"):
+        stage_stats = metrics.percentiles()
+        if not stage_stats:
+            st.caption("No stages timed yet")
+        for stage, stats in stage_stats.items():
+            st.caption(f"{stage}: p50 {stats['p50']:.2f}s · p95 {stats['p95']:.2f}s · n={stats['count']}")
+        events = metrics.counters()
+        if events.get("hedges"):
+            st.caption(f"Hedged requests: {events['hedges']} sent · {events.get('hedge_wins', 0)} answered first "
+                       f"({events.get('hedge_wins', 0) / events['hedges']:.0%})")
+        if events:
+            st.caption(" · ".join(f"{event} {count}" for event, count in sorted(events.items())))
+
 def main():
     st.set_page_config(page_title="Scam Detection Annotation Tool", layout="wide")
     
     initialize_session_state()
+    process_resource("failed_sweep", start_failed_sweep)
     
     # Sidebar
     with st.sidebar:
@@ -644,44 +3795,169 @@ def main():
             value=r"C:\Users\Jules Gregory\Desktop\GemAnnote\extracted_frames"
         )
         
+        frame_format = st.selectbox(
+            "Frame Format",
+            list(FRAME_FORMATS),
+            index=list(FRAME_FORMATS).index(DEFAULT_FRAME_FORMAT),
+            help="PNG is lossless but slow and large; JPEG/WebP encode much faster"
+        )
+        _, _, default_quality, (min_quality, max_quality) = FRAME_FORMATS[frame_format]
+        frame_quality = st.slider(
+            "PNG Compression Level" if frame_format == "PNG" else f"{frame_format} Quality",
+            min_value=min_quality,
+            max_value=max_quality,
+            value=default_quality,
+            key=f"frame_quality_{frame_format}"
+        )
+        frame_sampling = st.selectbox(
+            "Frame Sampling",
+            list(SAMPLING_MODES),
+            format_func=SAMPLING_MODES.get,
+            help="1 FPS keeps a frame every second; Scene changes keeps at most N frames spread over the detected scenes"
+        )
+        frame_budget = SCENE_FRAME_BUDGET
+        if frame_sampling == "scenes":
+            frame_budget = st.number_input("Max frames per video", min_value=1, max_value=500,
+                                           value=SCENE_FRAME_BUDGET)
+        frame_dedup_threshold = 0
+        if st.checkbox("Drop near-duplicate frames", value=False,
+                       help="Skip frames that look almost the same as the previous kept frame (static slides, loops)"):
+            frame_dedup_threshold = st.slider(
+                "Duplicate threshold (dHash bits)",
+                min_value=1,
+                max_value=20,
+                value=FRAME_DEDUP_THRESHOLD,
+                help="Higher drops more frames; a frame within this many of 64 hash bits of the last kept one is dropped"
+            )
+        frame_resize = st.selectbox(
+            "Frame Resize",
+            list(RESIZE_POLICIES),
+            format_func=RESIZE_POLICIES.get,
+            help="Resize frames while extracting, e.g. to your model's input size; saves disk and loading time"
+        )
+        frame_resize_size = DEFAULT_RESIZE_SIZE
+        if frame_resize == "max-side":
+            max_side = st.number_input("Max side (px)", min_value=16, max_value=4096, value=DEFAULT_RESIZE_SIZE[0])
+            frame_resize_size = (int(max_side), int(max_side))
+        elif frame_resize != "none":
+            width_col, height_col = st.columns(2)
+            with width_col:
+                resize_width = st.number_input("Width (px)", min_value=16, max_value=4096,
+                                               value=DEFAULT_RESIZE_SIZE[0])
+            with height_col:
+                resize_height = st.number_input("Height (px)", min_value=16, max_value=4096,
+                                                value=DEFAULT_RESIZE_SIZE[1])
+            frame_resize_size = (int(resize_width), int(resize_height))
+        
+        reasoning_input = st.selectbox(
+            "Reasoning Input",
+            list(REASONING_INPUTS),
+            format_func=REASONING_INPUTS.get,
+            help="Send Gemini the video, or the extracted frames (downscaled inline, or uploaded concurrently). "
+                 "Timings are logged so the faster input can be picked per video"
+        )
+        upload_proxy = st.checkbox(
+            "Upload low-res proxy", value=False,
+            help=f"Upload a {PROXY_MAX_HEIGHT}p, {PROXY_FPS:g} FPS copy (no audio) instead of the original video"
+        )
+        
+        with st.expander("⚡ Background Prefetch"):
+            prefetch_ahead = st.number_input(
+                "Prefetch next N videos", min_value=0, max_value=10, value=PREFETCH_AHEAD,
+                help="Upload, generate and extract frames for upcoming videos in the background (0 = off)"
+            )
+            prefetch_workers = st.number_input(
+                "Prefetch workers", min_value=1, max_value=8, value=PREFETCH_WORKERS
+            )
+            st.session_state.cancel_prefetch_on_skip = st.checkbox(
+                "Cancel prefetch on Skip", value=True,
+                help="Stop background work for a video when it is skipped"
+            )
+        
+        drafts_path = st.text_input(
+            "Drafts File (optional)",
+            value="",
+            help="JSONL written by `python GemAnnote.py batch`; its drafts are loaded instead of generating"
+        )
+        
         output_path = st.text_input(
             "Output File",
             value=r"C:\Users\Jules Gregory\Desktop\GemAnnote\CrytoScams_Youtube.json"
         )
         
+        annotator = st.text_input(
+            "Annotator",
+            value=DEFAULT_ANNOTATOR,
+            help="Recorded with each completion; everyone sharing the output file gets different videos"
+        )
+        
         st.session_state.output_path = output_path
+        if lease_holder_for(annotator) != st.session_state.lease_holder:
+            # Renamed annotator: hand the current video back under the old name first
+            release_current_video()
+            st.session_state.lease_holder = lease_holder_for(annotator)
+        st.session_state.annotator = annotator
         st.session_state.frames_dir = frames_folder
+        st.session_state.frame_format = frame_format
+        st.session_state.frame_quality = frame_quality
+        st.session_state.frame_dedup_threshold = frame_dedup_threshold
+        st.session_state.frame_sampling = frame_sampling
+        st.session_state.frame_budget = int(frame_budget)
+        st.session_state.frame_resize = frame_resize
+        st.session_state.frame_resize_size = frame_resize_size
+        st.session_state.upload_proxy = upload_proxy
+        st.session_state.reasoning_input = reasoning_input
         
         if st.button("🔄 Load Data", use_container_width=True):
             with st.spinner("Loading metadata and video files..."):
-                st.session_state.raw_data = load_metadata(metadata_folder)
                 st.session_state.video_files = get_video_files(video_folder)
-                st.session_state.training_data, st.session_state.processed_ids = load_existing_data(output_path)
-                st.session_state.current_index = 0
+                release_current_video()
+                st.session_state.work_queue = shared_work_queue(output_path)
+                st.session_state.current_entry = None
+                with output_lock():
+                    compact_training_data(output_path)
+                st.session_state.journal_appends = 0
+                st.session_state.processed_ids = load_existing_data(output_path)
+                st.session_state.work_queue.sync_completed(st.session_state.processed_ids)
+                st.session_state.processed_ids |= st.session_state.work_queue.completed_ids()
+                st.session_state.drafts = load_drafts(drafts_path)
+                if st.session_state.metadata_index is not None:
+                    st.session_state.metadata_index.close()
+                st.session_state.metadata_index = open_metadata_index(
+                    metadata_folder, st.session_state.video_files, st.session_state.processed_ids
+                )
+                st.session_state.total_entries = st.session_state.metadata_index.count()
+                st.session_state.cursor = None
+                if st.session_state.prefetcher is not None:
+                    st.session_state.prefetcher.shutdown()
+                st.session_state.prefetcher = PrefetchPipeline(
+                    frames_folder,
+                    image_format=frame_format,
+                    quality=frame_quality,
+                    dedup_threshold=frame_dedup_threshold,
+                    sampling=frame_sampling,
+                    frame_budget=int(frame_budget),
+                    resize=frame_resize,
+                    resize_size=frame_resize_size,
+                    proxy=upload_proxy,
+                    input_mode=reasoning_input,
+                    ahead=int(prefetch_ahead),
+                    workers=int(prefetch_workers)
+                )
                 load_next_video()
-            st.success(f"✅ Loaded {len(st.session_state.raw_data)} metadata entries")
+                evict_remote_files()
+            st.success(f"✅ Loaded {st.session_state.total_entries} metadata entries")
             st.rerun()
         
         st.divider()
         
-        # Progress stats
-        st.subheader("📊 Progress")
-        total = len(st.session_state.raw_data)
-        processed = len(st.session_state.training_data)
-        remaining = total - processed - st.session_state.skipped_count
-        
-        st.metric("Total Videos", total)
-        st.metric("Annotated", processed)
-        st.metric("Skipped", st.session_state.skipped_count)
-        st.metric("Remaining", remaining)
+        stats_panel(output_path)
         
-        if total > 0:
-            progress = processed / total
-            st.progress(progress)
-            st.write(f"{progress*100:.1f}% Complete")
-        
-        st.divider()
-        st.caption(f"API Key: #{st.session_state.current_api_index + 1}/{len(API_KEYS)}")
+        if st.button("♻️ Reset Shared Caches", use_container_width=True,
+                     help="Close the key pool, caches, queues and thread pools shared by every session "
+                          "and rebuild them, e.g. after editing API keys or clearing .gemannote_cache"):
+            clear_process_resources()
+            st.rerun()
     
     # Main area
     st.title("🎬 Scam Detection Video Annotation (1 FPS Frame Extraction)")
@@ -693,7 +3969,7 @@ def main():
     entry = st.session_state.current_entry
     video_file = st.session_state.current_video_file
     
-    # Video player and metadata
+    # Video player and metadata (only drawn on full reruns; the panels below are fragments)
     col1, col2 = st.columns([2, 1])
     
     with col1:
@@ -703,17 +3979,7 @@ def main():
         else:
             st.warning("Video file not found")
         
-        # Display extracted frames
-        if st.session_state.current_frame_files:
-            st.subheader(f"🖼️ Extracted Frames ({len(st.session_state.current_frame_files)} frames at 1 FPS)")
-            # Show frames in a grid (3 columns)
-            cols_per_row = 3
-            for i in range(0, len(st.session_state.current_frame_files), cols_per_row):
-                cols = st.columns(cols_per_row)
-                for j, col in enumerate(cols):
-                    if i + j < len(st.session_state.current_frame_files):
-                        frame_path = st.session_state.current_frame_files[i + j]
-                        col.image(frame_path, caption=Path(frame_path).name, use_container_width=True)
+        frames_viewer()
     
     with col2:
         st.subheader("📋 Metadata")
@@ -726,54 +3992,299 @@ def main():
             st.write(entry.get('description', 'N/A'))
     
     st.divider()
+    reasoning_panel(entry)
+    st.divider()
+    action_bar()
+
+# === COMMAND LINE ===
+
+def run_batch(args):
+    """Draft every metadata entry with a video on disk, appending results to the drafts file"""
+    override = None if args.perspective == "auto" else args.perspective.capitalize()
     
-    # AI Reasoning section
-    st.subheader("🤖 AI Reasoning (Yes/No included)")
+    video_files = get_video_files(args.videos)
+    processed_ids = load_existing_data(args.output) if args.output else set()
+    drafts = load_drafts(args.drafts)
+    index = open_metadata_index(args.metadata, video_files, processed_ids)
+    
+    # Only the index rows are collected here; each worker reads its own record's metadata
+    todo = []
+    for row in index.pending(limit=None):
+        video_id = row[2]
+        previous = drafts.get(video_id)
+        if previous and previous["override"] == override:
+            if previous["status"] == "ok" or args.skip_failed:
+                continue
+        todo.append((row, video_files[video_id]))
+    if args.limit:
+        todo = todo[:args.limit]
+    
+    logger.info(f"{index.count()} metadata entries, {len(video_files)} videos, "
+                f"{len(todo)} to draft with {args.workers} workers")
+    
+    def draft_row(row, video_path):
+        return build_draft(index.load_entry(row), video_path, args.frames, override,
+                           args.frame_format, args.frame_quality, use_cache=not args.no_response_cache,
+                           dedup_threshold=args.dedup_threshold, sampling=args.sampling,
+                           frame_budget=args.frame_budget, proxy=args.proxy, input_mode=args.input,
+                           resize=args.resize, resize_size=args.resize_size)
+    Path(args.drafts).parent.mkdir(parents=True, exist_ok=True)
+    
+    done = failed = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch") as pool:
+        futures = {
+            pool.submit(draft_row, row, video_path): (row, video_path)
+            for row, video_path in todo
+        }
+        try:
+            for future in as_completed(futures):
+                row, video_path = futures[future]
+                try:
+                    draft = future.result()
+                except Exception as e:
+                    draft = {
+                        "video_id": row[2], "override": override,
+                        "label": resolve_label({"label": row[3]}, override), "response": None,
+                        "frame_files": [], "gemini_file": None, "error": str(e),
+                    }
+                # Only this thread writes the drafts file
+                append_draft(args.drafts, draft_record(draft, video_path))
+                done += 1
+                failed += bool(draft["error"])
+                logger.info(f"[{done}/{len(todo)}] {draft['video_id']}: "
+                            f"{draft['error'] or str(len(draft['frame_files'])) + ' frames'}")
+                # Keep the uploads bounded like the UI does: free what fell out of the reuse
+                # window, except videos still being drafted (their hashes are usually memoized already)
+                in_flight = {video_input_hash(path, args.proxy) for f, (_, path) in futures.items() if f.running()}
+                evict_remote_files(keep=in_flight)
+        except KeyboardInterrupt:
+            logger.warning("Interrupted; finished drafts are saved, rerun to resume")
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+            raise
+    
+    evict_remote_files()
+    if not get_remote_gc().drain():
+        logger.warning(f"{get_remote_gc().pending()} remote deletes unfinished; `sweep` will catch them")
+    elapsed = time.perf_counter() - start
+    logger.info(f"Drafted {done - failed}/{done} videos in {elapsed:.1f}s ({failed} failed) -> {args.drafts}")
+    for stage, stats in metrics.percentiles().items():
+        logger.info(f"  {stage}: p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s (n={stats['count']})")
+    if metrics.counters():
+        logger.info("  " + ", ".join(f"{event} {count}" for event, count in sorted(metrics.counters().items())))
+    return 1 if failed else 0
 
-    # Manual Override Button
-    current_meta_label = entry.get('label', 'Unknown')
-    st.caption(f"Metadata thinks this is: {current_meta_label}")
+def _init_extract_worker(writer_threads):
+    """Per-process setup for the extract pool, done once and reused for every video the process handles"""
+    global FRAME_WRITER_WORKERS
+    # Parallelism comes from the processes; keep OpenCV and the writer pool from oversubscribing the cores
+    cv2.setNumThreads(1)
+    FRAME_WRITER_WORKERS = writer_threads
+    # Per-video progress is reported by the parent
+    logger.setLevel(logging.WARNING)
+
+def _extract_video(video_path, frames_dir, video_id, options):
+    start = time.perf_counter()
+    frame_paths = extract_frames_cached(video_path, frames_dir, video_id, **options)
+    return len(frame_paths), time.perf_counter() - start
+
+def run_extract(args):
+    """
+    Extract frames for every video in a process pool; videos with valid frame manifests are
+    skipped, and so are videos already annotated in --output unless --force is given
+    """
+    options = {
+        "image_format": args.frame_format,
+        "quality": args.frame_quality,
+        "dedup_threshold": args.dedup_threshold,
+        "sampling": args.sampling,
+        "frame_budget": args.frame_budget,
+        "resize": args.resize,
+        "resize_size": args.resize_size,
+    }
+    params = frame_cache_params(**options)
     
-    label_choice = st.radio(
-        "Force AI Perspective:",
-        ["Auto", "Scam", "Legit"],
-        horizontal=True,
-        key="label_selector",
-        help="Select 'Scam' to force the AI to write a critique, or 'Legit' to write a defense."
-    )
+    video_files = get_video_files(args.videos)
+    annotated = load_existing_data(args.output) if args.output and not args.force else set()
+    frames_dir = Path(args.frames)
+    todo = []
+    skipped = 0
+    for video_id, video_path in sorted(video_files.items()):
+        if video_id in annotated:
+            skipped += 1
+            continue
+        # A finished video has a manifest matching these settings; that is the resume checkpoint
+        if cached_frame_paths(video_path, frames_dir / video_id, params):
+            continue
+        todo.append((video_id, video_path))
+    already = len(video_files) - skipped - len(todo)
+    if args.limit:
+        todo = todo[:args.limit]
     
-    # Generate button
-    if st.button("🔮 Generate AI Reasoning", type="primary", use_container_width=True):
-        generate_ai_reasoning()
+    logger.info(f"{len(video_files)} videos, {skipped} already annotated, {already} already extracted, "
+                f"{len(todo)} to extract with {args.workers} processes")
+    frames_dir.mkdir(parents=True, exist_ok=True)
     
-    # Editable reasoning text area
-    reasoning_text = st.text_area(
-        "Response (Edit if needed)",
-        value=st.session_state.ai_reasoning,
-        height=200,
-        key="reasoning_editor",
-        help="This is exactly what will be saved to the JSON"
+    done = failed = total_frames = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_extract_worker,
+                             initargs=(args.writer_threads,)) as pool:
+        futures = {
+            pool.submit(_extract_video, video_path, args.frames, video_id, options): video_id
+            for video_id, video_path in todo
+        }
+        try:
+            for future in as_completed(futures):
+                video_id = futures[future]
+                done += 1
+                try:
+                    count, elapsed = future.result()
+                except Exception as e:
+                    count, elapsed = 0, 0.0
+                    logger.error(f"[{done}/{len(todo)}] {video_id}: {e}")
+                if count:
+                    total_frames += count
+                    logger.info(f"[{done}/{len(todo)}] {video_id}: {count} frames in {elapsed:.1f}s")
+                else:
+                    failed += 1
+        except KeyboardInterrupt:
+            logger.warning("Interrupted; finished videos are kept, rerun to resume")
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+            raise
+    
+    elapsed = time.perf_counter() - start
+    rate = total_frames / elapsed if elapsed else 0.0
+    logger.info(f"Extracted {total_frames} frames from {done - failed}/{done} videos in {elapsed:.1f}s "
+                f"({rate:.1f} frames/s, {failed} failed) -> {args.frames}")
+    return 1 if failed else 0
+
+def run_compact(args):
+    """Fold the annotation journal into the output JSON (under the work queue's lock)"""
+    queue = WorkQueue(queue_path_for(args.output))
+    with queue.exclusive():
+        count = compact_training_data(args.output)
+    queue.close()
+    if count == 0:
+        logger.info(f"Nothing to compact for {args.output}")
+    else:
+        logger.info(f"Compacted {journal_path_for(args.output)} into {args.output} ({count} entries)")
+    return 0
+
+def run_sweep(args):
+    """Delete this tool's orphaned and failed remote files on every key, then wait for the deletes"""
+    swept = sweep_remote_files(min_age_s=args.min_age_hours * 3600, dry_run=args.dry_run)
+    for key_index, count in swept.items():
+        logger.info(f"API key #{key_index + 1}: {count} orphaned files" + (" (dry run)" if args.dry_run else ""))
+    if args.dry_run:
+        return 0
+    if not get_remote_gc().drain():
+        return 1
+    failed = metrics.counters().get("gc_failed", 0)
+    logger.info(f"Deleted {sum(swept.values()) - failed} remote files ({failed} failed)")
+    return 1 if failed else 0
+
+def run_export(args):
+    """Export saved annotations and their frames to tar shards for training (incremental)"""
+    summary = export_dataset(args.output, args.frames, args.dest, shard_bytes=args.shard_mb * 1024 * 1024,
+                             workers=args.workers, rebuild=args.rebuild)
+    for video_id in summary["missing"]:
+        logger.warning(f"{video_id}: frames missing under {args.frames}, not exported")
+    logger.info(f"Wrote {summary['samples']} samples in {summary['shards']} new shards "
+                f"({summary['bytes'] / 1e6:.1f} MB, {summary['unchanged']} already exported, "
+                f"{summary['total_shards']} shards in total) -> {args.dest}")
+    return 1 if summary["missing"] else 0
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="GemAnnote.py",
+        description="Headless commands. Run the annotation UI with: streamlit run GemAnnote.py"
     )
+    sub = parser.add_subparsers(dest="command", required=True)
     
-    # Update session state with edited text
-    st.session_state.ai_reasoning = reasoning_text
+    batch = sub.add_parser("batch", help="Pre-annotate the whole corpus into a resumable drafts file")
+    batch.add_argument("--videos", required=True, help="Video folder (searched recursively)")
+    batch.add_argument("--metadata", required=True, help="Metadata JSON/JSONL file or folder")
+    batch.add_argument("--frames", required=True, help="Frames output folder")
+    batch.add_argument("--drafts", required=True, help="Drafts JSONL file (appended to, resumable)")
+    batch.add_argument("--output", help="Existing SFT output; videos already annotated there are skipped")
+    batch.add_argument("--workers", type=int, default=max(len(API_KEYS), 1),
+                       help="Videos processed concurrently (default: one per API key)")
+    batch.add_argument("--perspective", choices=["auto", "scam", "legit"], default="auto")
+    batch.add_argument("--frame-format", choices=list(FRAME_FORMATS), default=DEFAULT_FRAME_FORMAT)
+    batch.add_argument("--frame-quality", type=int, default=None)
+    batch.add_argument("--sampling", choices=list(SAMPLING_MODES), default=DEFAULT_SAMPLING,
+                       help="1fps: a frame every second; scenes: at most --frame-budget frames spread over scenes")
+    batch.add_argument("--frame-budget", type=int, default=SCENE_FRAME_BUDGET,
+                       help="Max frames per video with --sampling scenes")
+    batch.add_argument("--dedup-threshold", type=int, default=0,
+                       help=f"Drop frames within this many dHash bits of the last kept one (0 = off, "
+                            f"{FRAME_DEDUP_THRESHOLD} is a good start)")
+    batch.add_argument("--resize", choices=list(RESIZE_POLICIES), default=DEFAULT_RESIZE,
+                       help="Resize frames while extracting: max-side keeps the aspect ratio, letterbox pads "
+                            "and center-crop crops to exactly --resize-size")
+    batch.add_argument("--resize-size", type=parse_frame_size, default=DEFAULT_RESIZE_SIZE,
+                       help="Target WIDTHxHEIGHT, or one number for a square (default: 448)")
+    batch.add_argument("--input", choices=list(REASONING_INPUTS), default=DEFAULT_REASONING_INPUT,
+                       help="Send the video, or the extracted frames inline or as uploaded files")
+    batch.add_argument("--proxy", action="store_true",
+                       help=f"Upload a {PROXY_MAX_HEIGHT}p, {PROXY_FPS:g} FPS proxy (no audio) instead of the original")
+    batch.add_argument("--limit", type=int, default=0, help="Draft at most this many videos")
+    batch.add_argument("--skip-failed", action="store_true", help="Don't retry videos whose last draft failed")
+    batch.add_argument("--no-response-cache", action="store_true",
+                       help="Always call Gemini, replacing cached responses")
+    batch.set_defaults(func=run_batch)
     
-    st.divider()
+    extract = sub.add_parser("extract", help="Pre-extract frames for every video with a pool of processes (resumable)")
+    extract.add_argument("--videos", required=True, help="Video folder (searched recursively)")
+    extract.add_argument("--frames", required=True, help="Frames output folder")
+    extract.add_argument("--output", help="Existing SFT output; videos already annotated there are skipped")
+    extract.add_argument("--force", action="store_true", help="Extract videos already annotated in --output too")
+    extract.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                         help="Worker processes (default: one per CPU)")
+    extract.add_argument("--writer-threads", type=int, default=2, help="Frame encode threads per process")
+    extract.add_argument("--frame-format", choices=list(FRAME_FORMATS), default=DEFAULT_FRAME_FORMAT)
+    extract.add_argument("--frame-quality", type=int, default=None)
+    extract.add_argument("--sampling", choices=list(SAMPLING_MODES), default=DEFAULT_SAMPLING)
+    extract.add_argument("--frame-budget", type=int, default=SCENE_FRAME_BUDGET)
+    extract.add_argument("--dedup-threshold", type=int, default=0)
+    extract.add_argument("--resize", choices=list(RESIZE_POLICIES), default=DEFAULT_RESIZE)
+    extract.add_argument("--resize-size", type=parse_frame_size, default=DEFAULT_RESIZE_SIZE)
+    extract.add_argument("--limit", type=int, default=0, help="Extract at most this many videos")
+    extract.set_defaults(func=run_extract)
     
-    # Action buttons
-    col1, col2, col3 = st.columns(3)
+    compact = sub.add_parser("compact", help="Fold the annotation journal into the SFT output JSON")
+    compact.add_argument("--output", required=True, help="SFT output JSON (its journal is <name>.journal.jsonl)")
+    compact.set_defaults(func=run_compact)
     
-    with col1:
-        if st.button("✅ Accept & Save", type="primary", use_container_width=True):
-            accept_and_save()
+    sweep = sub.add_parser("sweep", help="Delete orphaned remote files uploaded by this tool, on every API key")
+    sweep.add_argument("--min-age-hours", type=float, default=ORPHAN_MIN_AGE_S / 3600,
+                       help="Only delete unreferenced files at least this old (default: %(default)s)")
+    sweep.add_argument("--dry-run", action="store_true", help="Only count what would be deleted")
+    sweep.set_defaults(func=run_sweep)
     
-    with col2:
-        if st.button("⏭️ Skip", use_container_width=True):
-            skip_video()
+    export = sub.add_parser("export", help="Export saved annotations and frames to tar shards for training")
+    export.add_argument("--output", required=True, help="SFT output JSON (its journal is read too)")
+    export.add_argument("--frames", required=True, help="Frames folder the annotations were made from")
+    export.add_argument("--dest", required=True, help="Shard folder (shard-000000.tar, ... and index.json)")
+    export.add_argument("--shard-mb", type=int, default=EXPORT_SHARD_BYTES // (1024 * 1024),
+                        help="Close a shard before it passes this size (default: %(default)s)")
+    export.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                        help="Shards written concurrently (default: one per CPU)")
+    export.add_argument("--rebuild", action="store_true", help="Delete the existing shards and export everything")
+    export.set_defaults(func=run_export)
     
-    with col3:
-        if st.button("🔄 Regenerate", use_container_width=True):
-            generate_ai_reasoning()
+    return parser
+
+def run_cli(argv):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = build_arg_parser().parse_args(argv)
+    return args.func(args)
 
 if __name__ == "__main__":
+    if not st.runtime.exists() and len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     main()
\ No newline at end of file
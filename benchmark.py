@@ -0,0 +1,523 @@
+"""
+Benchmarks for the GemAnnote pipeline.
+
+Usage:
+    python benchmark.py extract [--video PATH] [--seconds 120] [--fps 29.97] [--width 1920 --height 1080]
+    python benchmark.py encode [--video PATH] [--seconds 120] [--workers N]
+    python benchmark.py upload [--video PATH] [--seconds 300] [--runs 3]   (needs GEMINI_API_KEY_*)
+    python benchmark.py inputs [--video PATH] [--seconds 60]               (needs GEMINI_API_KEY_*)
+    python benchmark.py suite [--videos 6] [--rate-429 0.1] [--rate-500 0.05] [--keys 3] [--workers 3]
+
+Without --video a synthetic clip is written to a temp dir with OpenCV and used as input.
+suite runs offline: Gemini is replaced by FakeGemini, a local stand-in with configurable
+latency, PROCESSING time and injected 429/500 errors.
+"""
+import argparse
+import itertools
+import json
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+from google.api_core import exceptions
+
+import GemAnnote
+
+
+def make_synthetic_video(path, seconds=60, fps=30.0, width=1280, height=720, offset=0):
+    """Write a synthetic mp4 with a moving gradient and a frame counter (offset shifts both, for distinct clips)"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError(f"Could not open VideoWriter for {path}")
+
+    ramp = np.linspace(0, 255, width, dtype=np.uint8)
+    base = np.repeat(np.tile(ramp, (height, 1))[:, :, None], 3, axis=2)
+    for i in range(int(seconds * fps)):
+        frame = np.roll(base, (i + offset) * 4, axis=1)
+        cv2.putText(frame, str(i + offset), (40, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 255), 6)
+        writer.write(frame)
+    writer.release()
+    return Path(path)
+
+
+class FakeGemini:
+    """
+    Local stand-in for the Gemini File API and generate_content.
+    Every call sleeps for its latency (jittered ±20%) and then fails with 429 / 500 at the
+    configured rates; uploads stay PROCESSING for processing_s plus processing_per_mb_s per MB.
+    A slow_rate fraction of generate calls takes slow_s instead (the tail hedging is for), and a
+    call longer than its request_options timeout fails with DeadlineExceeded like the real client.
+    Counts calls and injected errors so they can be compared with the pipeline's own retries.
+    """
+
+    def __init__(self, upload_s=0.3, upload_mb_s=50.0, processing_s=2.0, processing_per_mb_s=0.1,
+                 generate_s=1.0, rate_429=0.0, rate_500=0.0, slow_rate=0.0, slow_s=30.0, seed=0):
+        self.upload_s = upload_s
+        self.upload_mb_s = upload_mb_s
+        self.processing_s = processing_s
+        self.processing_per_mb_s = processing_per_mb_s
+        self.generate_s = generate_s
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.slow_rate = slow_rate
+        self.slow_s = slow_s
+        self.calls = {}
+        self.injected = {"429": 0, "500": 0}
+        self._files = {}  # name -> (ready_at, display_name, create_time)
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _call(self, op, latency, timeout=None):
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+            jitter = self._rng.uniform(0.8, 1.2)
+            roll = self._rng.random()
+            if op == "generate_content" and self._rng.random() < self.slow_rate:
+                latency = self.slow_s
+        if timeout is not None and latency * jitter > timeout:
+            time.sleep(timeout)
+            raise exceptions.DeadlineExceeded(f"504 Deadline exceeded (fake {op})")
+        time.sleep(latency * jitter)
+        if roll < self.rate_429:
+            with self._lock:
+                self.injected["429"] += 1
+            raise exceptions.ResourceExhausted(f"429 Resource exhausted (fake {op})")
+        if roll < self.rate_429 + self.rate_500:
+            with self._lock:
+                self.injected["500"] += 1
+            raise exceptions.InternalServerError(f"500 Internal error (fake {op})")
+
+    def _file(self, name):
+        ready_at, display_name, create_time = self._files[name]
+        state = "ACTIVE" if time.monotonic() >= ready_at else "PROCESSING"
+        return SimpleNamespace(name=name, display_name=display_name, state=SimpleNamespace(name=state),
+                               uri=f"fake://{name}", create_time=create_time, expiration_time=None)
+
+    def upload_file(self, path, mime_type=None, display_name=None):
+        size_mb = Path(path).stat().st_size / 1e6
+        self._call("upload_file", self.upload_s + size_mb / self.upload_mb_s)
+        with self._lock:
+            name = f"files/fake-{next(self._ids)}"
+            self._files[name] = (time.monotonic() + self.processing_s + size_mb * self.processing_per_mb_s,
+                                 display_name or f"{GemAnnote.REMOTE_FILE_TAG}{Path(path).name}",
+                                 datetime.now(timezone.utc))
+            return self._file(name)
+
+    def get_file(self, name):
+        self._call("get_file", 0.02)
+        if "/" not in name:
+            name = f"files/{name}"
+        with self._lock:
+            if name not in self._files:
+                raise exceptions.NotFound(f"{name} not found")
+            return self._file(name)
+
+    def list_files(self, page_size=100):
+        self._call("list_files", 0.05)
+        with self._lock:
+            return [self._file(name) for name in list(self._files)]
+
+    def delete_file(self, name):
+        self._call("delete_file", 0.02)
+        if "/" not in name:
+            name = f"files/{name}"
+        with self._lock:
+            self._files.pop(name, None)
+
+    def generate_content(self, contents, generation_config=None, request_options=None):
+        self._call("generate_content", self.generate_s, (request_options or {}).get("timeout"))
+        reasoning = "The title and the on-screen claims do not match what the video shows (fake response)."
+        return SimpleNamespace(text=json.dumps({"reasoning": reasoning}),
+                               usage_metadata=SimpleNamespace(total_token_count=GemAnnote.REQUEST_TOKEN_ESTIMATE))
+
+
+class FakeKeyClient:
+    """GemAnnote.GeminiKeyClient's surface (file calls + .model.generate_content) backed by a FakeGemini"""
+
+    service = None
+
+    def __init__(self, index, api_key):
+        self.index = index
+        self.upload_file = self.service.upload_file
+        self.get_file = self.service.get_file
+        self.delete_file = self.service.delete_file
+        self.list_files = self.service.list_files
+        self.model = SimpleNamespace(generate_content=self.service.generate_content)
+
+
+def install_fake_gemini(service, keys=3, cache_dir=None):
+    """Route every Gemini call in GemAnnote to service, over `keys` fake API keys"""
+    FakeKeyClient.service = service
+    GemAnnote.GeminiKeyClient = FakeKeyClient
+    GemAnnote.API_KEYS = [f"fake-key-{i + 1}" for i in range(keys)]
+    GemAnnote.key_pool = GemAnnote.KeyPool(GemAnnote.API_KEYS)
+    if cache_dir is not None:
+        GemAnnote.CACHE_DIR = Path(cache_dir)
+
+
+def percentile_line(values):
+    if not values:
+        return "n/a"
+    p50, p95 = np.percentile(values, [50, 95])
+    return f"p50 {p50:6.2f}s  p95 {p95:6.2f}s"
+
+
+def legacy_iter_frames(video_path):
+    """The original read-every-frame loop: decode all, keep every int(fps)-th"""
+    cap = cv2.VideoCapture(str(video_path))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_interval = int(fps) if fps > 0 else 30
+    frame_count = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame_count % frame_interval == 0:
+            yield frame_count / fps, frame
+        frame_count += 1
+    cap.release()
+
+
+def time_sampler(name, frames_iter, out_dir=None):
+    start = time.perf_counter()
+    timestamps = []
+    for i, (ts, frame) in enumerate(frames_iter):
+        timestamps.append(ts)
+        if out_dir is not None:
+            cv2.imwrite(str(Path(out_dir) / f"{name}_{i + 1}.png"), frame)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<10} {len(timestamps):>6} frames in {elapsed:7.2f}s "
+          f"({len(timestamps) / elapsed if elapsed else 0:7.1f} frames/s)")
+    return timestamps, elapsed
+
+
+def bench_extract(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(args.video) if args.video else None
+        if video is None:
+            video = make_synthetic_video(Path(tmp) / "synthetic.mp4", args.seconds, args.fps,
+                                         args.width, args.height)
+            print(f"Synthetic video: {args.seconds}s @ {args.fps} fps, {args.width}x{args.height}")
+        else:
+            print(f"Video: {video}")
+
+        out_dir = None
+        if args.write:
+            out_dir = Path(tmp) / "frames"
+            out_dir.mkdir()
+
+        print("Decode + sample" + (" + write PNG" if args.write else "") + ":")
+        legacy_ts, legacy_s = time_sampler("legacy", legacy_iter_frames(video), out_dir)
+        new_ts, new_s = time_sampler("sampled", GemAnnote.iter_sampled_frames(video), out_dir)
+
+        if new_s:
+            print(f"  speedup: {legacy_s / new_s:.2f}x")
+        # Drift of the int(fps) loop shows up as sample timestamps walking away from whole seconds
+        if legacy_ts:
+            drift = max(abs(ts - i) for i, ts in enumerate(legacy_ts))
+            print(f"  legacy max drift from 1 s grid: {drift:.3f}s")
+        if new_ts:
+            drift = max(abs(ts - i) for i, ts in enumerate(new_ts))
+            print(f"  sampled max drift from 1 s grid: {drift:.3f}s")
+
+
+def bench_encode(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(args.video) if args.video else make_synthetic_video(
+            Path(tmp) / "synthetic.mp4", args.seconds, args.fps, args.width, args.height)
+        frames = [frame for _, frame in GemAnnote.iter_sampled_frames(video)]
+        print(f"{len(frames)} sampled frames, {frames[0].shape[1]}x{frames[0].shape[0]}")
+
+        out_dir = Path(tmp) / "frames"
+        out_dir.mkdir()
+
+        def report(name, elapsed, ext):
+            size = sum(p.stat().st_size for p in out_dir.glob(f"*{ext}"))
+            print(f"  {name:<24} {elapsed:7.2f}s  {len(frames) / elapsed:7.1f} frames/s  "
+                  f"{size / len(frames) / 1024:8.1f} KiB/frame")
+            for p in out_dir.iterdir():
+                p.unlink()
+
+        start = time.perf_counter()
+        for i, frame in enumerate(frames):
+            cv2.imwrite(str(out_dir / f"f_{i + 1}.png"), frame)
+        report("PNG sync (original)", time.perf_counter() - start, ".png")
+
+        for image_format in GemAnnote.FRAME_FORMATS:
+            start = time.perf_counter()
+            with GemAnnote.FrameWriter(image_format, max_workers=args.workers) as writer:
+                for i, frame in enumerate(frames):
+                    writer.submit(frame, out_dir / f"f_{i + 1}{writer.extension}")
+            report(f"{image_format} pool x{writer.max_workers}", time.perf_counter() - start, writer.extension)
+
+
+def time_upload(path):
+    """Upload path on the least busy key and poll until ACTIVE; returns (upload_s, processing_s, state)"""
+    with GemAnnote.key_pool.lease(requests=0) as lease:
+        start = time.perf_counter()
+        remote = lease.client.upload_file(path)
+        uploaded = time.perf_counter()
+    while remote.state.name == "PROCESSING":
+        time.sleep(1)
+        remote = lease.client.get_file(remote.name)
+    active = time.perf_counter()
+    lease.client.delete_file(remote.name)
+    return uploaded - start, active - uploaded, remote.state.name
+
+
+def bench_upload(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(args.video) if args.video else make_synthetic_video(
+            Path(tmp) / "synthetic.mp4", args.seconds, args.fps, args.width, args.height)
+
+        start = time.perf_counter()
+        proxy = GemAnnote.make_proxy_video(video, proxy_dir=Path(tmp) / "proxies")
+        transcode_s = time.perf_counter() - start
+        candidates = [("original", video, 0.0)]
+        if proxy is None:
+            print(f"Original {video.stat().st_size / 1e6:.1f} MB, proxy transcode failed after {transcode_s:.1f}s; "
+                  f"timing the original only")
+        else:
+            print(f"Original {video.stat().st_size / 1e6:.1f} MB, proxy {proxy.stat().st_size / 1e6:.1f} MB "
+                  f"(transcode {transcode_s:.1f}s)")
+            candidates.append(("proxy", proxy, transcode_s))
+
+        print("Upload → ACTIVE (remote files are deleted after each run):")
+        for name, path, extra_s in candidates:
+            totals = []
+            for _ in range(args.runs):
+                upload_s, processing_s, state = time_upload(path)
+                totals.append(upload_s + processing_s)
+                print(f"  {name:<9} upload {upload_s:6.1f}s  processing {processing_s:6.1f}s  ({state})")
+            mean = sum(totals) / len(totals)
+            print(f"  {name:<9} mean {mean:6.1f}s" + (f" (+{extra_s:.1f}s transcode, once)" if extra_s else ""))
+
+
+def bench_inputs(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(args.video) if args.video else make_synthetic_video(
+            Path(tmp) / "synthetic.mp4", args.seconds, args.fps, args.width, args.height)
+        # A fresh cache dir so no uploaded video or cached response is reused
+        GemAnnote.CACHE_DIR = Path(tmp) / "cache"
+        entry = {"video_id": video.stem, "title": "Benchmark", "description": "Benchmark video", "label": "legit"}
+
+        print("Reasoning input end to end (frames are extracted once, up front):")
+        frames = GemAnnote.extract_frames_cached(video, Path(tmp) / "frames", video.stem)
+        for input_mode in GemAnnote.REASONING_INPUTS:
+            start = time.perf_counter()
+            draft = GemAnnote.build_draft(entry, video, Path(tmp) / "frames", use_cache=False, input_mode=input_mode)
+            elapsed = time.perf_counter() - start
+            print(f"  {input_mode:<14} {elapsed:7.1f}s  {len(frames)} frames  {draft['error'] or 'ok'}")
+            if draft["gemini_file"] is not None:
+                GemAnnote.cleanup_gemini_file(draft["gemini_file"].name, GemAnnote.key_pool.key_of(draft["gemini_file"]))
+        print(f"  per-stage timings: {GemAnnote.CACHE_DIR / GemAnnote.INPUT_TIMINGS_NAME}")
+        for line in (GemAnnote.CACHE_DIR / GemAnnote.INPUT_TIMINGS_NAME).read_text().splitlines():
+            print(f"    {line}")
+
+
+def synthetic_corpus(out_dir, count, lengths, fps_values, sizes, seed=0):
+    """Write `count` synthetic videos drawn from lengths × fps × sizes; returns [(path, spec)]"""
+    specs = list(itertools.product(lengths, fps_values, sizes))
+    random.Random(seed).shuffle(specs)
+    corpus = []
+    for i, (seconds, fps, (width, height)) in enumerate(itertools.islice(itertools.cycle(specs), count)):
+        # Distinct content per clip, so repeated specs aren't deduplicated as one upload
+        path = make_synthetic_video(Path(out_dir) / f"synthetic_{i + 1}.mp4", seconds, fps, width, height,
+                                    offset=i * 1000)
+        corpus.append((path, f"{seconds:g}s {fps:g}fps {width}x{height}"))
+    return corpus
+
+
+def bench_suite(args):
+    GemAnnote.logger.setLevel("WARNING")
+    service = FakeGemini(args.upload_latency, args.upload_mb_s, args.processing_delay, args.processing_per_mb,
+                         args.generate_latency, args.rate_429, args.rate_500, args.slow_rate, args.slow_latency,
+                         args.seed)
+    GemAnnote.KEY_COOLDOWN_S = args.cooldown
+    GemAnnote.HEDGE_REQUESTS = not args.no_hedge
+    if args.generate_timeout is not None:
+        GemAnnote.GENERATE_TIMEOUT_S = args.generate_timeout
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        install_fake_gemini(service, args.keys, cache_dir=tmp / "cache")
+        (tmp / "videos").mkdir()
+
+        start = time.perf_counter()
+        corpus = synthetic_corpus(tmp / "videos", args.videos, args.lengths, args.fps, args.sizes, args.seed)
+        print(f"{len(corpus)} synthetic videos written in {time.perf_counter() - start:.1f}s")
+
+        # Extraction: cold frame cache, one video at a time
+        print(f"\nExtraction ({args.sampling}, {args.format}, resize {args.resize}):")
+        frames_dir = tmp / "frames"
+        latencies, total_frames, total_video_s = [], 0, 0.0
+        for path, spec in corpus:
+            start = time.perf_counter()
+            frames = GemAnnote.extract_frames_cached(path, frames_dir, path.stem, args.format,
+                                                     sampling=args.sampling, resize=args.resize,
+                                                     resize_size=args.resize_size)
+            elapsed = time.perf_counter() - start
+            latencies.append(elapsed)
+            total_frames += len(frames)
+            cap = cv2.VideoCapture(str(path))
+            total_video_s += GemAnnote.probe_video(cap)[2] or 0.0
+            cap.release()
+            print(f"  {spec:<24} {len(frames):>4} frames  {elapsed:6.2f}s  {len(frames) / elapsed:7.1f} frames/s")
+        print(f"  total {total_frames} frames in {sum(latencies):.1f}s "
+              f"({total_frames / sum(latencies):.1f} frames/s, {total_video_s / sum(latencies):.1f}x realtime)  "
+              f"{percentile_line(latencies)}")
+        frame_bytes = sum(p.stat().st_size for p in frames_dir.glob("*/*") if p.name != "manifest.json")
+        print(f"  {frame_bytes / 1e6:.1f} MB of frames on disk ({frame_bytes / max(total_frames, 1) / 1e3:.1f} KB/frame)")
+
+        # Upload → PROCESSING → generate through the key pool, against the fake service
+        print(f"\nDrafts ({args.input} input, {args.workers} workers, {args.keys} keys, "
+              f"429 {args.rate_429:.0%} / 500 {args.rate_500:.0%}):")
+        GemAnnote.metrics = GemAnnote.Metrics()
+
+        def draft(item):
+            path, _ = item
+            entry = {"video_id": path.stem, "title": "Benchmark", "description": "Benchmark video",
+                     "label": "legit"}
+            start = time.perf_counter()
+            result = GemAnnote.build_draft(entry, path, frames_dir, image_format=args.format,
+                                           sampling=args.sampling, use_cache=False, input_mode=args.input,
+                                           resize=args.resize, resize_size=args.resize_size)
+            return time.perf_counter() - start, result["error"]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(draft, corpus))
+        wall = time.perf_counter() - start
+        failed = [error for _, error in results if error]
+        print(f"  {len(results) - len(failed)}/{len(results)} ok in {wall:.1f}s "
+              f"({len(results) / wall * 60:.1f} drafts/min)  {percentile_line([s for s, _ in results])}")
+        for error in sorted(set(failed)):
+            print(f"  failed: {failed.count(error)} × {error}")
+        for stage, p in GemAnnote.metrics.percentiles().items():
+            print(f"  {stage:<16} p50 {p['p50']:6.2f}s  p95 {p['p95']:6.2f}s  (n={p['count']})")
+        counters = GemAnnote.metrics.counters()
+        print("  pipeline: " + ", ".join(f"{event} {counters.get(event, 0)}"
+                                         for event in ("retries", "rate_limited", "api_errors", "key_switches",
+                                                       "hedges", "hedge_wins", "deadline_exceeded")))
+        print(f"  service:  injected 429 {service.injected['429']}, 500 {service.injected['500']}; calls "
+              + ", ".join(f"{op} {n}" for op, n in sorted(service.calls.items())))
+
+        # Save: journal appends, then one compaction into the output JSON
+        print(f"\nSave ({args.saves} entries):")
+        GemAnnote.metrics = GemAnnote.Metrics()
+        output = tmp / "training.json"
+        frame_files = GemAnnote.extract_frames_cached(corpus[0][0], frames_dir, corpus[0][0].stem, args.format,
+                                                      sampling=args.sampling, resize=args.resize,
+                                                      resize_size=args.resize_size)
+        start = time.perf_counter()
+        for i in range(args.saves):
+            # Same shape as the entries accept_and_save writes
+            sft_entry = {
+                "id": f"video_{i}",
+                "images": [Path(fp).name for fp in frame_files],
+                "conversations": [
+                    {"from": "human", "value": "Title: Benchmark\nDescription: Benchmark video"},
+                    {"from": "response", "value": GemAnnote.format_response("Fake reasoning.", "legit")},
+                ],
+            }
+            GemAnnote.save_training_data(output, sft_entry)
+        appends_s = time.perf_counter() - start
+        p = GemAnnote.metrics.percentiles()["save"]
+        print(f"  append   {args.saves / appends_s:8.1f} entries/s  p50 {p['p50'] * 1000:6.2f}ms  "
+              f"p95 {p['p95'] * 1000:6.2f}ms")
+        start = time.perf_counter()
+        count = GemAnnote.compact_training_data(output)
+        print(f"  compact  {count} entries in {time.perf_counter() - start:.2f}s "
+              f"({output.stat().st_size / 1e6:.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("extract", help="1 FPS frame sampling: legacy read loop vs grab/seek sampler")
+    p.add_argument("--video", help="Existing video to benchmark (default: synthetic)")
+    p.add_argument("--seconds", type=float, default=120)
+    p.add_argument("--fps", type=float, default=29.97)
+    p.add_argument("--width", type=int, default=1920)
+    p.add_argument("--height", type=int, default=1080)
+    p.add_argument("--write", action="store_true", help="Also encode the sampled frames to PNG")
+    p.set_defaults(func=bench_extract)
+
+    p = sub.add_parser("encode", help="Frame encode/write: synchronous PNG vs FrameWriter pool per format")
+    p.add_argument("--video", help="Existing video to benchmark (default: synthetic)")
+    p.add_argument("--seconds", type=float, default=60)
+    p.add_argument("--fps", type=float, default=30)
+    p.add_argument("--width", type=int, default=1920)
+    p.add_argument("--height", type=int, default=1080)
+    p.add_argument("--workers", type=int, default=None, help="Writer threads (default: CPU count)")
+    p.set_defaults(func=bench_encode)
+
+    p = sub.add_parser("upload", help="Gemini upload-to-ACTIVE time: original video vs low-res proxy")
+    p.add_argument("--video", help="Existing video to benchmark (default: synthetic)")
+    p.add_argument("--seconds", type=float, default=300)
+    p.add_argument("--fps", type=float, default=30)
+    p.add_argument("--width", type=int, default=1920)
+    p.add_argument("--height", type=int, default=1080)
+    p.add_argument("--runs", type=int, default=3, help="Uploads per variant")
+    p.set_defaults(func=bench_upload)
+
+    p = sub.add_parser("inputs", help="Reasoning from the video vs inline frames vs uploaded frames")
+    p.add_argument("--video", help="Existing video to benchmark (default: synthetic)")
+    p.add_argument("--seconds", type=float, default=60)
+    p.add_argument("--fps", type=float, default=30)
+    p.add_argument("--width", type=int, default=1280)
+    p.add_argument("--height", type=int, default=720)
+    p.set_defaults(func=bench_inputs)
+
+    def csv(cast):
+        return lambda text: [cast(v) for v in text.split(",")]
+
+    def size(text):
+        width, height = text.lower().split("x")
+        return int(width), int(height)
+
+    p = sub.add_parser("suite", help="Offline extraction / draft / save throughput against a fake Gemini")
+    p.add_argument("--videos", type=int, default=6, help="Synthetic videos to generate")
+    p.add_argument("--lengths", type=csv(float), default=[10, 30, 90], help="Video lengths in seconds (csv)")
+    p.add_argument("--fps", type=csv(float), default=[24, 29.97, 60], help="Frame rates (csv)")
+    p.add_argument("--sizes", type=csv(size), default=[(640, 360), (1280, 720), (1920, 1080)],
+                   help="Resolutions, WIDTHxHEIGHT (csv)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--sampling", choices=list(GemAnnote.SAMPLING_MODES), default=GemAnnote.DEFAULT_SAMPLING)
+    p.add_argument("--format", choices=list(GemAnnote.FRAME_FORMATS), default=GemAnnote.DEFAULT_FRAME_FORMAT)
+    p.add_argument("--resize", choices=list(GemAnnote.RESIZE_POLICIES), default=GemAnnote.DEFAULT_RESIZE)
+    p.add_argument("--resize-size", type=GemAnnote.parse_frame_size, default=GemAnnote.DEFAULT_RESIZE_SIZE)
+    p.add_argument("--input", choices=list(GemAnnote.REASONING_INPUTS), default=GemAnnote.DEFAULT_REASONING_INPUT)
+    p.add_argument("--keys", type=int, default=3, help="Fake API keys in the pool")
+    p.add_argument("--workers", type=int, default=3, help="Concurrent drafts")
+    p.add_argument("--upload-latency", type=float, default=0.3, help="Seconds per upload call")
+    p.add_argument("--upload-mb-s", type=float, default=50.0, help="Simulated upload bandwidth (MB/s)")
+    p.add_argument("--processing-delay", type=float, default=2.0, help="Seconds a file stays PROCESSING")
+    p.add_argument("--processing-per-mb", type=float, default=0.1, help="Extra PROCESSING seconds per MB")
+    p.add_argument("--generate-latency", type=float, default=1.0, help="Seconds per generate_content call")
+    p.add_argument("--rate-429", type=float, default=0.1, help="Fraction of calls failing with 429")
+    p.add_argument("--rate-500", type=float, default=0.05, help="Fraction of calls failing with 500")
+    p.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of generate calls that are slow")
+    p.add_argument("--slow-latency", type=float, default=30.0, help="Seconds a slow generate call takes")
+    p.add_argument("--generate-timeout", type=float, default=None,
+                   help=f"Per-request deadline (the app uses {GemAnnote.GENERATE_TIMEOUT_S:g}s)")
+    p.add_argument("--no-hedge", action="store_true", help="Disable hedged generate requests")
+    p.add_argument("--cooldown", type=float, default=2.0,
+                   help=f"Key cooldown after a 429 (the app uses {GemAnnote.KEY_COOLDOWN_S}s)")
+    p.add_argument("--saves", type=int, default=500, help="SFT entries to append")
+    p.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
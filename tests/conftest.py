@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+# Keep the module-level cache (metrics log, metadata indexes) out of the working tree
+os.environ.setdefault("GEMANNOTE_CACHE_DIR", tempfile.mkdtemp(prefix="gemannote-tests-"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def write_video(path, seconds=5, fps=10.0, size=(160, 120)):
+    """Write a small synthetic clip whose frames change every second"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    for i in range(int(seconds * fps)):
+        frame = np.full((size[1], size[0], 3), (int(i // fps) * 40) % 256, np.uint8)
+        cv2.putText(frame, str(i), (10, size[1] // 2), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+@pytest.fixture
+def video(tmp_path):
+    return write_video(tmp_path / "clip.mp4")
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch, tmp_path):
+    """Route GemAnnote's Gemini calls to benchmark.FakeGemini (fast latencies) over 2 keys, with a fresh cache dir"""
+    import benchmark
+    import GemAnnote
+    
+    for name in ("GeminiKeyClient", "API_KEYS", "key_pool", "CACHE_DIR"):
+        monkeypatch.setattr(GemAnnote, name, getattr(GemAnnote, name))
+    monkeypatch.setattr(benchmark.FakeKeyClient, "service", None)
+    service = benchmark.FakeGemini(upload_s=0.01, processing_s=0.0, generate_s=0.01)
+    benchmark.install_fake_gemini(service, keys=2, cache_dir=tmp_path / "cache")
+    return service
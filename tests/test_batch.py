@@ -0,0 +1,37 @@
+import json
+
+import GemAnnote
+from conftest import write_video
+
+
+def test_batch_keeps_remote_files_bounded(tmp_path, fake_gemini):
+    videos, metadata = tmp_path / "videos", tmp_path / "meta.json"
+    videos.mkdir()
+    for i in range(6):
+        write_video(videos / f"v{i}.mp4", seconds=2, size=(64 + 16 * i, 48))
+    metadata.write_text(json.dumps([{"video_id": f"v{i}", "label": "scam"} for i in range(6)]), encoding="utf-8")
+    
+    # A small reuse window, registered before the batch looks the cache up
+    cache_path = GemAnnote.CACHE_DIR / "remote_files.sqlite3"
+    GemAnnote.process_resource(f"remote_file_cache:{cache_path.resolve()}",
+                               lambda: GemAnnote.RemoteFileCache(cache_path, max_entries=2))
+    
+    live = []
+    upload = fake_gemini.upload_file
+    
+    def counting_upload(*args, **kwargs):
+        live.append(len(fake_gemini._files))
+        return upload(*args, **kwargs)
+    
+    fake_gemini.upload_file = counting_upload
+    
+    status = GemAnnote.run_cli([
+        "batch", "--videos", str(videos), "--metadata", str(metadata), "--frames", str(tmp_path / "frames"),
+        "--drafts", str(tmp_path / "drafts.jsonl"), "--workers", "1",
+    ])
+    assert status == 0
+    assert len(live) == 6
+    # Before each upload: the reuse window plus at most the previous draft's delete still in flight
+    assert max(live) <= 3
+    # At exit every delete has finished and only the reuse window is left
+    assert len(fake_gemini._files) == 2
@@ -0,0 +1,78 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import GemAnnote
+
+
+def pattern(seed, size=(160, 120)):
+    """A blocky random frame: its dHash survives resizing and video compression"""
+    blocks = np.random.default_rng(seed).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return cv2.resize(blocks, size, interpolation=cv2.INTER_NEAREST)
+
+
+def kept_timestamps(frames, **kwargs):
+    stats = {}
+    kept = [ts for ts, _ in GemAnnote.dedup_frames(enumerate(frames), stats=stats, **kwargs)]
+    return kept, stats
+
+
+def test_dhash_matches_identical_frames_only():
+    a, b = pattern(1), pattern(2)
+    hashes = GemAnnote.dhash_frames([a, a.copy(), b])
+    assert hashes.shape == (3, GemAnnote.FRAME_DEDUP_HASH_SIZE ** 2)
+    assert hashes.dtype == bool
+    assert np.count_nonzero(hashes[0] != hashes[1]) == 0
+    assert np.count_nonzero(hashes[0] != hashes[2]) > GemAnnote.FRAME_DEDUP_THRESHOLD
+
+
+def test_dedup_keeps_changes_across_batch_boundaries():
+    a, b, c = pattern(1), pattern(2), pattern(3)
+    # A runs past the first 32-frame batch; B starts exactly on the third batch
+    frames = [a] * 40 + [b] * 24 + [a] * 5 + [c]
+    kept, stats = kept_timestamps(frames, batch_size=32)
+    assert kept == [0, 40, 64, 69]
+    assert stats == {"sampled": 70, "kept": 4}
+    # The batch size only changes how hashes are computed, never the result
+    assert kept_timestamps(frames, batch_size=7)[0] == kept
+
+
+def test_dedup_compares_against_the_last_kept_frame():
+    a = pattern(1)
+    # Each frame drifts a little from the previous one; the drift adds up against the kept frame
+    frames = [a]
+    for i in range(1, 40):
+        frame = frames[-1].copy()
+        frame[(i % 6) * 20:(i % 6) * 20 + 20, ((i // 6) % 8) * 20:((i // 6) % 8) * 20 + 20] = (i * 37) % 256
+        frames.append(frame)
+    kept, stats = kept_timestamps(frames, threshold=GemAnnote.FRAME_DEDUP_THRESHOLD)
+    assert kept[0] == 0 and 1 < len(kept) < len(frames)
+    assert stats["sampled"] == len(frames) and stats["kept"] == len(kept)
+
+
+def test_threshold_zero_keeps_only_exact_changes():
+    a, b = pattern(1), pattern(2)
+    assert kept_timestamps([a, a, b, b, a], threshold=0)[0] == [0, 2, 4]
+
+
+def write_scene_video(path, scenes, fps=10.0, size=(160, 120)):
+    """One second per entry of scenes, each showing pattern(seed)"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    for seed in scenes:
+        for _ in range(int(fps)):
+            writer.write(pattern(seed, size))
+    writer.release()
+    return path
+
+
+def test_extraction_numbers_kept_frames_contiguously(tmp_path):
+    video = write_scene_video(tmp_path / "scenes.mp4", [1, 1, 1, 1, 2, 2, 2, 1, 1, 1])
+    frames = GemAnnote.extract_frames_cached(video, tmp_path / "frames", "clip",
+                                             dedup_threshold=GemAnnote.FRAME_DEDUP_THRESHOLD)
+    assert [os.path.basename(p) for p in frames] == ["clip_1.png", "clip_2.png", "clip_3.png"]
+    manifest = GemAnnote.read_frame_manifest(tmp_path / "frames" / "clip")
+    assert manifest["frames"] == ["clip_1.png", "clip_2.png", "clip_3.png"]
+    assert manifest["timestamps"] == pytest.approx([0.0, 4.0, 7.0])
+    assert manifest["sampled_frames"] == 10
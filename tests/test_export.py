@@ -0,0 +1,90 @@
+import json
+import tarfile
+
+import pytest
+
+import GemAnnote
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    frames_dir = tmp_path / "frames"
+    for video_id in ("a", "b", "c.1"):
+        (frames_dir / video_id / GemAnnote.THUMB_DIR_NAME).mkdir(parents=True)
+        for i in (1, 2):
+            (frames_dir / video_id / f"{video_id}_{i}.png").write_bytes(bytes(1000 * i))
+        (frames_dir / video_id / GemAnnote.THUMB_DIR_NAME / f"{video_id}_1.jpg").write_bytes(b"thumb")
+    return tmp_path / "out.json", frames_dir, tmp_path / "shards"
+
+
+def save(output, video_id, text="reasoning"):
+    GemAnnote.save_training_data(output, {
+        "id": video_id, "images": [f"{video_id}_1.png", f"{video_id}_2.png"],
+        "conversations": [{"from": "human", "value": "q"}, {"from": "response", "value": text}],
+    })
+
+
+def members(shard):
+    with tarfile.open(shard) as tar:
+        return tar.getnames()
+
+
+def test_export_writes_webdataset_samples(dataset):
+    output, frames_dir, dest = dataset
+    save(output, "a")
+    save(output, "c.1")
+    GemAnnote.compact_training_data(output)
+    summary = GemAnnote.export_dataset(output, frames_dir, dest, workers=2)
+    assert summary["samples"] == 2 and summary["shards"] == 1
+    assert members(dest / "shard-000000.tar") == [
+        "a.json", "a.0001.png", "a.0002.png", "c_1.json", "c_1.0001.png", "c_1.0002.png",
+    ]
+    with tarfile.open(dest / "shard-000000.tar") as tar:
+        assert json.load(tar.extractfile("c_1.json"))["id"] == "c.1"
+
+
+def test_rerun_only_appends_new_and_changed_samples(dataset):
+    output, frames_dir, dest = dataset
+    save(output, "a")
+    save(output, "b")
+    GemAnnote.export_dataset(output, frames_dir, dest, workers=2)
+    
+    assert GemAnnote.export_dataset(output, frames_dir, dest, workers=2)["shards"] == 0
+    
+    save(output, "a", "edited")
+    save(output, "c.1")
+    summary = GemAnnote.export_dataset(output, frames_dir, dest, workers=2)
+    assert summary["samples"] == 2 and summary["unchanged"] == 1
+    assert [m for m in members(dest / "shard-000001.tar") if m.endswith(".json")] == ["a.json", "c_1.json"]
+    index = GemAnnote.load_export_index(dest)
+    assert index["samples"]["a"]["shard"] == "shard-000001.tar"
+    assert index["stale"] == {"shard-000000.tar": ["a"]}
+
+
+def test_shards_are_size_bounded(dataset):
+    output, frames_dir, dest = dataset
+    for video_id in ("a", "b", "c.1"):
+        save(output, video_id)
+    summary = GemAnnote.export_dataset(output, frames_dir, dest, shard_bytes=6000, workers=2)
+    assert summary["shards"] == 3
+    assert sorted(shard["samples"] for shard in GemAnnote.load_export_index(dest)["shards"]) == [1, 1, 1]
+
+
+def test_missing_frames_are_skipped_and_retried(dataset):
+    output, frames_dir, dest = dataset
+    save(output, "a")
+    save(output, "missing")
+    summary = GemAnnote.export_dataset(output, frames_dir, dest, workers=2)
+    assert summary["missing"] == ["missing"] and summary["samples"] == 1
+    assert "missing" not in GemAnnote.load_export_index(dest)["samples"]
+
+
+def test_rebuild_replaces_every_shard(dataset):
+    output, frames_dir, dest = dataset
+    save(output, "a")
+    GemAnnote.export_dataset(output, frames_dir, dest, workers=2)
+    save(output, "b")
+    GemAnnote.export_dataset(output, frames_dir, dest, workers=2)
+    summary = GemAnnote.export_dataset(output, frames_dir, dest, workers=2, rebuild=True)
+    assert summary["total_shards"] == 1
+    assert sorted(p.name for p in dest.glob("*.tar")) == ["shard-000000.tar"]
@@ -0,0 +1,27 @@
+import json
+
+import GemAnnote
+from conftest import write_video
+
+
+def extract(tmp_path, *extra):
+    return GemAnnote.run_cli([
+        "extract", "--videos", str(tmp_path / "videos"), "--frames", str(tmp_path / "frames"),
+        "--workers", "1", *extra,
+    ])
+
+
+def test_annotated_videos_are_skipped_unless_forced(tmp_path):
+    (tmp_path / "videos").mkdir()
+    for video_id in ("v1", "v2", "v3"):
+        write_video(tmp_path / "videos" / f"{video_id}.mp4", seconds=2)
+    output = tmp_path / "out.json"
+    output.write_text(json.dumps([{"id": "v1"}]), encoding="utf-8")
+    # Accepted since the last compaction: only in the journal
+    GemAnnote.append_jsonl(GemAnnote.journal_path_for(output), {"id": "v2"})
+    
+    assert extract(tmp_path, "--output", str(output)) == 0
+    assert sorted(p.name for p in (tmp_path / "frames").iterdir()) == ["v3"]
+    
+    assert extract(tmp_path, "--output", str(output), "--force") == 0
+    assert sorted(p.name for p in (tmp_path / "frames").iterdir()) == ["v1", "v2", "v3"]
@@ -0,0 +1,36 @@
+import os
+import time
+
+import GemAnnote
+
+
+def test_second_call_reuses_the_cache(tmp_path, video):
+    frames = GemAnnote.extract_frames_cached(video, tmp_path / "frames", "clip")
+    assert len(frames) == 5
+    assert GemAnnote.read_frame_manifest(tmp_path / "frames" / "clip")["frames"] == [
+        os.path.basename(p) for p in frames
+    ]
+    mtimes = [os.stat(p).st_mtime_ns for p in frames]
+    assert GemAnnote.extract_frames_cached(video, tmp_path / "frames", "clip") == frames
+    assert [os.stat(p).st_mtime_ns for p in frames] == mtimes
+
+
+def test_changed_settings_re_extract(tmp_path, video):
+    png = GemAnnote.extract_frames_cached(video, tmp_path / "frames", "clip")
+    jpeg = GemAnnote.extract_frames_cached(video, tmp_path / "frames", "clip", image_format="JPEG")
+    assert all(p.endswith(".png") for p in png)
+    assert all(p.endswith(".jpg") for p in jpeg)
+
+
+def test_only_idle_temp_folders_are_removed(tmp_path, video):
+    frames_dir = tmp_path / "frames"
+    stale = frames_dir / ".clip.tmp-stale"
+    live = frames_dir / ".clip.tmp-live"
+    stale.mkdir(parents=True)
+    live.mkdir()
+    old = time.time() - GemAnnote.FRAME_TMP_STALE_S - 60
+    os.utime(stale, (old, old))
+    
+    assert GemAnnote.extract_frames_cached(video, frames_dir, "clip")
+    assert not stale.exists()
+    assert live.exists()
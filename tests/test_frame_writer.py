@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import GemAnnote
+
+
+def frame(value=0):
+    return np.full((24, 32, 3), value, np.uint8)
+
+
+@pytest.fixture
+def gated_imwrite(monkeypatch):
+    """cv2.imwrite that waits for the returned event before writing"""
+    gate = threading.Event()
+    imwrite = cv2.imwrite
+    
+    def write(path, image, params=None):
+        gate.wait(5)
+        return imwrite(path, image, params)
+    
+    monkeypatch.setattr(GemAnnote.cv2, "imwrite", write)
+    return gate
+
+
+def test_submit_blocks_once_max_pending_frames_are_queued(tmp_path, gated_imwrite):
+    submitted = []
+    
+    def produce(writer):
+        for i in range(4):
+            writer.submit(frame(i), tmp_path / f"f{i}.png")
+            submitted.append(i)
+    
+    with GemAnnote.FrameWriter(max_workers=1, max_pending=2) as writer:
+        producer = threading.Thread(target=produce, args=(writer,))
+        producer.start()
+        time.sleep(0.3)
+        # Two frames are queued or being written; the producer waits on the third
+        assert submitted == [0, 1]
+        gated_imwrite.set()
+        producer.join(5)
+    assert submitted == [0, 1, 2, 3]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["f0.png", "f1.png", "f2.png", "f3.png"]
+
+
+def test_an_error_in_the_block_drops_queued_writes(tmp_path, gated_imwrite):
+    threading.Timer(0.2, gated_imwrite.set).start()
+    with pytest.raises(KeyboardInterrupt):
+        with GemAnnote.FrameWriter(max_workers=1, max_pending=4) as writer:
+            for i in range(3):
+                writer.submit(frame(i), tmp_path / f"f{i}.png")
+            raise KeyboardInterrupt
+    # Only the write already running when the block failed finishes
+    assert [p.name for p in tmp_path.iterdir()] == ["f0.png"]
+
+
+@pytest.mark.parametrize("image_format, extension, quality, expected", [
+    ("PNG", ".png", None, 1),
+    ("PNG", ".png", 20, 9),
+    ("JPEG", ".jpg", None, 90),
+    ("JPEG", ".jpg", 0, 1),
+    ("WebP", ".webp", 75, 75),
+])
+def test_format_and_quality_settings(tmp_path, video, image_format, extension, quality, expected):
+    writer = GemAnnote.FrameWriter(image_format, quality=quality)
+    writer.close()
+    assert writer.extension == extension
+    assert writer.params == [GemAnnote.FRAME_FORMATS[image_format][1], expected]
+    
+    frames = GemAnnote.extract_frames_1fps(video, tmp_path, "clip", image_format=image_format, quality=quality)
+    assert [os.path.basename(p) for p in frames] == [f"clip_{i}{extension}" for i in range(1, 6)]
+    assert cv2.imread(frames[0]) is not None
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        GemAnnote.FrameWriter("GIF")
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions
+
+import GemAnnote
+
+
+@pytest.fixture
+def scripted(fake_gemini, monkeypatch):
+    """
+    generate_content on every fake key sleeps the next scripted latency (giving up at its
+    request timeout like the real client) and records which key it ran on
+    """
+    monkeypatch.setattr(GemAnnote, "metrics", GemAnnote.Metrics())
+    monkeypatch.setattr(GemAnnote, "HEDGE_MIN_DELAY_S", 0.0)
+    script = SimpleNamespace(latencies=[], keys=[])
+    lock = threading.Lock()
+    
+    def generate_content(key_index, contents, generation_config=None, request_options=None):
+        with lock:
+            latency = script.latencies.pop(0)
+            script.keys.append(key_index)
+        timeout = request_options["timeout"]
+        if latency > timeout:
+            time.sleep(timeout)
+            raise exceptions.DeadlineExceeded("504 Deadline exceeded (scripted)")
+        time.sleep(latency)
+        return SimpleNamespace(text=json.dumps({"reasoning": f"key {key_index}"}), usage_metadata=None)
+    
+    for key in GemAnnote.key_pool.keys:
+        key.client.model = SimpleNamespace(
+            generate_content=lambda *args, index=key.index, **kwargs: generate_content(index, *args, **kwargs)
+        )
+    return script
+
+
+def set_hedge_delay(seconds):
+    for _ in range(GemAnnote.HEDGE_MIN_SAMPLES):
+        GemAnnote.metrics.observe("generate", seconds)
+
+
+def wait_for_leases(timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while any(key.in_flight for key in GemAnnote.key_pool.keys) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def test_hedge_delay_follows_recent_p95(scripted):
+    assert GemAnnote.hedge_delay() == min(GemAnnote.HEDGE_INITIAL_DELAY_S, GemAnnote.GENERATE_TIMEOUT_S / 2)
+    for i in range(100):
+        GemAnnote.metrics.observe("generate", 0.01 * (i + 1))
+    assert GemAnnote.hedge_delay() == pytest.approx(0.9505)
+
+
+def test_hedge_fires_after_the_delay_and_the_faster_answer_wins(scripted):
+    set_hedge_delay(0.1)
+    scripted.latencies = [1.5, 0.05]
+    start = time.monotonic()
+    response = GemAnnote.generate_with_deadline(["prompt"], timeout=5, hedge=True)
+    elapsed = time.monotonic() - start
+    
+    assert json.loads(response.text)["reasoning"] == "key 1"
+    assert scripted.keys == [0, 1]
+    assert 0.1 <= elapsed < 1.0
+    counters = GemAnnote.metrics.counters()
+    assert counters["hedges"] == 1 and counters["hedge_wins"] == 1
+    
+    # The abandoned primary keeps its lease until it finishes, then gives it back
+    assert GemAnnote.key_pool.keys[0].in_flight == 1
+    wait_for_leases()
+    assert GemAnnote.key_pool.keys[0].in_flight == 0
+
+
+def test_no_hedge_when_the_first_answer_is_fast(scripted):
+    set_hedge_delay(0.5)
+    scripted.latencies = [0.05]
+    response = GemAnnote.generate_with_deadline(["prompt"], timeout=5, hedge=True)
+    assert json.loads(response.text)["reasoning"] == "key 0"
+    assert scripted.keys == [0]
+    assert "hedges" not in GemAnnote.metrics.counters()
+
+
+def test_hedge_only_with_immediate_quota(scripted):
+    set_hedge_delay(0.05)
+    # The other key is cooling down: waiting for it would defeat the hedge
+    GemAnnote.key_pool.keys[1].cooldown_until = time.monotonic() + 60
+    scripted.latencies = [0.4]
+    response = GemAnnote.generate_with_deadline(["prompt"], timeout=5, hedge=True)
+    assert json.loads(response.text)["reasoning"] == "key 0"
+    assert scripted.keys == [0]
+    assert GemAnnote.metrics.counters()["hedges_skipped"] == 1
+
+
+def test_uploaded_content_hedges_on_its_own_key(scripted):
+    set_hedge_delay(0.05)
+    scripted.latencies = [1.0, 0.05]
+    response = GemAnnote.generate_with_deadline(["prompt"], key_index=1, timeout=5, hedge=True)
+    assert json.loads(response.text)["reasoning"] == "key 1"
+    assert scripted.keys == [1, 1]
+    wait_for_leases()
+
+
+def test_deadline_exceeded_after_timeout(scripted):
+    scripted.latencies = [5.0]
+    start = time.monotonic()
+    with pytest.raises(exceptions.DeadlineExceeded):
+        GemAnnote.generate_with_deadline(["prompt"], timeout=0.3, hedge=False)
+    assert time.monotonic() - start < 1.0
+    assert GemAnnote.metrics.counters()["deadline_exceeded"] == 1
+    wait_for_leases()
+
+
+def test_reasoning_retries_after_a_deadline(scripted, monkeypatch):
+    monkeypatch.setattr(GemAnnote, "GENERATE_TIMEOUT_S", 0.3)
+    monkeypatch.setattr(GemAnnote, "HEDGE_REQUESTS", False)
+    scripted.latencies = [5.0, 0.01]
+    entry = {"video_id": "v", "title": "t", "description": "d", "label": "scam"}
+    frames = [{"mime_type": "image/jpeg", "data": b"\xff\xd8"}]
+    reasoning = GemAnnote.generate_reasoning_with_frames(entry, frames)
+    assert reasoning.startswith("key ")
+    counters = GemAnnote.metrics.counters()
+    assert counters["deadline_exceeded"] == 1 and counters["retries"] == 1
+    wait_for_leases()
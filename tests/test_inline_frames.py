@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+
+import GemAnnote
+
+
+def write_noise_frames(directory, count, size=(512, 384)):
+    """Frames of random noise: each encodes to a large, distinct JPEG"""
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = directory / f"clip_{i + 1}.jpg"
+        cv2.imwrite(str(path), rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8),
+                    [cv2.IMWRITE_JPEG_QUALITY, 95])
+        paths.append(path)
+    return paths
+
+
+def kept_indices(parts, all_parts):
+    index_of = {part["data"]: i for i, part in enumerate(all_parts)}
+    return [index_of[part["data"]] for part in parts]
+
+
+def assert_evenly_spaced(indices, count):
+    assert indices == sorted(set(np.linspace(0, count - 1, len(indices)).round().astype(int).tolist()))
+    assert indices[0] == 0 and indices[-1] == count - 1
+
+
+def test_parts_fit_in_the_budget_as_an_evenly_spaced_subset(tmp_path):
+    paths = write_noise_frames(tmp_path, 20)
+    everything = GemAnnote.inline_frame_parts(paths, budget_bytes=10**9)
+    assert len(everything) == 20
+    assert all(part["mime_type"] == "image/jpeg" for part in everything)
+    
+    budget = sum(len(part["data"]) for part in everything) // 3
+    parts = GemAnnote.inline_frame_parts(paths, budget_bytes=budget)
+    assert sum(len(part["data"]) for part in parts) <= budget
+    assert 1 < len(parts) < 20
+    assert_evenly_spaced(kept_indices(parts, everything), 20)
+
+
+def test_default_budget_trims_a_long_video(tmp_path):
+    paths = write_noise_frames(tmp_path, 160)
+    everything = GemAnnote.inline_frame_parts(paths, budget_bytes=10**9)
+    assert sum(len(part["data"]) for part in everything) > GemAnnote.INLINE_REQUEST_BYTES
+    parts = GemAnnote.inline_frame_parts(paths)
+    assert sum(len(part["data"]) for part in parts) <= GemAnnote.INLINE_REQUEST_BYTES
+    assert_evenly_spaced(kept_indices(parts, everything), 160)
+
+
+def test_frames_are_downscaled(tmp_path):
+    paths = write_noise_frames(tmp_path, 1, size=(1280, 720))
+    part = GemAnnote.inline_frame_parts(paths, max_side=256)[0]
+    image = cv2.imdecode(np.frombuffer(part["data"], np.uint8), cv2.IMREAD_COLOR)
+    assert max(image.shape[:2]) == 256
@@ -0,0 +1,49 @@
+import json
+
+import GemAnnote
+
+
+def entry(video_id, text="reasoning"):
+    return {"id": video_id, "images": [f"{video_id}_1.png"],
+            "conversations": [{"from": "human", "value": "q"}, {"from": "response", "value": text}]}
+
+
+def test_append_and_compact_round_trip(tmp_path):
+    output = tmp_path / "out.json"
+    for video_id in ("a", "b"):
+        assert GemAnnote.save_training_data(output, entry(video_id))
+    assert GemAnnote.load_existing_data(output) == {"a", "b"}
+    
+    assert GemAnnote.compact_training_data(output) == 2
+    assert [x["id"] for x in json.loads(output.read_text(encoding="utf-8"))] == ["a", "b"]
+    assert GemAnnote.journal_path_for(output).read_text(encoding="utf-8") == ""
+    
+    # A re-saved entry replaces the one already in the JSON
+    GemAnnote.save_training_data(output, entry("a", "edited"))
+    GemAnnote.save_training_data(output, entry("c"))
+    assert GemAnnote.compact_training_data(output) == 3
+    entries = list(GemAnnote.iter_json_array(output))
+    assert [x["id"] for x in entries] == ["b", "a", "c"]
+    assert entries[1]["conversations"][1]["value"] == "edited"
+
+
+def test_compact_with_empty_journal_returns_zero(tmp_path):
+    output = tmp_path / "out.json"
+    assert GemAnnote.compact_training_data(output) == 0
+    assert not output.exists()
+
+
+def test_torn_last_journal_line_is_ignored(tmp_path):
+    output = tmp_path / "out.json"
+    GemAnnote.save_training_data(output, entry("a"))
+    with open(GemAnnote.journal_path_for(output), "a", encoding="utf-8") as f:
+        f.write('{"id": "b", "ima')
+    assert GemAnnote.load_existing_data(output) == {"a"}
+    assert GemAnnote.compact_training_data(output) == 1
+
+
+def test_iter_json_array_streams_across_chunks(tmp_path):
+    path = tmp_path / "big.json"
+    items = [{"id": str(i), "text": "é" * 50} for i in range(200)]
+    path.write_text(json.dumps(items, indent=2, ensure_ascii=False), encoding="utf-8")
+    assert list(GemAnnote.iter_json_array(path, chunk_size=64)) == items
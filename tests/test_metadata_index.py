@@ -0,0 +1,77 @@
+import json
+
+import GemAnnote
+
+
+def write_metadata(path, records):
+    path.write_text(json.dumps(records), encoding="utf-8")
+    return path
+
+
+def test_records_without_video_id_are_skipped(tmp_path):
+    metadata = write_metadata(tmp_path / "meta.json", [
+        {"video_id": "a", "label": "scam", "title": "A"},
+        {"label": "legit", "title": "no id"},
+        {"video_id": "c", "label": "legit", "title": "C"},
+    ])
+    index = GemAnnote.open_metadata_index(metadata, {"a": "a.mp4", "c": "c.mp4"}, {"c"})
+    try:
+        assert index.count() == 2
+        rows = index.pending(limit=None)
+        assert [row[2] for row in rows] == ["a"]
+        assert GemAnnote.MetadataIndex.load_entry(rows[0])["title"] == "A"
+    finally:
+        index.close()
+
+
+def test_null_video_id_rows_are_never_flagged(tmp_path):
+    metadata = write_metadata(tmp_path / "meta.json", [{"video_id": "a", "label": "scam"}])
+    index = GemAnnote.MetadataIndex(metadata, db_path=tmp_path / "index.sqlite3")
+    try:
+        index.refresh()
+        # A row left by an index built before id-less records were skipped
+        with index._db:
+            index._db.execute("INSERT INTO entries (source, position, video_id, label, offset, length) "
+                              "VALUES ('old', 0, NULL, '', 0, 0)")
+        index.set_available_videos(["a"])
+        index.set_annotated([])
+        assert [row[2] for row in index.pending(limit=None)] == ["a"]
+    finally:
+        index.close()
+
+
+def test_refresh_rescans_only_changed_sources(tmp_path):
+    metadata = write_metadata(tmp_path / "meta.json", [{"video_id": "a"}])
+    index = GemAnnote.MetadataIndex(metadata, db_path=tmp_path / "index.sqlite3")
+    try:
+        assert index.refresh() == 1
+        assert index.refresh() == 0
+        write_metadata(metadata, [{"video_id": "a"}, {"video_id": "b"}])
+        assert index.refresh() == 1
+        assert index.count() == 2
+    finally:
+        index.close()
+
+
+def test_flags_are_per_instance(tmp_path):
+    metadata = write_metadata(tmp_path / "meta.json", [{"video_id": v} for v in "abc"])
+    db_path = tmp_path / "index.sqlite3"
+    first = GemAnnote.MetadataIndex(metadata, db_path=db_path)
+    second = GemAnnote.MetadataIndex(metadata, db_path=db_path)
+    try:
+        first.refresh()
+        second.refresh()
+        first.set_available_videos(["a", "b"])
+        first.set_annotated(["a"])
+        # Another caller (say a batch over another video folder) sets its own flags
+        second.set_available_videos(["c"])
+        second.set_annotated([])
+        second.mark_annotated("b")
+        assert [row[2] for row in first.pending(limit=None)] == ["b"]
+        assert [row[2] for row in second.pending(limit=None)] == ["c"]
+        first.mark_annotated("b")
+        assert first.pending(limit=None) == []
+        assert [row[2] for row in second.pending(limit=None)] == ["c"]
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,66 @@
+import importlib.util
+import threading
+
+import pytest
+
+import GemAnnote
+
+
+def test_worker_threads_get_the_same_instance():
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(GemAnnote.get_response_cache()))
+    thread.start()
+    thread.join()
+    assert seen == [GemAnnote.get_response_cache()]
+
+
+def test_resources_survive_a_rerun_of_the_script():
+    # `streamlit run` executes the file again as a fresh module on every rerun
+    spec = importlib.util.spec_from_file_location("GemAnnote_rerun", GemAnnote.__file__)
+    rerun = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(rerun)
+    assert rerun.metrics is GemAnnote.metrics
+    assert rerun.key_pool is GemAnnote.key_pool
+    assert rerun.get_remote_file_cache() is GemAnnote.get_remote_file_cache()
+
+
+def test_factory_runs_once_under_concurrent_first_use():
+    calls = []
+    
+    def factory():
+        calls.append(1)
+        return object()
+    
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(GemAnnote.process_resource("test:once", factory)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_clear_closes_and_rebuilds():
+    class Resource:
+        closed = False
+        
+        def close(self):
+            self.closed = True
+    
+    first = GemAnnote.process_resource("test:clear", Resource)
+    pool = GemAnnote.process_resource("test:clear-pool", lambda: GemAnnote.ThreadPoolExecutor(max_workers=1))
+    assert sorted(GemAnnote.clear_process_resources("test:clear")) == ["test:clear", "test:clear-pool"]
+    assert first.closed
+    with pytest.raises(RuntimeError):
+        pool.submit(print)
+    assert GemAnnote.process_resource("test:clear", Resource) is not first
+
+
+def test_cleared_caches_are_reopened():
+    cache = GemAnnote.get_response_cache()
+    GemAnnote.clear_process_resources("response_cache:")
+    reopened = GemAnnote.get_response_cache()
+    assert reopened is not cache
+    assert reopened.stats()["entries"] >= 0
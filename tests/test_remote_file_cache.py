@@ -0,0 +1,46 @@
+import json
+import time
+from types import SimpleNamespace
+
+import GemAnnote
+
+
+def remote(name):
+    return SimpleNamespace(name=name, expiration_time=None)
+
+
+def test_two_processes_share_one_index(tmp_path):
+    # Two instances on one database stand in for the UI and a batch process
+    ui = GemAnnote.RemoteFileCache(tmp_path / "remote_files.sqlite3")
+    batch = GemAnnote.RemoteFileCache(tmp_path / "remote_files.sqlite3")
+    ui.put("h1", remote("files/1"), 0)
+    batch.put("h2", remote("files/2"), 1)
+    assert ui.names() == batch.names() == {"files/1", "files/2"}
+    assert batch.lookup("h1")["name"] == "files/1"
+    ui.drop("h2")
+    assert batch.lookup("h2") is None
+
+
+def test_evict_expired_and_least_recently_used(tmp_path):
+    cache = GemAnnote.RemoteFileCache(tmp_path / "remote_files.sqlite3", max_entries=2)
+    for i in range(4):
+        cache.put(f"h{i}", remote(f"files/{i}"), 0)
+        time.sleep(0.01)
+    cache.lookup("h0")
+    evicted = cache.evict(keep={"h1"})
+    assert sorted(e["name"] for e in evicted) == ["files/2"]
+    assert cache.names() == {"files/0", "files/1", "files/3"}
+    
+    expired = GemAnnote.RemoteFileCache(tmp_path / "other.sqlite3", ttl_s=-1)
+    expired.put("h", remote("files/x"), 0)
+    assert expired.lookup("h") is None
+    assert [e["name"] for e in expired.evict()] == ["files/x"]
+
+
+def test_imports_the_old_json_index(tmp_path):
+    (tmp_path / "remote_files.json").write_text(json.dumps({
+        "h1": {"name": "files/1", "api_key_index": 2, "expires_at": time.time() + 60, "last_used": 0},
+    }), encoding="utf-8")
+    cache = GemAnnote.RemoteFileCache(tmp_path / "remote_files.sqlite3")
+    assert cache.lookup("h1")["api_key_index"] == 2
+    assert not (tmp_path / "remote_files.json").exists()
@@ -0,0 +1,53 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+import GemAnnote
+
+FRAME = np.zeros((1080, 1920, 3), np.uint8)
+
+
+@pytest.mark.parametrize("policy, size, shape", [
+    ("none", (448, 448), (1080, 1920, 3)),
+    ("max-side", (448, 448), (252, 448, 3)),
+    ("max-side", (4000, 4000), (1080, 1920, 3)),  # never enlarges
+    ("letterbox", (448, 448), (448, 448, 3)),
+    ("letterbox", (640, 360), (360, 640, 3)),
+    ("center-crop", (448, 448), (448, 448, 3)),
+    ("center-crop", (300, 600), (600, 300, 3)),
+])
+def test_output_shape(policy, size, shape):
+    assert GemAnnote.resize_frame(FRAME, policy, size).shape == shape
+
+
+def test_letterbox_pads_and_center_crop_keeps_the_middle():
+    frame = np.full((100, 200, 3), 255, np.uint8)
+    frame[:, :50] = 0  # dark left quarter
+    boxed = GemAnnote.resize_frame(frame, "letterbox", (100, 100))
+    assert boxed[:25].max() == 0 and boxed[75:].max() == 0  # padding bars
+    assert boxed[50, 60] == pytest.approx([255, 255, 255])
+    cropped = GemAnnote.resize_frame(frame, "center-crop", (100, 100))
+    assert cropped.min() == 255  # the dark quarter was cropped away
+    assert cropped.flags["C_CONTIGUOUS"]
+
+
+def test_parse_frame_size():
+    assert GemAnnote.parse_frame_size("448") == (448, 448)
+    assert GemAnnote.parse_frame_size("640x360") == (640, 360)
+    for text in ("0", "1x2x3", "wide"):
+        with pytest.raises(ValueError):
+            GemAnnote.parse_frame_size(text)
+
+
+def test_resize_is_recorded_in_the_manifest(tmp_path, video):
+    frames = GemAnnote.extract_frames_cached(video, tmp_path / "frames", "clip",
+                                             resize="letterbox", resize_size=(64, 64))
+    assert {cv2.imread(p).shape for p in frames} == {(64, 64, 3)}
+    manifest = json.loads((tmp_path / "frames" / "clip" / GemAnnote.FRAME_MANIFEST_NAME).read_text())
+    assert manifest["params"]["resize"] == {"policy": "letterbox", "size": [64, 64]}
+    
+    native = GemAnnote.extract_frames_cached(video, tmp_path / "frames", "clip")
+    assert {cv2.imread(p).shape for p in native} == {(120, 160, 3)}
+    assert "resize" not in GemAnnote.read_frame_manifest(tmp_path / "frames" / "clip")["params"]
@@ -0,0 +1,63 @@
+import time
+
+import GemAnnote
+
+ENTRY = {"video_id": "v", "title": "Free crypto", "description": "Send 1 BTC", "label": "scam"}
+FRAMES = [{"mime_type": "image/jpeg", "data": b"\xff\xd8"}]
+
+
+def test_evicts_least_recently_used_past_the_size_budget(tmp_path):
+    cache = GemAnnote.ResponseCache(tmp_path / "responses.sqlite3", max_bytes=250)
+    try:
+        for key in "abc":
+            cache.put(key, key * 100)
+            time.sleep(0.01)
+        # Two 100-byte responses fit; reading "a" makes "b" the least recently used
+        assert cache.get("a") is None
+        assert cache.get("b") == "b" * 100
+        time.sleep(0.01)
+        cache.put("d", "d" * 100)
+        assert cache.get("c") is None
+        assert cache.get("b") == "b" * 100
+        assert cache.get("d") == "d" * 100
+        stats = cache.stats()
+        assert stats["entries"] == 2 and stats["bytes"] == 200
+        assert (stats["hits"], stats["misses"]) == (3, 2)
+    finally:
+        cache.close()
+
+
+def test_a_response_larger_than_the_budget_is_not_kept(tmp_path):
+    cache = GemAnnote.ResponseCache(tmp_path / "responses.sqlite3", max_bytes=50)
+    try:
+        cache.put("big", "x" * 100)
+        assert cache.get("big") is None
+    finally:
+        cache.close()
+
+
+def test_key_covers_content_prompt_model_and_config(monkeypatch):
+    prompt = GemAnnote.build_reasoning_prompt(ENTRY)
+    key = GemAnnote.reasoning_cache_key("hash", prompt)
+    assert GemAnnote.reasoning_cache_key("hash", prompt) == key
+    assert GemAnnote.reasoning_cache_key("other", prompt) != key
+    assert GemAnnote.reasoning_cache_key("hash", GemAnnote.build_reasoning_prompt(ENTRY, "legit")) != key
+    assert GemAnnote.reasoning_cache_key("hash", GemAnnote.build_reasoning_prompt(dict(ENTRY, title="x"))) != key
+    monkeypatch.setattr(GemAnnote, "MODEL_NAME", "another-model")
+    assert GemAnnote.reasoning_cache_key("hash", prompt) != key
+    monkeypatch.undo()
+    config = dict(GemAnnote.REASONING_GENERATION_CONFIG, temperature=0.2)
+    monkeypatch.setattr(GemAnnote, "REASONING_GENERATION_CONFIG", config)
+    assert GemAnnote.reasoning_cache_key("hash", prompt) != key
+
+
+def test_generation_reuses_cached_responses_until_the_prompt_changes(fake_gemini):
+    first = GemAnnote.generate_reasoning_with_frames(ENTRY, FRAMES, content_hash="frames")
+    assert GemAnnote.generate_reasoning_with_frames(ENTRY, FRAMES, content_hash="frames") == first
+    assert fake_gemini.calls["generate_content"] == 1
+    # Another perspective is another prompt
+    GemAnnote.generate_reasoning_with_frames(ENTRY, FRAMES, override_label="legit", content_hash="frames")
+    assert fake_gemini.calls["generate_content"] == 2
+    # Regenerate skips the lookup
+    GemAnnote.generate_reasoning_with_frames(ENTRY, FRAMES, content_hash="frames", use_cache=False)
+    assert fake_gemini.calls["generate_content"] == 3
@@ -0,0 +1,39 @@
+import pytest
+
+import GemAnnote
+from conftest import write_video
+
+
+def sampled_timestamps(path, **kwargs):
+    return [round(ts, 2) for ts, _ in GemAnnote.iter_sampled_frames(path, **kwargs)]
+
+
+def test_one_frame_per_second(video):
+    assert sampled_timestamps(video) == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+@pytest.mark.parametrize("fps", [23.976, 29.97])
+def test_fractional_frame_rates_do_not_drift(tmp_path, fps):
+    path = write_video(tmp_path / "clip.mp4", seconds=20, fps=fps)
+    timestamps = sampled_timestamps(path)
+    assert len(timestamps) == 20
+    # Each sample is the first frame at or after its whole second
+    for second, ts in enumerate(timestamps):
+        assert second <= ts < second + 1.0 / fps + 1e-6
+
+
+def test_long_gaps_are_seeked(tmp_path):
+    path = write_video(tmp_path / "clip.mp4", seconds=25, fps=10.0)
+    assert sampled_timestamps(path, sample_fps=0.1) == [0.0, 10.0, 20.0]
+
+
+def test_explicit_timestamps(video):
+    assert sampled_timestamps(video, timestamps=[0.55, 2.0, 4.25]) == [0.6, 2.0, 4.3]
+
+
+def test_unreadable_video_raises(tmp_path):
+    path = tmp_path / "broken.mp4"
+    path.write_bytes(b"not a video")
+    with pytest.raises(IOError):
+        list(GemAnnote.iter_sampled_frames(path))
+
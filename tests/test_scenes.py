@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+import pytest
+
+import GemAnnote
+
+
+def write_scene_video(path, scenes, fps=10.0, size=(160, 120)):
+    """One second per entry of scenes; each seed shows its own blocky random frame"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    for seed in scenes:
+        blocks = np.random.default_rng(seed).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+        frame = cv2.resize(blocks, size, interpolation=cv2.INTER_NEAREST)
+        for _ in range(int(fps)):
+            writer.write(frame)
+    writer.release()
+    return path
+
+
+def test_scene_budget_is_shared_by_scene_length():
+    probe_ts = [i * 0.5 for i in range(20)]
+    diffs = np.zeros(20)
+    diffs[5] = diffs[15] = 0.5  # cuts at 2.5s and 7.5s
+    timestamps, cuts = GemAnnote.select_scene_timestamps(probe_ts, diffs, 10.0, budget=4)
+    assert cuts == [2.5, 7.5]
+    assert timestamps == [1.25, 3.75, 6.25, 8.75]
+    assert GemAnnote.select_scene_timestamps(probe_ts, diffs, 10.0, budget=2)[0] == [1.25, 5.0]
+
+
+def test_detect_scenes_finds_the_cuts(tmp_path):
+    video = write_scene_video(tmp_path / "scenes.mp4", [1, 1, 1, 2, 2, 3, 3, 3])
+    probe_ts, diffs, end_ts = GemAnnote.detect_scenes(video)
+    assert len(probe_ts) == len(diffs) == 16
+    assert end_ts == pytest.approx(8.0)
+    cuts = [ts for ts, diff in zip(probe_ts, diffs) if diff > GemAnnote.SCENE_CUT_THRESHOLD]
+    assert cuts == pytest.approx([3.0, 5.0])
+
+
+def test_scene_sampling_keeps_the_budget_and_records_the_cuts(tmp_path):
+    video = write_scene_video(tmp_path / "scenes.mp4", [1, 1, 1, 2, 2, 3, 3, 3])
+    frames = GemAnnote.extract_frames_cached(video, tmp_path / "frames", "clip", sampling="scenes", frame_budget=3)
+    assert len(frames) == 3
+    manifest = GemAnnote.read_frame_manifest(tmp_path / "frames" / "clip")
+    assert manifest["sampling"] == "scenes"
+    assert manifest["scene_cuts"] == pytest.approx([3.0, 5.0])
+    # One frame inside each scene
+    assert [int(ts >= 3.0) + int(ts >= 5.0) for ts in manifest["timestamps"]] == [0, 1, 2]
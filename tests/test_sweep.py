@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta, timezone
+
+import GemAnnote
+
+
+def add_remote_file(service, name, display_name, age_s):
+    service._files[name] = (0.0, display_name, datetime.now(timezone.utc) - timedelta(seconds=age_s))
+
+
+def test_startup_sweep_leaves_unreferenced_files(fake_gemini):
+    # An old upload no local cache entry references: it may be another machine's live file
+    add_remote_file(fake_gemini, "files/other-machine", f"{GemAnnote.REMOTE_FILE_TAG}v.mp4", age_s=2 * 3600)
+    swept = GemAnnote.sweep_remote_files(orphans=False)
+    assert sum(swept.values()) == 0
+    assert GemAnnote.get_remote_gc().drain()
+    assert "files/other-machine" in fake_gemini._files
+
+
+def test_sweep_command_deletes_old_orphans_only(fake_gemini):
+    tag = GemAnnote.REMOTE_FILE_TAG
+    add_remote_file(fake_gemini, "files/old", f"{tag}old.mp4", age_s=2 * 3600)
+    add_remote_file(fake_gemini, "files/young", f"{tag}young.mp4", age_s=60)
+    add_remote_file(fake_gemini, "files/foreign", "someone-else.mp4", age_s=2 * 3600)
+    assert GemAnnote.run_cli(["sweep", "--min-age-hours", "1"]) == 0
+    assert set(fake_gemini._files) == {"files/young", "files/foreign"}
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+import GemAnnote
+
+
+@pytest.fixture
+def listed(monkeypatch):
+    """Directories os.scandir is called on, in order"""
+    calls = []
+    scandir = os.scandir
+    
+    def counting_scandir(path):
+        calls.append(os.path.relpath(path))
+        return scandir(path)
+    
+    monkeypatch.setattr(GemAnnote.os, "scandir", counting_scandir)
+    return calls
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+    return path
+
+
+def settle(*dirs, mtime_s=1_000_000_000):
+    """Backdate directory mtimes so the scan trusts its listings"""
+    for directory in dirs:
+        os.utime(directory, (mtime_s, mtime_s))
+
+
+def test_first_path_in_sorted_order_wins_for_duplicate_stems(tmp_path):
+    root = tmp_path / "videos"
+    touch(root / "b" / "clip.mp4")
+    touch(root / "a" / "clip.mkv")
+    touch(root / "clip.mov")
+    touch(root / "other.avi")
+    videos, duplicates = GemAnnote.scan_video_tree(root, tmp_path / "index.json")
+    assert videos == {"clip": root / "clip.mov", "other": root / "other.avi"}
+    assert duplicates == {"clip": [root / "clip.mov", root / "a" / "clip.mkv", root / "b" / "clip.mp4"]}
+
+
+def test_extensions_match_in_any_case(tmp_path):
+    root = tmp_path / "videos"
+    for name in ("a.MP4", "b.Mov", "c.mkv", "d.txt", "e.mp4.part"):
+        touch(root / name)
+    videos, _ = GemAnnote.scan_video_tree(root, tmp_path / "index.json")
+    assert sorted(videos) == ["a", "b", "c"]
+
+
+def test_only_modified_directories_are_listed_again(tmp_path, listed, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / "videos"
+    touch(root / "a" / "one.mp4")
+    touch(root / "b" / "two.mp4")
+    settle(root / "a", root / "b", root)
+    index = tmp_path / "index.json"
+    
+    assert sorted(GemAnnote.scan_video_tree(root, index)[0]) == ["one", "two"]
+    assert sorted(listed) == ["videos", os.path.join("videos", "a"), os.path.join("videos", "b")]
+    listed.clear()
+    assert sorted(GemAnnote.scan_video_tree(root, index)[0]) == ["one", "two"]
+    assert listed == []
+    
+    # A file added between scans bumps only its own directory's mtime
+    touch(root / "b" / "three.mp4")
+    settle(root / "b", mtime_s=1_000_000_100)
+    assert sorted(GemAnnote.scan_video_tree(root, index)[0]) == ["one", "three", "two"]
+    assert listed == [os.path.join("videos", "b")]
+    listed.clear()
+    (root / "a" / "one.mp4").unlink()
+    settle(root / "a", mtime_s=1_000_000_200)
+    assert sorted(GemAnnote.scan_video_tree(root, index)[0]) == ["three", "two"]
+    assert listed == [os.path.join("videos", "a")]
+
+
+def test_recently_modified_directories_are_not_trusted(tmp_path, listed, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / "videos"
+    touch(root / "one.mp4")
+    index = tmp_path / "index.json"
+    GemAnnote.scan_video_tree(root, index)
+    # Modified within DIR_MTIME_SETTLE_NS: a change in the same mtime tick could go unseen, so list it again
+    listed.clear()
+    GemAnnote.scan_video_tree(root, index)
+    assert listed == ["videos"]
@@ -0,0 +1,65 @@
+import json
+
+import GemAnnote
+
+
+def open_queue(tmp_path, ttl_s=GemAnnote.LEASE_TTL_S):
+    return GemAnnote.WorkQueue(tmp_path / "out.queue.sqlite3", ttl_s=ttl_s)
+
+
+def test_live_lease_blocks_other_holders(tmp_path):
+    queue = open_queue(tmp_path)
+    try:
+        assert queue.claim("v1", "alice@x", "alice")
+        assert not queue.claim("v1", "bob@x", "bob")
+        assert queue.unavailable_ids("bob@x") == {"v1"}
+        assert queue.unavailable_ids("alice@x") == set()
+        queue.release("v1", "alice@x")
+        assert queue.claim("v1", "bob@x", "bob")
+    finally:
+        queue.close()
+
+
+def test_same_holder_reclaims_after_restart(tmp_path):
+    queue = open_queue(tmp_path)
+    assert queue.claim("v1", "alice@x", "alice")
+    queue.close()
+    # A new session (reload or restart) of the same annotator on this machine
+    queue = open_queue(tmp_path)
+    try:
+        assert queue.claim("v1", "alice@x", "alice")
+        assert not queue.claim("v1", "bob@x", "bob")
+    finally:
+        queue.close()
+
+
+def test_expired_lease_goes_back_to_the_pool(tmp_path):
+    queue = open_queue(tmp_path, ttl_s=-1)
+    try:
+        assert queue.claim("v1", "alice@x", "alice")
+        assert queue.claim("v1", "bob@x", "bob")
+    finally:
+        queue.close()
+
+
+def test_complete_saves_once(tmp_path):
+    output = tmp_path / "out.json"
+    queue = open_queue(tmp_path)
+    try:
+        entry = {"id": "v1", "images": [], "conversations": []}
+        assert queue.complete("v1", "alice@x", "alice", output, entry) == "saved"
+        assert queue.complete("v1", "bob@x", "bob", output, entry) == "duplicate"
+        assert not queue.claim("v1", "bob@x", "bob")
+        assert queue.completed_by("v1") == "alice"
+        lines = GemAnnote.journal_path_for(output).read_text(encoding="utf-8").splitlines()
+        assert [json.loads(line)["id"] for line in lines] == ["v1"]
+    finally:
+        queue.close()
+
+
+def test_lease_holder_is_stable_per_annotator(monkeypatch, tmp_path):
+    monkeypatch.setattr(GemAnnote, "CACHE_DIR", tmp_path)
+    holder = GemAnnote.lease_holder_for("alice")
+    assert holder == GemAnnote.lease_holder_for("alice")
+    assert holder.startswith("alice@")
+    assert GemAnnote.lease_holder_for("bob") != holder